@@ -22,6 +22,7 @@ class AsyncBrowserContextManager:
         # Use weak references for better memory management
         self._browsers: Dict[str, weakref.ref] = {}
         self._active_contexts: Dict[str, int] = {}
+        self._crawler_users: Dict[str, int] = {}  # Số coroutine đang dùng mỗi Crawl4AI crawler trong pool (per worker_key)
         self._request_counts: Dict[str, int] = {}
         self._last_restart: Dict[str, float] = {}
         self._memory_usage: Dict[str, float] = {}
@@ -64,7 +65,7 @@ class AsyncBrowserContextManager:
         # Process isolation settings
         self._worker_browser_pool = {}  # Separate browser pool per worker
         self._worker_memory_tracker = {}  # Memory tracking per worker
-        self._restart_suspended: Dict[str, bool] = {}  # Suspend restarts per worker
+        self._restart_suspended: Dict[str, int] = {}  # Số caller đang suspend restarts (per worker)
         
         # Browser persistence tracking
         self._browser_last_activity = {}  # Track last activity time
@@ -79,6 +80,8 @@ class AsyncBrowserContextManager:
         self._process = psutil.Process()
         self._last_memory_check = 0.0
         self._memory_cache_ttl = 2.0  # Cache memory check for 2 seconds
+        self._last_gc_rss_mb = 0.0  # Current RSS right after the last forced collection
+        self._gc_rss_growth_mb = 100  # Chỉ gc.collect khi RSS hiện tại tăng hơn mức này
         
         if logger.isEnabledFor(logging.DEBUG):
             logger.debug(f"AsyncBrowserContextManager initialized for worker {self._worker_id} (PID: {self._process_id})")
@@ -126,11 +129,16 @@ class AsyncBrowserContextManager:
             return False
     
     async def _force_garbage_collection(self):
-        """Force garbage collection to free memory"""
+        """Force garbage collection to free memory (skipped unless current RSS grew since the last one)"""
         try:
+            # Current RSS (not ru_maxrss: peak never goes down, so the gate would stay shut)
+            rss_mb = self._process.memory_info().rss / 1048576
+            if rss_mb - self._last_gc_rss_mb <= self._gc_rss_growth_mb:
+                return
             gc.collect()
-            await asyncio.sleep(0.1)  # Allow GC to complete
-            logger.debug(f"Garbage collection completed for worker {self._worker_id}")
+            # Baseline = RSS sau khi collect, để lần sau so với mức đã giải phóng
+            self._last_gc_rss_mb = self._process.memory_info().rss / 1048576
+            logger.debug(f"Garbage collection completed for worker {self._worker_id} (RSS {rss_mb:.1f}MB -> {self._last_gc_rss_mb:.1f}MB)")
         except Exception as e:
             logger.warning(f"Garbage collection failed: {e}")
     
@@ -352,14 +360,18 @@ class AsyncBrowserContextManager:
 
     # Public API to control restart policy around critical batches
     async def suspend_restarts(self):
-        """Prevent automatic restarts for this worker until resumed."""
-        self._restart_suspended[self._worker_id] = True
+        """Prevent automatic restarts for this worker until resumed (nested calls are counted)."""
+        self._restart_suspended[self._worker_id] = self._restart_suspended.get(self._worker_id, 0) + 1
         logger.info(f"Browser restarts suspended for worker {self._worker_id}")
 
     async def resume_restarts(self):
-        """Allow automatic restarts again for this worker."""
-        self._restart_suspended[self._worker_id] = False
-        logger.info(f"Browser restarts resumed for worker {self._worker_id}")
+        """Allow automatic restarts again once every suspend_restarts() caller has resumed."""
+        remaining = max(0, self._restart_suspended.get(self._worker_id, 0) - 1)
+        self._restart_suspended[self._worker_id] = remaining
+        if remaining:
+            logger.info(f"Browser restarts still suspended for worker {self._worker_id} ({remaining} callers)")
+        else:
+            logger.info(f"Browser restarts resumed for worker {self._worker_id}")
     
     async def get_browser_status(self, crawler_id: str = None):
         """Get browser status information"""
@@ -369,7 +381,7 @@ class AsyncBrowserContextManager:
             "worker_id": self._worker_id,
             "browser_persistence_enabled": self._browser_persistence_enabled,
             "total_browsers": len(self._worker_browser_pool),
-            "restart_suspended": self._restart_suspended.get(self._worker_id, False),
+            "restart_suspended": bool(self._restart_suspended.get(self._worker_id, 0)),
             "browsers": {}
         }
         
@@ -524,44 +536,36 @@ class AsyncBrowserContextManager:
     
     @asynccontextmanager
     async def get_crawl4ai_crawler(self, crawler_id: str, user_agent: str, viewport: dict = None):
-        """Enhanced Crawl4AI crawler with process isolation and memory monitoring"""
+        """
+        Pooled Crawl4AI crawler (one per worker_key), shared by concurrent coroutines.
+        The lock only covers get/create: arun() calls of different callers overlap.
+        The crawler stays open after use; it is closed by cleanup()/restart.
+        """
+        worker_key = f"{self._worker_id}_{crawler_id}"
         crawler = None
         
         try:
             async with self._lock:
-                # Check worker memory pressure
-                if await self._check_memory_pressure():
+                # Memory pressure: restart chỉ khi không crawler nào đang được dùng (tránh đóng browser giữa arun của caller khác)
+                if not any(self._crawler_users.values()) and await self._check_memory_pressure():
                     logger.warning(f"Memory pressure detected, forcing browser restart for worker {self._worker_id}")
                     await self._restart_all_worker_browsers()
                 
                 # Get or create crawler with process isolation
                 crawler = await self._get_or_create_crawl4ai_crawler(crawler_id, user_agent, viewport)
+                self._crawler_users[worker_key] = self._crawler_users.get(worker_key, 0) + 1
                 
-                logger.debug(f"Created Crawl4AI crawler for worker {self._worker_id}")
-                
-                yield crawler
+                logger.debug(f"Acquired Crawl4AI crawler for worker {self._worker_id} ({self._crawler_users[worker_key]} users)")
+            
+            yield crawler
                 
         except Exception as e:
             logger.error(f"Error in Crawl4AI crawler for worker {self._worker_id}: {e}")
             raise
         finally:
-            # Cleanup crawler with better error handling
-            if crawler:
-                try:
-                    # Check if crawler browser is still valid before closing
-                    if hasattr(crawler, 'browser') and crawler.browser:
-                        if hasattr(crawler.browser, '_connection') and crawler.browser._connection:
-                            await crawler.close()
-                        else:
-                            logger.debug(f"Crawler browser already closed for worker {self._worker_id}")
-                    else:
-                        logger.debug(f"Crawler already closed for worker {self._worker_id}")
-                except Exception as e:
-                    error_msg = str(e)
-                    if "Failed to find context" in error_msg or "Target.disposeBrowserContext" in error_msg or "has been closed" in error_msg:
-                        logger.debug(f"Crawler already disposed for worker {self._worker_id}: {e}")
-                    else:
-                        logger.warning(f"Error closing Crawl4AI crawler for worker {self._worker_id}: {e}")
+            # Release (không close): crawler dùng chung trong pool, caller khác có thể đang arun
+            if crawler is not None:
+                self._crawler_users[worker_key] = max(0, self._crawler_users.get(worker_key, 0) - 1)
     
     async def _get_or_create_crawl4ai_crawler(self, crawler_id: str, user_agent: str, viewport: dict = None):
         """Get or create Crawl4AI crawler with process isolation"""
@@ -642,6 +646,50 @@ class AsyncBrowserContextManager:
             logger.error(f"Failed to create Crawl4AI crawler for worker {self._worker_id}: {e}")
             raise
     
+    async def _release_crawler_pages(self, crawler) -> int:
+        """Close sessions and cached contexts (their pages go with them) of a Crawl4AI crawler; browser process kept"""
+        browser_manager = getattr(getattr(crawler, "crawler_strategy", None), "browser_manager", None)
+        if browser_manager is None:
+            return 0  # Playwright browser / crawler chưa start: không có gì để đóng
+        
+        released = 0
+        # Named sessions giữ page + context mở giữa các arun
+        for session_id in list(getattr(browser_manager, "sessions", {})):
+            await browser_manager.kill_session(session_id)
+            released += 1
+        
+        # Contexts cache theo config (cookies, cache, service workers tích lũy qua mỗi trang)
+        contexts = getattr(browser_manager, "contexts_by_config", None)
+        if contexts:
+            for context in list(contexts.values()):
+                try:
+                    await context.close()
+                    released += 1
+                except Exception as e:
+                    logger.debug(f"Context already closed for worker {self._worker_id}: {e}")
+            contexts.clear()
+        return released
+    
+    async def recycle_contexts(self):
+        """Light cleanup: close pages/contexts of idle pooled crawlers, keep browsers and request counts"""
+        try:
+            released = 0
+            # Lock: không caller nào acquire crawler trong lúc đang đóng contexts của nó
+            async with self._lock:
+                worker_keys = [key for key in self._worker_browser_pool.keys() if key.startswith(self._worker_id)]
+                for key in worker_keys:
+                    if self._crawler_users.get(key, 0):
+                        continue  # Đang arun: contexts của nó đang được dùng
+                    released += await self._release_crawler_pages(self._worker_browser_pool[key])
+            
+            # _request_counts giữ nguyên: bộ đếm restart-sau-N-requests vẫn tiếp tục
+            await self._force_garbage_collection()
+            
+            logger.info(f"Recycled {released} contexts/sessions for worker {self._worker_id} (browsers kept)")
+            
+        except Exception as e:
+            logger.warning(f"Error during context recycle for worker {self._worker_id}: {e}")
+    
     async def cleanup(self):
         """Cleanup all resources for current worker"""
         try:
@@ -51,6 +51,10 @@ class BaseCrawler:
 
     # Removed _get_crawl4ai_crawler() - now using context_manager.get_crawl4ai_crawler() directly
 
+    async def recycle_context(self):
+        """Close idle pages/contexts without closing the browser (no Chromium cold start)"""
+        await self.context_manager.recycle_contexts()
+    
     async def cleanup(self):
         """Cleanup all browser resources using Async Context Manager"""
         # Use Async Context Manager to cleanup all resources
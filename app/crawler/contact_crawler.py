@@ -10,9 +10,9 @@ import logging
 logger = logging.getLogger(__name__)
 
 class ContactCrawler(BaseCrawler):
-    def __init__(self, config: CrawlerConfig = None):
+    def __init__(self, config: CrawlerConfig = None, db_manager: DatabaseManager = None):
         super().__init__(config)
-        self.db_manager = DatabaseManager()
+        self.db_manager = db_manager or DatabaseManager()
         self.max_requests_per_browser = 100  # Override for ContactCrawler - balance memory vs stability
 
     async def crawl_contact_page(self, url: str, company_name: str, url_type: str = 'website') -> bool:
@@ -411,7 +411,8 @@ class ContactCrawler(BaseCrawler):
         failed = 0
         results = []
         
-        for company in companies:
+        async def crawl_company(company: Dict[str, Any]) -> None:
+            nonlocal successful, failed
             company_name = company.get('company_name', '')
             website = company.get('website', '')
             facebook = company.get('facebook', '')
@@ -459,6 +460,35 @@ class ContactCrawler(BaseCrawler):
                         'status': 'failed'
                     })
         
+        # Producer/consumer: bounded queue feeds N consumers; page loads overlap because the
+        # pooled crawl4ai crawler is only locked while being acquired (see get_crawl4ai_crawler)
+        processing = self.config.processing_config
+        concurrency = max(1, int(processing.get("contact_fetch_concurrency", processing.get("max_concurrent_pages", 1))))
+        queue: asyncio.Queue = asyncio.Queue(maxsize=2 * concurrency)
+        
+        async def consumer() -> None:
+            nonlocal failed
+            while True:
+                company = await queue.get()
+                try:
+                    await crawl_company(company)
+                except Exception as e:
+                    # Keep the consumer alive so the queue always drains
+                    logger.error(f"Failed to crawl contact pages for {company.get('company_name', '')}: {e}")
+                    failed += 1
+                finally:
+                    queue.task_done()
+        
+        workers = [asyncio.create_task(consumer()) for _ in range(concurrency)]
+        try:
+            for company in companies:
+                await queue.put(company)
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        
         return {
             'status': 'completed',
             'total': len(companies),
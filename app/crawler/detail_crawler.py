@@ -9,9 +9,9 @@ import logging
 logger = logging.getLogger(__name__)
 
 class DetailCrawler(BaseCrawler):
-    def __init__(self, config: CrawlerConfig = None):
+    def __init__(self, config: CrawlerConfig = None, db_manager: DatabaseManager = None):
         super().__init__(config)
-        self.db_manager = DatabaseManager()
+        self.db_manager = db_manager or DatabaseManager()
         self.max_requests_per_browser = 100  # Override for DetailCrawler - balance memory vs stability
         
     # Removed _get_crawler() - now using context_manager.get_crawl4ai_crawler() directly
@@ -99,7 +99,12 @@ class DetailCrawler(BaseCrawler):
             'details': []
         }
         
-        for company in new_companies:
+        # Crawl song song, giới hạn bởi semaphore (mặc định theo max_concurrent_pages)
+        processing = self.config.processing_config
+        concurrency = processing.get("detail_fetch_concurrency", processing.get("max_concurrent_pages", 1))
+        semaphore = asyncio.Semaphore(max(1, int(concurrency)))
+        
+        async def crawl_one(company) -> None:
             # Support both dict and plain URL string
             if isinstance(company, str):
                 company_url = company
@@ -114,19 +119,22 @@ class DetailCrawler(BaseCrawler):
                 company_url = ''
                 industry = None
             
-            if company_url:
-                success = await self.crawl_detail_page(company_url, company_name, industry)
-                if success:
-                    results['successful'] += 1
-                else:
-                    results['failed'] += 1
-                results['details'].append({
-                    'company': company_name,
-                    'url': company_url,
-                    'success': success
-                })
-            
-            # Delay between requests
-            await asyncio.sleep(random.uniform(1, 3))
+            async with semaphore:
+                if company_url:
+                    success = await self.crawl_detail_page(company_url, company_name, industry)
+                    if success:
+                        results['successful'] += 1
+                    else:
+                        results['failed'] += 1
+                    results['details'].append({
+                        'company': company_name,
+                        'url': company_url,
+                        'success': success
+                    })
+                
+                # Delay between requests
+                await asyncio.sleep(random.uniform(1, 3))
+        
+        await asyncio.gather(*(crawl_one(company) for company in new_companies))
         
-        return results
\ No newline at end of file
+        return results
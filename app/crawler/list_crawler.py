@@ -257,11 +257,9 @@ class ListCrawler(BaseCrawler):
                 
                 if retry < max_retries - 1:
                     # Random uniform delay với progressive increase
-                    import random
+                    # base_delay ± 30% jitter
                     base_delay = (retry + 1) * retry_delay
-                    min_delay = base_delay * 0.7
-                    max_delay = base_delay * 1.3
-                    wait_time = random.uniform(min_delay, max_delay)
+                    wait_time = base_delay * (0.7 + 0.6 * random.random())
                     logger.info(f"Retrying in {wait_time:.1f} seconds...")
                     await asyncio.sleep(wait_time)
                 else:
@@ -475,11 +473,9 @@ class ListCrawler(BaseCrawler):
                     msg = str(e)
                     if attempt < max_attempts - 1 and ("TargetClosedError" in msg or "has been closed" in msg or "Timeout" in msg):
                         # Random uniform delay với progressive increase
-                        import random
+                        # base_delay ± 20% jitter
                         base_delay = 1.0 * (attempt + 1)
-                        min_delay = base_delay * 0.8
-                        max_delay = base_delay * 1.2
-                        await asyncio.sleep(random.uniform(min_delay, max_delay))
+                        await asyncio.sleep(base_delay * (0.8 + 0.4 * random.random()))
                         continue
                     return []
 
@@ -497,6 +493,7 @@ class ListCrawler(BaseCrawler):
 
         # Suspend auto restarts trong batch để không đóng browser khi đang chạy
         await self.context_manager.suspend_restarts()
+        tasks = []
         try:
             # 1) Chạy batch đầu theo tổng trang ước lượng
             tasks = [asyncio.create_task(worker(u)) for u in page_urls]
@@ -524,6 +521,13 @@ class ListCrawler(BaseCrawler):
                     logger.info(f"Extended scan p{current_page}, unique: {len(uniq)} | empty_streak: {consecutive_empty}")
                 current_page += 1
         finally:
+            # Bị cancel/timeout giữa chừng: cancel và await các page task còn lại
+            # (không để task pending bị GC khi hàm thoát)
+            leftover = [t for t in tasks if not t.done()]
+            for t in leftover:
+                t.cancel()
+            if leftover:
+                await asyncio.gather(*leftover, return_exceptions=True)
             await self.context_manager.resume_restarts()
 
         import gc
@@ -1,6 +1,7 @@
 import sqlite3
 import json
 import time
+import threading
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 import logging
@@ -13,19 +14,33 @@ logger = logging.getLogger(__name__)
 class DatabaseManager:
     def __init__(self, db_path: str = "data/crawler.db"):
         self.db_path = db_path
+        self._local = threading.local()  # One connection per thread, reused across calls
         self.init_database()
     
     def get_connection(self) -> sqlite3.Connection:
-        """Return SQLite connection with WAL and busy timeout to reduce locks."""
-        conn = sqlite3.connect(self.db_path, timeout=60, check_same_thread=False)
-        try:
-            conn.execute("PRAGMA journal_mode=WAL;")
-            conn.execute("PRAGMA synchronous=NORMAL;")
-            conn.execute("PRAGMA busy_timeout=30000;")  # Tăng từ 5s lên 30s
-            conn.execute("PRAGMA cache_size=10000;")    # Tăng cache size
-            conn.execute("PRAGMA temp_store=MEMORY;")   # Temp tables in memory
-        except Exception:
-            pass
+        """Return this thread's SQLite connection with WAL and busy timeout to reduce locks.
+        
+        Opened (and PRAGMAs applied) once per thread and shared by every caller on that thread:
+        - set row_factory on the cursor, never on the connection;
+        - `with conn:` commits/rolls back the connection's transaction, so do not call another
+          DatabaseManager method while holding an open transaction (it would commit it early).
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=60, check_same_thread=False)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL;")
+                conn.execute("PRAGMA synchronous=NORMAL;")
+                conn.execute("PRAGMA busy_timeout=30000;")  # Tăng từ 5s lên 30s
+                conn.execute("PRAGMA cache_size=10000;")    # Tăng cache size
+                conn.execute("PRAGMA temp_store=MEMORY;")   # Temp tables in memory
+                conn.execute("PRAGMA mmap_size=268435456;") # 256 MiB mmap-read: page cache của OS, dùng chung giữa connections
+            except Exception:
+                pass
+            self._local.conn = conn
+        elif conn.in_transaction:
+            # Nested use: the caller's `with conn:` block would commit this thread's open transaction
+            logger.warning("get_connection() called while this thread's connection has an open transaction")
         return conn
     
     def init_database(self):
@@ -109,23 +124,22 @@ class DatabaseManager:
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
+                # URL trùng -> DO NOTHING (không raise IntegrityError + rollback như trước)
                 cursor.execute("""
                     INSERT INTO detail_html_storage (company_name, company_url, industry, html_content, status)
                     VALUES (?, ?, ?, ?, 'pending')
+                    ON CONFLICT DO NOTHING
                 """, (company_name, company_url, industry, html_content))
-                record_id = cursor.lastrowid
-                conn.commit()
-                return record_id
-        except sqlite3.IntegrityError as e:
-            if "UNIQUE constraint failed" in str(e):
+                if cursor.rowcount:
+                    record_id = cursor.lastrowid
+                    conn.commit()
+                    return record_id
+                
                 logger.info(f"URL already exists, skipping: {company_url}")
                 # Return existing record ID
-                cursor = conn.cursor()
                 cursor.execute("SELECT id FROM detail_html_storage WHERE company_url = ?", (company_url,))
                 result = cursor.fetchone()
                 return result[0] if result else None
-            else:
-                raise
         except sqlite3.OperationalError as e:
             if "database is locked" in str(e):
                 logger.warning(f"Database locked, retrying store_detail_html for {company_name}")
@@ -139,23 +153,22 @@ class DatabaseManager:
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
+                # URL trùng -> DO NOTHING: duplicate không bao giờ vào bảng, không cần cleanup sau
                 cursor.execute("""
                     INSERT INTO contact_html_storage (company_name, url, url_type, html_content, status)
                     VALUES (?, ?, ?, ?, 'pending')
+                    ON CONFLICT DO NOTHING
                 """, (company_name, url, url_type, html_content))
-                record_id = cursor.lastrowid
-                conn.commit()
-                return record_id
-        except sqlite3.IntegrityError as e:
-            if "UNIQUE constraint failed" in str(e):
+                if cursor.rowcount:
+                    record_id = cursor.lastrowid
+                    conn.commit()
+                    return record_id
+                
                 logger.info(f"URL already exists in contact_html_storage, skipping: {url}")
                 # Return existing record ID
-                cursor = conn.cursor()
                 cursor.execute("SELECT id FROM contact_html_storage WHERE url = ?", (url,))
                 result = cursor.fetchone()
                 return result[0] if result else None
-            else:
-                raise
         except sqlite3.OperationalError as e:
             if "database is locked" in str(e):
                 logger.warning(f"Database locked, retrying store_contact_html for {company_name}")
@@ -167,8 +180,8 @@ class DatabaseManager:
     def get_pending_detail_html(self, limit: int = 100) -> List[Dict[str, Any]]:
         """Get pending detail HTML records for company details extraction"""
         with self.get_connection() as conn:
-            conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row  # Per cursor: the connection is shared by this thread
             cursor.execute("""
                 SELECT id, company_name, company_url, html_content, crawled_at
                 FROM detail_html_storage 
@@ -181,8 +194,8 @@ class DatabaseManager:
     def get_pending_contact_html(self, limit: int = 100) -> List[Dict[str, Any]]:
         """Get pending contact HTML records for email extraction"""
         with self.get_connection() as conn:
-            conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row  # Per cursor: the connection is shared by this thread
             cursor.execute("""
                 SELECT id, company_name, url, url_type, html_content, crawled_at
                 FROM contact_html_storage 
@@ -296,8 +309,8 @@ class DatabaseManager:
     def get_extraction_results(self, company_name: str = None) -> List[Dict[str, Any]]:
         """Get email extraction results"""
         with self.get_connection() as conn:
-            conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row  # Per cursor: the connection is shared by this thread
             
             if company_name:
                 cursor.execute("""
@@ -374,19 +387,19 @@ class DatabaseManager:
                 'extraction_success_rate': successful_extractions / max(total_extractions, 1)
             }
     
-    def get_pending_detail_html(self, limit: int = 50) -> List[Dict[str, Any]]:
+    def get_pending_detail_html(self, limit: int = 50, shard: int = 0, shard_count: int = 1) -> List[Dict[str, Any]]:
         """Get pending detail HTML records for processing"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
+        with self.get_connection() as conn:
             cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row  # Per cursor: the connection is shared by this thread
             
             cursor.execute("""
                 SELECT id, company_name, company_url, html_content, crawled_at
                 FROM detail_html_storage 
-                WHERE status = 'pending' 
+                WHERE status = 'pending' AND id % ? = ?
                 ORDER BY crawled_at ASC 
                 LIMIT ?
-            """, (limit,))
+            """, (max(shard_count, 1), shard, limit))
             
             records = []
             for row in cursor.fetchall():
@@ -400,32 +413,34 @@ class DatabaseManager:
             
             return records
     
-    def get_company_details_for_contact_crawl(self, limit: int = 50) -> List[Dict[str, Any]]:
-        """Get company details để crawl contact pages (chỉ website và facebook)"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
+    def get_company_details_for_contact_crawl(self, limit: int = 50, after_id: int = 0) -> List[Dict[str, Any]]:
+        """Get company details để crawl contact pages (chỉ website và facebook), keyset theo id > after_id"""
+        with self.get_connection() as conn:
             cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row  # Per cursor: the connection is shared by this thread
             
             cursor.execute(
                 """
                 SELECT id, company_name, company_url, website, facebook
                 FROM company_details cd
-                WHERE (
-                    website IS NOT NULL AND website != '' AND NOT EXISTS (
-                        SELECT 1 FROM contact_html_storage ch
-                        WHERE ch.url = cd.website AND ch.url_type = 'website'
+                WHERE id > ? AND (
+                    (
+                        website IS NOT NULL AND website != '' AND NOT EXISTS (
+                            SELECT 1 FROM contact_html_storage ch
+                            WHERE ch.url = cd.website AND ch.url_type = 'website'
+                        )
                     )
-                )
-                OR (
-                    facebook IS NOT NULL AND facebook != '' AND NOT EXISTS (
-                        SELECT 1 FROM contact_html_storage ch
-                        WHERE ch.url = cd.facebook AND ch.url_type = 'facebook'
+                    OR (
+                        facebook IS NOT NULL AND facebook != '' AND NOT EXISTS (
+                            SELECT 1 FROM contact_html_storage ch
+                            WHERE ch.url = cd.facebook AND ch.url_type = 'facebook'
+                        )
                     )
                 )
                 ORDER BY id ASC
                 LIMIT ?
                 """,
-                (limit,),
+                (after_id, limit),
             )
             
             records = []
@@ -440,19 +455,19 @@ class DatabaseManager:
             
             return records
     
-    def get_pending_contact_html(self, limit: int = 50) -> List[Dict[str, Any]]:
+    def get_pending_contact_html(self, limit: int = 50, shard: int = 0, shard_count: int = 1) -> List[Dict[str, Any]]:
         """Get pending contact HTML records for email extraction"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
+        with self.get_connection() as conn:
             cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row  # Per cursor: the connection is shared by this thread
             
             cursor.execute("""
                 SELECT id, company_name, url, url_type, html_content, crawled_at
                 FROM contact_html_storage 
-                WHERE status = 'pending' 
+                WHERE status = 'pending' AND id % ? = ?
                 ORDER BY crawled_at ASC 
                 LIMIT ?
-            """, (limit,))
+            """, (max(shard_count, 1), shard, limit))
             
             records = []
             for row in cursor.fetchall():
@@ -469,7 +484,7 @@ class DatabaseManager:
     
     def create_final_results_with_duplication(self) -> int:
         """Create final results với logic duplicate rows cho multiple emails (max 5)"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.get_connection() as conn:
             cursor = conn.cursor()
             
             # Clear existing final results
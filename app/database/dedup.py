@@ -0,0 +1,84 @@
+"""
+Xóa record trùng lặp theo 1 cột key (dùng chung cho các script cleanup/migration)
+"""
+
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+# SQLite < 3.25 không có window functions (ROW_NUMBER) -> fallback xóa theo IN-list
+HAS_WINDOW_FUNCTIONS = sqlite3.sqlite_version_info >= (3, 25, 0)
+# <= 999 bound parameters mỗi câu (giới hạn mặc định của SQLite cũ)
+DELETE_IN_CHUNK_SIZE = 500
+
+
+def delete_duplicates(cursor: sqlite3.Cursor, table: str, key: str, keep_oldest: bool = True,
+                      commit_every: int = 0) -> int:
+    """
+    Giữ record đầu tiên mỗi `key` (theo created_at, id), xóa phần còn lại; key NULL/rỗng bỏ qua.
+    commit_every = 0 (mặc định): chạy trong transaction của caller và không commit -> caller
+    commit (hoặc rollback) 1 lần cho cả bước dedup (all-or-nothing).
+    commit_every > 0: xóa theo chunk, commit sau mỗi ~commit_every rows (WAL/journal bị chặn trên,
+    write lock được nhả giữa các chunk); lỗi giữa chừng chỉ rollback chunk đang dở.
+    Trả về số rows đã xóa.
+    """
+    order = "ASC" if keep_oldest else "DESC"
+    if HAS_WINDOW_FUNCTIONS and commit_every <= 0:
+        return _delete_duplicates_window(cursor, table, key, order)
+    return _delete_duplicates_chunked(cursor, table, key, order, commit_every)
+
+
+def _delete_duplicates_window(cursor: sqlite3.Cursor, table: str, key: str, order: str) -> int:
+    """1 câu DELETE set-based: 1 lượt scan xếp hạng records mỗi key, xóa rn > 1"""
+    # Subquery thay vì câu bắt đầu bằng WITH: khi đó sqlite3 trả rowcount = -1
+    cursor.execute(f"""
+        DELETE FROM {table}
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY {key} ORDER BY created_at {order}, id {order}
+                ) AS rn
+                FROM {table}
+                WHERE {key} IS NOT NULL AND {key} != ''
+            )
+            WHERE rn > 1
+        )
+    """)
+    return cursor.rowcount
+
+
+def _delete_duplicates_chunked(cursor: sqlite3.Cursor, table: str, key: str, order: str, commit_every: int = 0) -> int:
+    """1 lượt scan lấy ids cần xóa, DELETE theo IN-list mỗi chunk (fallback không có ROW_NUMBER, hoặc commit_every)"""
+    # Scan theo (key, created_at, id): record đầu tiên mỗi key là record được giữ
+    cursor.execute(f"""
+        SELECT id, {key}
+        FROM {table}
+        WHERE {key} IS NOT NULL AND {key} != ''
+        ORDER BY {key}, created_at {order}, id {order}
+    """)
+    # Duyệt thẳng cursor (không fetchall): chỉ giữ ids cần xóa
+    delete_ids = []
+    previous_key = None
+    for record_id, value in cursor:
+        if value == previous_key:
+            delete_ids.append(record_id)
+        previous_key = value
+
+    total_deleted = 0
+    uncommitted = 0
+    for start in range(0, len(delete_ids), DELETE_IN_CHUNK_SIZE):
+        chunk = delete_ids[start:start + DELETE_IN_CHUNK_SIZE]
+        placeholders = ','.join('?' * len(chunk))
+        cursor.execute(f"DELETE FROM {table} WHERE id IN ({placeholders})", chunk)
+        total_deleted += cursor.rowcount
+        uncommitted += cursor.rowcount
+        if commit_every > 0 and uncommitted >= commit_every:
+            cursor.connection.commit()
+            uncommitted = 0
+            logger.info("Deleted %d/%d duplicate records from %s", total_deleted, len(delete_ids), table)
+        else:
+            logger.debug("Deleted %d/%d duplicate records from %s", total_deleted, len(delete_ids), table)
+    if commit_every > 0:
+        cursor.connection.commit()
+    return total_deleted
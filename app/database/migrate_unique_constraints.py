@@ -44,18 +44,9 @@ def migrate_database(db_path: str = "data/crawler.db", dry_run: bool = False):
                 logger.warning(f"  {url}: {count} duplicates")
             
             if not dry_run:
-                # Remove duplicates, keep the latest one
-                logger.info("Removing duplicate entries (keeping latest)...")
-                cursor.execute("""
-                    DELETE FROM detail_html_storage 
-                    WHERE id NOT IN (
-                        SELECT MAX(id) 
-                        FROM detail_html_storage 
-                        GROUP BY company_url
-                    )
-                """)
-                removed_count = cursor.rowcount
-                logger.info(f"Removed {removed_count} duplicate entries")
+                # Bảng cũ sẽ bị drop: duplicates bị loại ngay lúc copy (INSERT OR IGNORE, bước 4)
+                # thay vì DELETE trên bảng cũ rồi mới copy
+                logger.info("Duplicate entries will be dropped during copy (keeping latest)...")
         else:
             logger.info("No duplicate company_url entries found")
         
@@ -127,14 +118,28 @@ def migrate_database(db_path: str = "data/crawler.db", dry_run: bool = False):
             # 4. Copy data from old tables to new tables
             logger.info("Copying data to new tables...")
             
+            # Cột liệt kê rõ (không phụ thuộc thứ tự cột của bảng cũ); company_url UNIQUE +
+            # OR IGNORE + id DESC: record mới nhất mỗi company_url được giữ, 1 lượt copy thay vì DELETE + copy
+            cursor.execute("SELECT COUNT(*) FROM detail_html_storage")
+            detail_before = cursor.fetchone()[0]
             cursor.execute("""
-                INSERT INTO detail_html_storage_new 
-                SELECT * FROM detail_html_storage
+                INSERT OR IGNORE INTO detail_html_storage_new
+                    (id, company_name, company_url, industry, html_content,
+                     crawled_at, status, retry_count, created_at)
+                SELECT id, company_name, company_url, industry, html_content,
+                       crawled_at, status, retry_count, created_at
+                FROM detail_html_storage
+                ORDER BY id DESC
             """)
+            logger.info(f"Removed {detail_before - cursor.rowcount} duplicate detail_html_storage entries")
             
             cursor.execute("""
-                INSERT INTO contact_html_storage_new 
-                SELECT * FROM contact_html_storage
+                INSERT INTO contact_html_storage_new
+                    (id, company_name, url, url_type, html_content,
+                     crawled_at, status, retry_count, created_at)
+                SELECT id, company_name, url, url_type, html_content,
+                       crawled_at, status, retry_count, created_at
+                FROM contact_html_storage
             """)
             
             # 5. Drop old tables and rename new tables
@@ -151,7 +156,7 @@ def migrate_database(db_path: str = "data/crawler.db", dry_run: bool = False):
             
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_detail_html_status ON detail_html_storage(status)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_detail_html_company ON detail_html_storage(company_name)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_detail_html_url ON detail_html_storage(company_url)")
+            # company_url UNIQUE đã tạo autoindex: idx_detail_html_url sẽ trùng lặp
             
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_contact_html_status ON contact_html_storage(status)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_contact_html_company ON contact_html_storage(company_name)")
@@ -65,12 +65,14 @@ CREATE TABLE IF NOT EXISTS email_extraction (
 -- Indexes for performance
 CREATE INDEX IF NOT EXISTS idx_detail_html_status ON detail_html_storage(status);
 CREATE INDEX IF NOT EXISTS idx_detail_html_company ON detail_html_storage(company_name);
-CREATE INDEX IF NOT EXISTS idx_detail_html_url ON detail_html_storage(company_url);
+-- (company_url UNIQUE đã có autoindex -> không tạo thêm idx_detail_html_url, tránh ghi 2 B-tree giống nhau mỗi insert)
 CREATE INDEX IF NOT EXISTS idx_company_details_name ON company_details(company_name);
 CREATE INDEX IF NOT EXISTS idx_contact_html_status ON contact_html_storage(status);
 CREATE INDEX IF NOT EXISTS idx_contact_html_company ON contact_html_storage(company_name);
 CREATE INDEX IF NOT EXISTS idx_contact_html_type ON contact_html_storage(url_type);
-CREATE INDEX IF NOT EXISTS idx_contact_html_url ON contact_html_storage(url);
+-- (url UNIQUE đã có autoindex -> không tạo thêm idx_contact_html_url)
 CREATE INDEX IF NOT EXISTS idx_email_extraction_company ON email_extraction(company_name);
 CREATE INDEX IF NOT EXISTS idx_email_extraction_html_id ON email_extraction(contact_html_id);
+-- Final export join: LOWER(TRIM(e.company_name)) = LOWER(TRIM(cd.company_name)) -> index lookup thay vì scan email_extraction mỗi dòng
+CREATE INDEX IF NOT EXISTS idx_email_extraction_company_norm ON email_extraction(LOWER(TRIM(company_name)));
 -- (index final_results removed)
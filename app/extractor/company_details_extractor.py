@@ -8,9 +8,11 @@ import logging
 logger = logging.getLogger(__name__)
 
 class CompanyDetailsExtractor:
-    def __init__(self, config: CrawlerConfig = None):
+    def __init__(self, config: CrawlerConfig = None, parser: lxml_html.HTMLParser = None, db_manager: DatabaseManager = None):
         self.config = config or CrawlerConfig()
-        self.db_manager = DatabaseManager()
+        self.db_manager = db_manager or DatabaseManager()
+        # Reuse one lxml parser cho mọi record thay vì tạo parser mới mỗi lần fromstring
+        self.parser = parser or lxml_html.HTMLParser()
         
         # Load XPath patterns từ config cũ (xpath section)
         xpath_config = self.config.xpath_config
@@ -99,7 +101,7 @@ class CompanyDetailsExtractor:
     def extract_company_details(self, html_content: str, company_name: str, company_url: str) -> Dict[str, Any]:
         """Extract company details from HTML content"""
         try:
-            tree = lxml_html.fromstring(html_content)
+            tree = lxml_html.fromstring(html_content, parser=self.parser)
         except Exception:
             tree = None
         details = {
@@ -134,10 +136,10 @@ class CompanyDetailsExtractor:
         
         return details
     
-    def extract_from_db_batch(self, batch_size: int = 50) -> Dict[str, Any]:
+    def extract_from_db_batch(self, batch_size: int = 50, shard: int = 0, shard_count: int = 1) -> Dict[str, Any]:
         """Extract company details từ HTML records trong database"""
         # Get pending detail HTML records
-        html_records = self.db_manager.get_pending_detail_html(batch_size)
+        html_records = self.db_manager.get_pending_detail_html(batch_size, shard=shard, shard_count=shard_count)
         
         if not html_records:
             return {
@@ -13,9 +13,9 @@ import logging
 logger = logging.getLogger(__name__)
 
 class EmailExtractor:
-    def __init__(self, config: CrawlerConfig = None):
+    def __init__(self, config: CrawlerConfig = None, db_manager: DatabaseManager = None):
         self.config = config or CrawlerConfig()
-        self.db_manager = DatabaseManager()
+        self.db_manager = db_manager or DatabaseManager()
         
         # Use Async Context Manager for browser management
         self.context_manager = get_context_manager()
@@ -160,10 +160,14 @@ class EmailExtractor:
         
         return all_emails
     
-    def extract_from_db_batch(self, batch_size: int = 50) -> Dict[str, Any]:
+    def extract_from_db_batch(self, batch_size: int = 50, shard: int = 0, shard_count: int = 1) -> Dict[str, Any]:
+        """Extract emails từ HTML records trong database (sync wrapper, một event loop cho cả batch)"""
+        return asyncio.run(self.extract_from_db_batch_async(batch_size, shard=shard, shard_count=shard_count))
+    
+    async def extract_from_db_batch_async(self, batch_size: int = 50, shard: int = 0, shard_count: int = 1) -> Dict[str, Any]:
         """Extract emails từ HTML records trong database"""
         # Get pending contact HTML records
-        html_records = self.db_manager.get_pending_contact_html(batch_size)
+        html_records = self.db_manager.get_pending_contact_html(batch_size, shard=shard, shard_count=shard_count)
         
         if not html_records:
             return {
@@ -185,7 +189,7 @@ class EmailExtractor:
         for record in html_records:
             try:
                 # Extract emails from HTML content using BestFirstCrawlingStrategy (async)
-                emails = asyncio.run(self.extract_emails_from_html(record['html_content'], record['url_type']))
+                emails = await self.extract_emails_from_html(record['html_content'], record['url_type'])
                 
                 # Store extraction results
                 self.db_manager.store_email_extraction(
@@ -224,10 +228,12 @@ class EmailExtractor:
         
         return results
     
-    def get_extraction_summary(self) -> Dict[str, Any]:
-        """Get email extraction summary statistics"""
+    @classmethod
+    def get_extraction_summary(cls, db_manager: DatabaseManager = None) -> Dict[str, Any]:
+        """Get email extraction summary statistics (DB only, không cần khởi tạo extractor)"""
         try:
-            with self.db_manager.get_connection() as conn:
+            db_manager = db_manager or DatabaseManager()
+            with db_manager.get_connection() as conn:
                 cursor = conn.cursor()
                 
                 # Total extractions
@@ -1,5 +1,6 @@
 import asyncio, argparse, logging
 import os
+import re
 import json
 from typing import List, Dict, Any
 from app.crawler.list_crawler import ListCrawler
@@ -10,12 +11,24 @@ from app.tasks.tasks import (
     crawl_contact_pages_from_details as task_crawl_contact_from_details,
     extract_emails_from_contact as task_extract_emails_from_contact,
     export_final_csv as task_export_final_csv,
+    sanitize_industry_name,
 )
 from config import CrawlerConfig
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+_PAGE_NUM_RE = re.compile(r'page=(\d+)')
+
+def load_checkpoint_links(checkpoint_file):
+    """
+    Load links từ checkpoint: JSON Lines (.jsonl, đọc từng dòng) hoặc JSON array cũ (.json)
+    """
+    with open(checkpoint_file, 'r', encoding='utf-8') as f:
+        if checkpoint_file.endswith('.jsonl'):
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f)
+
 def check_checkpoint_completeness(links, industry_name):
     """
     Check if checkpoint is complete based on pagination and link quality analysis
@@ -30,8 +43,7 @@ def check_checkpoint_completeness(links, industry_name):
         if 'page=' in url:
             try:
                 # Extract page number from URL
-                import re
-                page_match = re.search(r'page=(\d+)', url)
+                page_match = _PAGE_NUM_RE.search(url)
                 if page_match:
                     page_num = int(page_match.group(1))
                     page_counts[page_num] = page_counts.get(page_num, 0) + 1
@@ -133,8 +145,7 @@ async def run_phase1_links(config, base_url, batch_size):
                 
                 # Load links from checkpoint file
                 try:
-                    with open(checkpoint_file, 'r') as f:
-                        links = json.load(f)
+                    links = load_checkpoint_links(checkpoint_file)
                     total_links = len(links)
                     logger.info(f"[wave {wave_index} - {idx}/{len(link_tasks)}] Industry '{ind_name}' -> Loaded {total_links} links from checkpoint")
                     
@@ -235,18 +246,15 @@ async def run_phase1_links(config, base_url, batch_size):
         # Check each failed industry for existing checkpoint and completeness
         for ind_id, ind_name in failed_industries:
             # Check if checkpoint already exists
-            import re
-            import os
-            safe_industry_name = re.sub(r'[^\w\s-]', '_', ind_name)
-            safe_industry_name = re.sub(r'[-\s]+', '_', safe_industry_name)
-            safe_industry_name = safe_industry_name.strip('_')
+            safe_industry_name = sanitize_industry_name(ind_name)
             
-            checkpoint_file = f"/app/data/checkpoint_{safe_industry_name}_1.json"
+            checkpoint_file = f"/app/data/checkpoint_{safe_industry_name}_1.jsonl"
+            if not os.path.exists(checkpoint_file):
+                checkpoint_file = checkpoint_file[:-1]  # Checkpoint .json cũ
             
             if os.path.exists(checkpoint_file):
                 try:
-                    with open(checkpoint_file, 'r') as f:
-                        existing_links = json.load(f)
+                    existing_links = load_checkpoint_links(checkpoint_file)
                     
                     if existing_links and len(existing_links) > 0:
                         # COMPLETENESS CHECK: Analyze pagination and link quality
@@ -364,8 +372,7 @@ async def run_phase1_links(config, base_url, batch_size):
                 
                 if result and result.get('checkpoint_file'):
                     checkpoint_file = result.get('checkpoint_file')
-                    with open(checkpoint_file, 'r') as f:
-                        links = json.load(f)
+                    links = load_checkpoint_links(checkpoint_file)
                     total_links = len(links)
                     logger.info(f"Retry successful: '{ind_name}' -> {total_links} links")
                     
@@ -732,7 +739,7 @@ def detect_completed_phases():
     # Check Phase 1: Links (checkpoint files exist)
     import os
     import glob
-    checkpoint_files = glob.glob("data/checkpoint_*.json")
+    checkpoint_files = glob.glob("data/checkpoint_*.json") + glob.glob("data/checkpoint_*.jsonl")
     if checkpoint_files:
         completed_phases['phase1_links'] = True
         logger.info(f"Phase 1 (Links) completed: {len(checkpoint_files)} checkpoint files found")
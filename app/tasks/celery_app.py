@@ -1,7 +1,18 @@
 # app/tasks/celery_app.py
 import os
+import gc
+import asyncio
+import threading
+import concurrent.futures
 from celery import Celery
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown, worker_shutdown
 from kombu import Queue
+from app.utils.health_monitor import ActiveTaskCounter
+
+try:
+    import uvloop  # libuv-based loop, faster socket/subprocess I/O for Playwright
+except ImportError:  # optional: not available on Windows
+    uvloop = None
 
 broker = os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0")
 backend = os.getenv("CELERY_RESULT_BACKEND", "redis://redis:6379/0")
@@ -48,10 +59,13 @@ celery_app.conf.task_routes = {
     "detail.crawl_and_store": {"queue": "crawl"},
     # Phase 2: Detail extraction
     "detail.extract_from_html": {"queue": "crawl"},
+    "detail.extract_from_html_shard": {"queue": "crawl"},
     # Phase 3: Contact crawling
     "contact.crawl_from_details": {"queue": "crawl"},
     # Phase 4: Email extraction
     "email.extract_from_contact": {"queue": "crawl"},
+    "email.extract_from_contact_shard": {"queue": "crawl"},
+    "extract.aggregate_counts": {"queue": "crawl"},
     # Phase 5: Database operations
     "db.create_final_results": {"queue": "crawl"},
     "db.get_stats": {"queue": "crawl"},
@@ -59,4 +73,124 @@ celery_app.conf.task_routes = {
     "final.export": {"queue": "crawl"},
 }
 
-# Celery sẽ tự quản lý event loop với asyncio support
+# (4) WORKER EVENT LOOP - one loop per worker process, reused by every task
+# Policy install also covers asyncio.run() callers (e.g. EmailExtractor.extract_from_db_batch outside Celery)
+if uvloop:
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+class EventLoopThread(threading.Thread):
+    """Daemon thread running the worker event loop forever; tasks submit coroutines to it"""
+
+    def __init__(self):
+        super().__init__(name="worker-event-loop", daemon=True)
+        self.loop = uvloop.new_event_loop() if uvloop else asyncio.new_event_loop()
+        # Python 3.12+: coroutines run synchronously until their first real await
+        # (circuit-open / cache-hit paths skip a scheduler round-trip).
+        # ActiveTaskCounter wraps it so health checks read the active task count in O(1)
+        self.loop.set_task_factory(ActiveTaskCounter(getattr(asyncio, "eager_task_factory", None)))
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """Schedule a coroutine on the loop thread (thread-safe)"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self, timeout: float = 10.0):
+        """Run shutdown hooks, cancel leftovers, stop the loop and close it"""
+        if not self.is_alive():
+            return
+        try:
+            self.submit(self._shutdown()).result(timeout)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.join(timeout)
+        if not self.is_alive():
+            self.loop.close()
+
+    async def _shutdown(self):
+        for hook in _SHUTDOWN_HOOKS:
+            try:
+                await hook()
+            except Exception:
+                pass
+        await _drain_loop()
+        await self.loop.shutdown_asyncgens()
+
+
+async def _drain_loop(timeout: float = 5.0):
+    """Cancel every other task on the running loop and wait (bounded) for their finally blocks"""
+    current = asyncio.current_task()
+    pending = [t for t in asyncio.all_tasks() if t is not current and not t.done()]
+    for task in pending:
+        task.cancel()
+    if pending:
+        # asyncio.wait never re-cancels on timeout (unlike wait_for(gather(...))), works on 3.10
+        done, still_pending = await asyncio.wait(pending, timeout=timeout)
+        for task in done:
+            if not task.cancelled():
+                task.exception()  # Mark retrieved so the loop does not log "never retrieved"
+
+
+_ELT = None
+_ELT_LOCK = threading.Lock()  # Only taken while (re)starting the loop thread
+_SHUTDOWN_HOOKS = []
+
+
+def get_event_loop_thread() -> EventLoopThread:
+    """Return the worker-lifetime loop thread, starting it on first use"""
+    global _ELT
+    elt = _ELT
+    if elt is not None and elt.is_alive():
+        return elt  # Fast path: no lock once the thread is running
+    with _ELT_LOCK:
+        # Double-checked: another pool thread may have started it meanwhile
+        if _ELT is None or not _ELT.is_alive():
+            _ELT = EventLoopThread()
+            _ELT.start()
+        return _ELT
+
+
+def run_async(coro, timeout: float = None):
+    """Run a coroutine on the worker loop thread and block until it finishes"""
+    future = get_event_loop_thread().submit(coro)
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise
+
+
+def on_loop_shutdown(hook):
+    """Register an async callable awaited on the loop thread before it stops (e.g. crawler cleanup)"""
+    _SHUTDOWN_HOOKS.append(hook)
+    return hook
+
+
+@worker_init.connect
+@worker_process_init.connect
+def _freeze_gc(**kwargs):
+    """Move objects alive after startup (modules, config, task registry) out of GC scans"""
+    gc.collect()
+    gc.freeze()
+    gc.set_threshold(50000, 10, 10)
+
+
+@worker_process_init.connect
+def _init_worker_loop(**kwargs):
+    """Prefork child: threads do not survive fork, start a fresh loop thread"""
+    global _ELT
+    _ELT = None
+    get_event_loop_thread()
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def _close_worker_loop(**kwargs):
+    """Stop the loop thread on shutdown (prefork child: worker_process_shutdown, solo: worker_shutdown)"""
+    global _ELT
+    if _ELT is not None:
+        _ELT.stop()
+    _ELT = None
@@ -1,10 +1,18 @@
 import asyncio
+import json
+import os
+import random
+import re
 import pandas as pd
 import gc
 import psutil
 import time
 import threading
-from functools import lru_cache
+from dataclasses import dataclass, asdict
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict
+from lxml import html as lxml_html
 from app.crawler.contact_crawler import ContactCrawler
 from app.crawler.detail_crawler import DetailCrawler
 from app.crawler.list_crawler import ListCrawler
@@ -15,31 +23,191 @@ from app.utils.circuit_breaker import circuit_manager
 from app.utils.health_monitor import health_monitor
 from app.utils.error_handler import error_handler, fast_error_check
 from config import CrawlerConfig
+from celery import chord, group
 import logging
 
+try:
+    import orjson  # C JSON codec: export email arrays, link checkpoints
+except ImportError:  # optional: fall back to stdlib json
+    orjson = None
+
+if orjson:
+    json_loads = orjson.loads
+    json_dumps_bytes = orjson.dumps
+else:
+    json_loads = json.loads
+
+    def json_dumps_bytes(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+# Sanitize tên industry để tạo tên file checkpoint hợp lệ
+_SANITIZE_SPECIAL_RE = re.compile(r'[^\w\s-]')  # Ký tự đặc biệt -> _
+_SANITIZE_SEPARATOR_RE = re.compile(r'[-\s]+')  # Khoảng trắng và - -> _
+
+def sanitize_industry_name(industry_name: str) -> str:
+    """Tên industry -> phần tên file checkpoint (dùng chung cho task ghi và main đọc)"""
+    return _SANITIZE_SEPARATOR_RE.sub('_', _SANITIZE_SPECIAL_RE.sub('_', industry_name)).strip('_')
+
 logger = logging.getLogger(__name__)
 
 # Import celery app
-from app.tasks.celery_app import celery_app
+from app.tasks.celery_app import celery_app, run_async, on_loop_shutdown
+
+# Minimum seconds between Celery progress updates (each one is a result-backend round trip)
+PROGRESS_UPDATE_INTERVAL_S = 1.0
+
+# Memory threshold (MB) for forcing a browser cleanup between contact batches
+MEMORY_CLEANUP_THRESHOLD_MB = 1000
+
+def _write_checkpoint(path: str, data: list) -> int:
+    """Ghi checkpoint dạng JSON Lines (một record compact mỗi dòng)"""
+    with open(path, 'wb') as f:
+        f.writelines(json_dumps_bytes(item) + b"\n" for item in data)
+    return len(data)
+
+@dataclass(slots=True)
+class ErrorMeta:
+    """Error payload cho update_state và kết quả lỗi của task (key 'error' giữ nguyên cho main.py)"""
+    industry: str
+    error_type: str
+    error: str
+
+    @classmethod
+    def from_exception(cls, industry: str, exc: BaseException) -> "ErrorMeta":
+        return cls(industry, type(exc).__name__, str(exc)[:500])
 
-# Solo pool doesn't need loop pooling
+def _current_rss_mb() -> float:
+    """Current RSS of this worker in MB (psutil.Process() per call: pid đúng sau prefork fork)"""
+    return psutil.Process().memory_info().rss / 1048576
 
-@lru_cache(maxsize=1)
+async def _cleanup_and_settle(crawler, delay: float):
+    """Restart browser của crawler (nếu không task nào khác đang dùng) rồi chờ trên loop"""
+    if await _restart_shared_crawler(crawler):
+        await asyncio.sleep(delay)
+
+# Prefork --concurrency=1: one set of crawlers per child process, reused by the tasks it
+# runs one at a time (browser launched once per child, not per task). The child is
+# recycled by --max-tasks-per-child / --max-memory-per-child; never share these
+# crawlers between concurrently running tasks (cleanup() closes the browser for all users)
+
+def _worker_singleton(factory):
+    """Lazy per-process instance; first call builds it under a lock (double-checked)"""
+    lock = threading.Lock()
+    instance = None
+    
+    @wraps(factory)
+    def get():
+        nonlocal instance
+        if instance is None:
+            with lock:
+                if instance is None:
+                    instance = factory()
+        return instance
+    
+    get.is_initialized = lambda: instance is not None
+    return get
+
+@_worker_singleton
 def get_crawler_config():
     """Cached config instance"""
     return CrawlerConfig()
 
-def _get_or_create_loop():
-    """Get or create event loop for current thread (solo pool compatible)"""
+@_worker_singleton
+def get_db_manager():
+    """Cached DatabaseManager instance (schema init runs once per worker)"""
+    return DatabaseManager()
+
+@_worker_singleton
+def get_html_parser():
+    """Shared lxml HTML parser for detail extraction (one per worker process)"""
+    return lxml_html.HTMLParser()
+
+@_worker_singleton
+def get_list_crawler():
+    """Cached ListCrawler reused by link tasks on this worker"""
+    return ListCrawler(get_crawler_config())
+
+@_worker_singleton
+def get_detail_crawler():
+    """Cached DetailCrawler reused by detail tasks on this worker"""
+    return DetailCrawler(get_crawler_config(), db_manager=get_db_manager())
+
+@_worker_singleton
+def get_contact_crawler():
+    """Cached ContactCrawler reused by contact tasks on this worker"""
+    return ContactCrawler(get_crawler_config(), db_manager=get_db_manager())
+
+# Số task đang dùng mỗi crawler dùng chung (id(crawler) -> count)
+_CRAWLER_LEASES: Dict[int, int] = {}
+_CRAWLER_LEASES_LOCK = threading.Lock()
+
+@contextmanager
+def _lease_crawler(getter):
+    """Borrow a shared crawler for the duration of a task (counted, see _restart_shared_crawler)"""
+    crawler = getter()
+    key = id(crawler)
+    with _CRAWLER_LEASES_LOCK:
+        _CRAWLER_LEASES[key] = _CRAWLER_LEASES.get(key, 0) + 1
     try:
-        # Try to get existing loop first
-        loop = asyncio.get_running_loop()
-        return loop
-    except RuntimeError:
-        # No running loop, create new one
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        return loop
+        yield crawler
+    finally:
+        with _CRAWLER_LEASES_LOCK:
+            _CRAWLER_LEASES[key] -= 1
+
+async def _restart_shared_crawler(crawler) -> bool:
+    """
+    Close the shared crawler's browsers (recreated on next use), but only when the calling
+    task is its sole user; otherwise the restart would kill other tasks' pages mid-crawl
+    """
+    with _CRAWLER_LEASES_LOCK:
+        other_users = _CRAWLER_LEASES.get(id(crawler), 0) - 1
+    if other_users > 0:
+        logger.warning(f"Skipping browser restart: crawler in use by {other_users} other task(s)")
+        return False
+    await crawler.cleanup()
+    return True
+
+@on_loop_shutdown
+async def _cleanup_shared_crawlers():
+    """Close browsers of the shared crawlers once, when the worker loop stops"""
+    for getter in (get_list_crawler, get_detail_crawler, get_contact_crawler):
+        if getter.is_initialized():
+            try:
+                await getter().cleanup()
+            except Exception as e:
+                logger.warning(f"Shared crawler cleanup error: {e}")
+
+def _normalize_links(links: list, industry_name: str):
+    """
+    Chuẩn hoá links thành dict {name, url, industry} và bỏ url trùng (giữ thứ tự).
+    Fast path cho list[str] (ListCrawler trả về hrefs); list lẫn kiểu mới đi đường tổng quát.
+    Returns (normalized, duplicate_count)
+    """
+    if not links:
+        return [], 0
+    
+    if all(type(item) is str for item in links):
+        # dict.fromkeys: dedup ở C level, bỏ url rỗng
+        unique_urls = dict.fromkeys(filter(None, links))
+        normalized = [{'name': '', 'url': url, 'industry': industry_name} for url in unique_urls]
+        return normalized, len(links) - len(normalized)
+    
+    seen_urls = set()
+    normalized = []
+    duplicate_count = 0
+    for item in links:
+        if isinstance(item, str):
+            item = {'name': '', 'url': item}
+        elif not isinstance(item, dict):
+            continue
+        url = item.get('url', '')
+        if url and url not in seen_urls:
+            seen_urls.add(url)
+            item['industry'] = industry_name  # in place, upstream không dùng lại list
+            normalized.append(item)
+        else:
+            duplicate_count += 1
+    return normalized, duplicate_count
 
 @celery_app.task(name="links.fetch_industry_links", bind=True)
 def fetch_industry_links(self, base_url: str, industry_id: str, industry_name: str, pass_no: int = 1):
@@ -50,128 +218,77 @@ def fetch_industry_links(self, base_url: str, industry_id: str, industry_name: s
     self.update_state(state='PROGRESS', meta={'industry': industry_name, 'status': 'starting'})
     
     try:
-        config = get_crawler_config()  # Use cached config
-        list_crawler = ListCrawler(config)
-        
-        # Solo pool compatible: create new loop for each task
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            # Fetch links với optimized retry logic
-            links = loop.run_until_complete(
+        # Fetch links với optimized retry logic (lease: browser restart chỉ khi không task nào khác dùng)
+        with _lease_crawler(get_list_crawler) as list_crawler:
+            links = run_async(
                 _fetch_links_with_circuit_breaker_async(list_crawler, base_url, industry_id, industry_name, pass_no)
             )
+        
+        # Chuẩn hoá dữ liệu + DEDUPLICATION theo url trước khi lưu checkpoint
+        normalized, duplicate_count = _normalize_links(links, industry_name)
+        if duplicate_count > 0:
+            logger.info(f"Deduplication: {len(normalized)} unique links, {duplicate_count} duplicates removed")
+        
+        # Lưu checkpoint (sau khi hoàn thành chuẩn hoá và deduplication)
+        checkpoint_file = None
+        if normalized:
+            safe_industry_name = sanitize_industry_name(industry_name)
             
-            # Chuẩn hoá dữ liệu
-            normalized = []
-            for item in links:
-                if isinstance(item, str):
-                    normalized.append({
-                        'name': '',
-                        'url': item,
-                        'industry': industry_name,
-                    })
-                elif isinstance(item, dict):
-                    item = {**item}
-                    item['industry'] = industry_name
-                    normalized.append(item)
-            
-            # DEDUPLICATION: Remove duplicate URLs before saving checkpoint
-            if normalized:
-                # Create URL set for deduplication
-                seen_urls = set()
-                deduplicated = []
-                duplicate_count = 0
-                
-                for item in normalized:
-                    url = item.get('url', '')
-                    if url and url not in seen_urls:
-                        seen_urls.add(url)
-                        deduplicated.append(item)
-                    else:
-                        duplicate_count += 1
-                
-                if duplicate_count > 0:
-                    logger.info(f"Deduplication: {len(deduplicated)} unique links, {duplicate_count} duplicates removed")
-                
-                normalized = deduplicated
-            
-            # Lưu checkpoint (sau khi hoàn thành chuẩn hoá và deduplication)
-            checkpoint_file = None
-            if normalized:
-                # Sanitize tên industry để tạo tên file hợp lệ
-                import re
-                import os
-                safe_industry_name = re.sub(r'[^\w\s-]', '_', industry_name)  # Thay ký tự đặc biệt bằng _
-                safe_industry_name = re.sub(r'[-\s]+', '_', safe_industry_name)  # Thay khoảng trắng và - bằng _
-                safe_industry_name = safe_industry_name.strip('_')  # Bỏ _ ở đầu và cuối
-                
-                # Tạo thư mục data nếu chưa tồn tại
-                os.makedirs('/app/data', exist_ok=True)
-                checkpoint_file = f"/app/data/checkpoint_{safe_industry_name}_{pass_no}.json"
-                
-                try:
-                    import json
-                    with open(checkpoint_file, 'w') as f:
-                        json.dump(normalized, f, ensure_ascii=False, indent=2)
-                    logger.info(f"Checkpoint saved: {checkpoint_file} ({len(normalized)} unique links)")
-                except Exception as e:
-                    logger.warning(f"Failed to save checkpoint: {e}")
-            
-            logger.info(f"Industry '{industry_name}' -> {len(normalized)} companies (pass {pass_no})")
-            
-            # Update task state to completed with checkpoint info
-            self.update_state(state='SUCCESS', meta={
-                'industry': industry_name, 
-                'links_count': len(normalized),
-                'checkpoint_file': checkpoint_file if normalized else None
-            })
+            # Tạo thư mục data nếu chưa tồn tại
+            os.makedirs('/app/data', exist_ok=True)
+            checkpoint_file = f"/app/data/checkpoint_{safe_industry_name}_{pass_no}.jsonl"
             
-            # Return only metadata to avoid large result storage issues
-            # The actual links are saved in checkpoint file
-            result = {
-                'industry': industry_name,
-                'links_count': len(normalized),
-                'checkpoint_file': checkpoint_file if normalized else None
-            }
-            logger.info(f"Returning result for '{industry_name}': {result}")
-            return result
-            
-        finally:
-            # Solo pool cleanup: close loop after task
+            # Ghi xong trước khi báo SUCCESS: main.py đọc checkpoint ngay khi nhận state/result
             try:
-                # Cleanup crawler resources
-                loop.run_until_complete(list_crawler.cleanup())
-            except Exception as cleanup_error:
-                logger.warning(f"Cleanup error: {cleanup_error}")
-            finally:
-                # Close loop
-                loop.close()
-                asyncio.set_event_loop(None)
+                _write_checkpoint(checkpoint_file, normalized)
+                logger.info(f"Checkpoint saved: {checkpoint_file} ({len(normalized)} unique links)")
+            except Exception as e:
+                logger.warning(f"Failed to save checkpoint: {e}")
+        
+        logger.info(f"Industry '{industry_name}' -> {len(normalized)} companies (pass {pass_no})")
+        
+        # Update task state to completed with checkpoint info
+        self.update_state(state='SUCCESS', meta={
+            'industry': industry_name, 
+            'links_count': len(normalized),
+            'checkpoint_file': checkpoint_file if normalized else None
+        })
+        
+        # Return only metadata to avoid large result storage issues
+        # The actual links are saved in checkpoint file
+        result = {
+            'industry': industry_name,
+            'links_count': len(normalized),
+            'checkpoint_file': checkpoint_file if normalized else None,
+            'format': 'jsonl'
+        }
+        logger.info(f"Returning result for '{industry_name}': {result}")
+        return result
             
     except Exception as e:
         logger.error(f"Failed to fetch links for industry '{industry_name}': {e}")
+        error_meta = asdict(ErrorMeta.from_exception(industry_name, e))
         # Update task state to failed
-        self.update_state(state='FAILURE', meta={'industry': industry_name, 'error': str(e)})
+        self.update_state(state='FAILURE', meta=error_meta)
         # Return proper error result instead of empty list
-        return {
-            'industry': industry_name,
-            'links_count': 0,
-            'checkpoint_file': None,
-            'error': str(e)
-        }
+        return {**error_meta, 'links_count': 0, 'checkpoint_file': None}
+
+async def _ensure_healthy(context_manager, prefix: str = "", log_ok: bool = True):
+    """Health check (cached in HealthMonitor); run cleanup_if_needed when the worker is unhealthy"""
+    health = await health_monitor.check_health(context_manager)
+    if not health.is_healthy:
+        logger.warning(f"{prefix}Worker health issues detected: {health.issues}")
+        await health_monitor.cleanup_if_needed(context_manager)
+        logger.info(f"{prefix}Health cleanup completed")
+    elif log_ok:
+        logger.info(f"{prefix}Worker health OK: {health.memory_usage_mb:.1f}MB, {health.cpu_percent:.1f}% CPU")
+    return health
 
 async def _fetch_links_with_circuit_breaker_async(list_crawler, base_url: str, industry_id: str, industry_name: str, pass_no: int = 1):
     """Async helper with circuit breaker and health monitoring integration"""
     # 1. Health check before starting
     logger.info(f"[{industry_name}] Starting health check...")
-    health = await health_monitor.check_health(list_crawler.context_manager)
-    if not health.is_healthy:
-        logger.warning(f"[{industry_name}] Worker health issues detected: {health.issues}")
-        await health_monitor.cleanup_if_needed(list_crawler.context_manager)
-        logger.info(f"[{industry_name}] Health cleanup completed")
-    else:
-        logger.info(f"[{industry_name}] Worker health OK: {health.memory_usage_mb:.1f}MB, {health.cpu_percent:.1f}% CPU")
+    await _ensure_healthy(list_crawler.context_manager, f"[{industry_name}] ")
     
     # 2. Get circuit breaker for this industry
     breaker = circuit_manager.get_breaker(
@@ -187,9 +304,9 @@ async def _fetch_links_with_circuit_breaker_async(list_crawler, base_url: str, i
     
     # 4. Use circuit breaker to protect the main operation
     try:
-        links = await breaker.call(
+        links = await breaker.call_async(
             _fetch_links_optimized_async,
-            list_crawler, base_url, industry_id, industry_name, pass_no
+            list_crawler, base_url, industry_id, industry_name, pass_no, breaker
         )
         logger.info(f"[{industry_name}] Circuit breaker protected operation completed successfully")
         return links
@@ -201,8 +318,11 @@ async def _fetch_links_with_circuit_breaker_async(list_crawler, base_url: str, i
             logger.warning(f"[{industry_name}] Circuit breaker is now OPEN - will fail fast for {final_state['recovery_timeout']}s")
         raise e
 
-async def _fetch_links_optimized_async(list_crawler, base_url: str, industry_id: str, industry_name: str, pass_no: int = 1):
-    """Optimized async helper for link fetching with smart retry logic"""
+async def _fetch_links_optimized_async(list_crawler, base_url: str, industry_id: str, industry_name: str, pass_no: int = 1, breaker=None):
+    """Optimized async helper for link fetching with smart retry logic (stops early once `breaker` is OPEN)"""
+    def breaker_open() -> bool:
+        return breaker is not None and breaker.get_state()['state'] == 'OPEN'
+    
     # Adaptive retries/timeouts per pass - tối ưu cho large industries
     if pass_no == 1:
         retries, timeout_s, delay_s = 4, 600, 5  # Tăng timeout lên 10 phút, 4 retries
@@ -244,23 +364,23 @@ async def _fetch_links_optimized_async(list_crawler, base_url: str, industry_id:
             else:
                 logger.info(f"[{industry_name}] Non-critical error ({error_info['category']}), retrying without restart...")
             
-            # Restart browser if needed
-            if needs_restart and attempt < retries:
+            # Restart browser if needed (bỏ qua khi breaker OPEN - lần gọi sau sẽ bị reject)
+            if needs_restart and attempt < retries and not breaker_open():
                 try:
-                    await list_crawler.cleanup()
-                    await asyncio.sleep(3)  # Shorter wait
+                    if await _restart_shared_crawler(list_crawler):
+                        await asyncio.sleep(3)  # Shorter wait
                     # Browser will be recreated automatically on next call
                 except Exception as cleanup_error:
                     logger.error(f"[{industry_name}] Cleanup failed: {cleanup_error}")
         
         # Random uniform delay before retry
         if attempt < retries:
-            import random
             # Random delay: base_delay ± 50% jitter
             base_delay = delay_s * (attempt + 1)
-            min_delay = base_delay * 0.5
-            max_delay = base_delay * 1.5
-            wait_time = random.uniform(min_delay, max_delay)
+            wait_time = base_delay * (0.5 + random.random())
+            if breaker_open():
+                logger.info(f"[{industry_name}] Circuit breaker OPEN - skipping remaining retries")
+                break
             logger.info(f"[{industry_name}] Waiting {wait_time:.1f}s before retry...")
             await asyncio.sleep(wait_time)
     
@@ -276,13 +396,7 @@ async def _crawl_detail_pages_with_circuit_breaker_async(detail_crawler, compani
     
     # 1. Health check before starting
     logger.info(f"Starting health check for detail crawling...")
-    health = await health_monitor.check_health(detail_crawler.context_manager)
-    if not health.is_healthy:
-        logger.warning(f"Worker health issues detected: {health.issues}")
-        await health_monitor.cleanup_if_needed(detail_crawler.context_manager)
-        logger.info(f"Health cleanup completed")
-    else:
-        logger.info(f"Worker health OK: {health.memory_usage_mb:.1f}MB, {health.cpu_percent:.1f}% CPU")
+    await _ensure_healthy(detail_crawler.context_manager)
     
     # 2. Get circuit breaker for detail crawling
     breaker = circuit_manager.get_breaker(
@@ -292,18 +406,31 @@ async def _crawl_detail_pages_with_circuit_breaker_async(detail_crawler, compani
         expected_exception=Exception
     )
     
-    # 3. Process batches with circuit breaker protection
-    for i in range(0, total_companies, batch_size):
-        batch = companies[i:i + batch_size]
-        batch_num = i // batch_size + 1
+    # 3. Process batches with circuit breaker protection, K batches in flight at once
+    # (their page loads overlap on the pooled crawl4ai crawler: its lock only covers acquisition)
+    parallel_batches = max(1, int(get_crawler_config().processing_config.get("detail_parallel_batches", 3)))
+    semaphore = asyncio.Semaphore(parallel_batches)
+    
+    async def run_one(batch_num: int, batch: list):
+        async with semaphore:
+            # Fail fast: an OPEN breaker would reject the call anyway
+            if breaker.get_state()['state'] == 'OPEN':
+                return batch_num, batch, None, None
+            try:
+                # Use circuit breaker to protect batch crawling
+                return batch_num, batch, await breaker.call_async(detail_crawler.crawl_batch, batch), None
+            except Exception as e:
+                return batch_num, batch, None, e
+    
+    tasks = [
+        asyncio.create_task(run_one(i // batch_size + 1, companies[i:i + batch_size]))
+        for i in range(0, total_companies, batch_size)
+    ]
+    skipped_open = 0
+    for next_done in asyncio.as_completed(tasks):
+        batch_num, batch, batch_results, error = await next_done
         
-        try:
-            # Use circuit breaker to protect batch crawling
-            batch_results = await breaker.call(
-                detail_crawler.crawl_batch,
-                batch
-            )
-            
+        if batch_results is not None:
             processed += batch_results['total']
             successful += batch_results['successful']
             failed += batch_results['failed']
@@ -311,27 +438,20 @@ async def _crawl_detail_pages_with_circuit_breaker_async(detail_crawler, compani
             logger.info(f"Detail batch {batch_num}: {batch_results['successful']}/{batch_results['total']} successful")
             
             # Health check after each batch
-            health = await health_monitor.check_health(detail_crawler.context_manager)
-            if not health.is_healthy:
-                logger.warning(f"Health issues after batch {batch_num}: {health.issues}")
-                await health_monitor.cleanup_if_needed(detail_crawler.context_manager)
-                
-        except Exception as e:
-            logger.error(f"Detail batch {batch_num} failed: {e}")
-            failed += len(batch)
-            processed += len(batch)
-            
-            # Check circuit breaker state
-            breaker_state = breaker.get_state()
-            if breaker_state['state'] == 'OPEN':
-                logger.warning(f"Circuit breaker is OPEN after batch {batch_num} - will fail fast")
-                break  # Stop processing more batches
-            
+            await _ensure_healthy(detail_crawler.context_manager, f"After batch {batch_num}: ", log_ok=False)
             continue
+        
+        failed += len(batch)
+        processed += len(batch)
+        if error is not None:
+            logger.error(f"Detail batch {batch_num} failed: {error}")
+        else:
+            skipped_open += 1
     
-    # 4. Final cleanup
-    await detail_crawler.cleanup()
+    if skipped_open:
+        logger.warning(f"Circuit breaker is OPEN - skipped {skipped_open} detail batches (fail fast)")
     
+    # 4. Browser stays open for the next task on this worker (shared crawler)
     return {
         'status': 'completed',
         'total_companies': total_companies,
@@ -347,30 +467,12 @@ def crawl_detail_pages(self, companies: list, batch_size: int = 10):
     Detail Crawler: Chỉ crawl detail pages và lưu HTML vào database (không extract) - Optimized
     """
     try:
-        config = get_crawler_config()  # Use cached config
-        detail_crawler = DetailCrawler(config)
-        
-        # Solo pool compatible: create new loop for each task
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            # Use circuit breaker and health monitoring for detail crawling
-            result = loop.run_until_complete(
+        # Use circuit breaker and health monitoring for detail crawling
+        with _lease_crawler(get_detail_crawler) as detail_crawler:
+            result = run_async(
                 _crawl_detail_pages_with_circuit_breaker_async(detail_crawler, companies, batch_size)
             )
-            return result
-            
-        finally:
-            # Solo pool cleanup: close loop after task
-            try:
-                # Cleanup crawler resources
-                loop.run_until_complete(detail_crawler.cleanup())
-            except Exception as cleanup_error:
-                logger.warning(f"Cleanup error: {cleanup_error}")
-            finally:
-                # Close loop
-                loop.close()
-                asyncio.set_event_loop(None)
+        return result
             
     except Exception as e:
         logger.error(f"Detail pages crawling failed: {e}")
@@ -389,23 +491,17 @@ def check_worker_health(self):
     Health check task for monitoring worker status
     """
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        health_summary = health_monitor.get_health_summary()
+        circuit_states = dict(circuit_manager.get_all_states())  # Task result phải JSON-serializable
         
-        try:
-            health_summary = health_monitor.get_health_summary()
-            circuit_states = loop.run_until_complete(circuit_manager.get_all_states())
-            
-            logger.info(f"Health check completed: {health_summary}")
-            
-            return {
-                "status": "success",
-                "health": health_summary,
-                "circuit_breakers": circuit_states,
-                "timestamp": time.time()
-            }
-        finally:
-            loop.close()
+        logger.info(f"Health check completed: {health_summary}")
+        
+        return {
+            "status": "success",
+            "health": health_summary,
+            "circuit_breakers": circuit_states,
+            "timestamp": time.time()
+        }
             
     except Exception as e:
         logger.error(f"Health check failed: {e}")
@@ -421,127 +517,107 @@ def crawl_contact_pages_from_details(self, batch_size: int = 50):
     Contact Crawler: Load company_details từ DB → crawl website/facebook (với auto close login) → lưu vào contact_html_storage
     """
     try:
-        config = CrawlerConfig()
-        contact_crawler = ContactCrawler(config)
-        db_manager = DatabaseManager()
+        config = get_crawler_config()  # Use cached config
+        db_manager = get_db_manager()
         
-        # Tạo event loop mới
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        # Get company details từ DB (keyset pagination: id > last_id)
+        batch = db_manager.get_company_details_for_contact_crawl(batch_size)
         
-        try:
-            # Create fresh browser for this task to prevent context errors
-            # Browser will be created automatically by context manager
-            # Get company details từ DB
-            company_details = db_manager.get_company_details_for_contact_crawl(batch_size)
-            
-            if not company_details:
-                return {
-                    'status': 'no_pending',
-                    'message': 'No company details found for contact crawling',
-                    'processed': 0,
-                    'successful': 0,
-                    'failed': 0
-                }
-            
-            total_companies = len(company_details)
-            processed = 0
-            successful = 0
-            failed = 0
-            
-            # Process theo batch với error handling
-            for i in range(0, total_companies, batch_size):
-                batch = company_details[i:i + batch_size]
+        if not batch:
+            return {
+                'status': 'no_pending',
+                'message': 'No company details found for contact crawling',
+                'processed': 0,
+                'successful': 0,
+                'failed': 0
+            }
+        
+        # Time budget per task: keep paging while there is time left so browser startup is amortized
+        deadline = time.monotonic() + config.processing_config.get("contact_task_time_budget", 1800)
+        batch_no = 0
+        processed = 0
+        successful = 0
+        failed = 0
+        last_progress_update = 0.0
+        
+        # Browser của worker đóng khi worker shutdown; lease giữ suốt vòng batch
+        with _lease_crawler(get_contact_crawler) as contact_crawler:
+            # GC stays enabled: worker init raised gen0 threshold (gc.set_threshold(50000, ...)),
+            # so young-generation scans are already rare during batches
+            try:
+                # Process theo page với error handling
+                while batch:
+                    last_id = batch[-1]['id']
+                    batch_no += 1
                 
-                try:
-                    # Memory monitoring
-                    memory_before = psutil.Process().memory_info().rss / 1024 / 1024  # MB
+                    try:
+                        # Crawl contact pages batch
+                        batch_results = run_async(contact_crawler.crawl_batch_from_details(batch))
                     
-                    # Crawl contact pages batch
-                    batch_results = loop.run_until_complete(contact_crawler.crawl_batch_from_details(batch))
+                        processed += batch_results['total']
+                        successful += batch_results['successful']
+                        failed += batch_results['failed']
                     
-                    processed += batch_results['total']
-                    successful += batch_results['successful']
-                    failed += batch_results['failed']
+                        rss_mb = _current_rss_mb()
                     
-                    # Memory cleanup after each batch
-                    memory_after = psutil.Process().memory_info().rss / 1024 / 1024  # MB
-                    gc.collect()  # Force garbage collection
-                    memory_after_gc = psutil.Process().memory_info().rss / 1024 / 1024  # MB
+                        # Update progress (coalesced: at most one backend write per interval)
+                        now = time.monotonic()
+                        if now - last_progress_update >= PROGRESS_UPDATE_INTERVAL_S:
+                            last_progress_update = now
+                            self.update_state(
+                                state='PROGRESS',
+                                meta={
+                                    'current': processed,
+                                    'successful': successful,
+                                    'failed': failed,
+                                    'memory_mb': round(rss_mb, 1),
+                                    'status': f'Crawled contact pages batch {batch_no}'
+                                }
+                            )
                     
-                    # Update progress
-                    self.update_state(
-                        state='PROGRESS',
-                        meta={
-                            'current': processed,
-                            'total': total_companies,
-                            'successful': successful,
-                            'failed': failed,
-                            'memory_mb': round(memory_after_gc, 1),
-                            'status': f'Crawled contact pages batch {i//batch_size + 1}'
-                        }
-                    )
+                        logger.info(f"Contact batch {batch_no}: {batch_results['successful']}/{batch_results['total']} successful, RSS: {rss_mb:.1f}MB")
                     
-                    logger.info(f"Contact batch {i//batch_size + 1}: {batch_results['successful']}/{batch_results['total']} successful, Memory: {memory_before:.1f}MB → {memory_after_gc:.1f}MB")
-                    
-                    # Memory threshold check
-                    if memory_after_gc > 1000:  # 1GB threshold
-                        logger.warning(f"High memory usage: {memory_after_gc:.1f}MB, forcing cleanup")
-                        loop.run_until_complete(contact_crawler.cleanup())
-                        time.sleep(2)
-                        # Browser will be created automatically by context manager
+                        # Memory threshold check: cleanup while current RSS is above the threshold
+                        if rss_mb > MEMORY_CLEANUP_THRESHOLD_MB:
+                            # RSS here is this Python process, not Chromium: recycle + GC, keep the browser
+                            logger.warning(f"High memory usage: {rss_mb:.1f}MB, recycling contexts")
+                            run_async(contact_crawler.recycle_context())
                         
-                except Exception as batch_error:
-                    logger.error(f"Contact batch {i//batch_size + 1} failed: {batch_error}")
-                    failed += len(batch)
-                    processed += len(batch)
-                    
-                    # Force cleanup on error
-                    try:
-                        loop.run_until_complete(contact_crawler.cleanup())
-                        time.sleep(1)
-                        # Browser will be created automatically by context manager
-                    except:
-                        pass
+                    except Exception as batch_error:
+                        logger.error(f"Contact batch {batch_no} failed: {batch_error}")
+                        failed += len(batch)
+                        processed += len(batch)
                     
-                    # Continue with next batch instead of failing entire task
-                    continue
-            
-            # Cleanup
-            loop.run_until_complete(contact_crawler.cleanup())
-            
-            return {
-                'status': 'completed',
-                'total_companies': total_companies,
-                'processed': processed,
-                'successful': successful,
-                'failed': failed,
-                'message': f'Contact pages crawling completed: {successful}/{total_companies} successful'
-            }
-            
-        finally:
-            # Proper cleanup để tránh "Task was destroyed but it is pending"
-            try:
-                # Cancel all pending tasks
-                pending_tasks = [task for task in asyncio.all_tasks(loop) if not task.done()]
-                if pending_tasks:
-                    logger.debug(f"Cancelling {len(pending_tasks)} pending tasks...")
-                    for task in pending_tasks:
-                        task.cancel()
+                        # Critical (browser/connection) errors: full cleanup, browser is recreated on next use.
+                        # Anything else: recycle contexts and keep the browser
+                        try:
+                            if fast_error_check(batch_error)['is_critical']:
+                                run_async(_cleanup_and_settle(contact_crawler, 1))
+                            else:
+                                run_async(contact_crawler.recycle_context())
+                        except:
+                            pass
                     
-                    # Wait for cancellation to complete
-                    if pending_tasks:
-                        loop.run_until_complete(asyncio.gather(*pending_tasks, return_exceptions=True))
+                        # Continue with next page instead of failing entire task
                 
-                # Cleanup crawler resources
-                loop.run_until_complete(contact_crawler.cleanup())
+                    if time.monotonic() >= deadline:
+                        logger.info(f"Contact task time budget reached after {batch_no} batches, remaining companies go to the next task")
+                        break
                 
-            except Exception as cleanup_error:
-                logger.warning(f"Cleanup error: {cleanup_error}")
+                    batch = db_manager.get_company_details_for_contact_crawl(batch_size, after_id=last_id)
             finally:
-                # Close loop properly
-                loop.close()
-                
+                # Full collection mỗi khi task kết thúc (kể cả lỗi): trả bộ nhớ trước task kế tiếp
+                gc.collect()
+        
+        return {
+            'status': 'completed',
+            'total_companies': processed,
+            'processed': processed,
+            'successful': successful,
+            'failed': failed,
+            'message': f'Contact pages crawling completed: {successful}/{processed} successful'
+        }
+            
     except Exception as e:
         logger.error(f"Contact pages crawling failed: {e}")
         return {
@@ -553,14 +629,71 @@ def crawl_contact_pages_from_details(self, batch_size: int = 50):
             'failed': 0
         }
 
+def _extract_shard_count() -> int:
+    """Số shard cho extract tasks (processing.extract_shards, 1 = chạy inline như cũ)"""
+    return max(1, int(get_crawler_config().processing_config.get("extract_shards", 1)))
+
+@celery_app.task(name="extract.aggregate_counts")
+def aggregate_extract_counts(shard_results):
+    """
+    Chord callback: gộp counters từ các extract shard
+    """
+    totals = {'status': 'no_pending', 'processed': 0, 'successful': 0, 'failed': 0, 'shards': len(shard_results)}
+    for result in shard_results:
+        if not result:
+            continue
+        totals['processed'] += result.get('processed', 0)
+        totals['successful'] += result.get('successful', 0)
+        totals['failed'] += result.get('failed', 0)
+        if result.get('status') != 'no_pending':
+            totals['status'] = 'completed'
+    return totals
+
+@celery_app.task(name="detail.extract_from_html_shard")
+def extract_company_details_shard(batch_size: int, shard: int, shard_count: int):
+    """
+    Detail Extractor shard: chỉ xử lý các record có id % shard_count == shard
+    """
+    try:
+        details_extractor = CompanyDetailsExtractor(get_crawler_config(), parser=get_html_parser(), db_manager=get_db_manager())
+        results = details_extractor.extract_from_db_batch(batch_size, shard=shard, shard_count=shard_count)
+        results.pop('details', None)  # Chỉ trả counters cho chord callback
+        return results
+    except Exception as e:
+        logger.error(f"Company details extraction shard {shard}/{shard_count} failed: {e}")
+        return {'status': 'failed', 'message': str(e), 'processed': 0, 'successful': 0, 'failed': 0}
+
+@celery_app.task(name="email.extract_from_contact_shard")
+def extract_emails_from_contact_shard(batch_size: int, shard: int, shard_count: int):
+    """
+    Email Extractor shard: chỉ xử lý các record có id % shard_count == shard
+    """
+    try:
+        email_extractor = EmailExtractor(get_crawler_config(), db_manager=get_db_manager())
+        results = run_async(email_extractor.extract_from_db_batch_async(batch_size, shard=shard, shard_count=shard_count))
+        results.pop('details', None)  # Chỉ trả counters cho chord callback
+        return results
+    except Exception as e:
+        logger.error(f"Email extraction shard {shard}/{shard_count} failed: {e}")
+        return {'status': 'failed', 'message': str(e), 'processed': 0, 'successful': 0, 'failed': 0}
+
 @celery_app.task(name="detail.extract_from_html", bind=True)
 def extract_company_details(self, batch_size: int = 50):
     """
     Detail Extractor: Đọc HTML từ detail_html_storage, chia nhỏ tasks, extract XPath từ config, lưu vào company_details
     """
+    # Fan out thành chord khi extract_shards > 1 (caller vẫn .get() được kết quả đã gộp)
+    shard_count = _extract_shard_count()
+    if shard_count > 1:
+        shard_size = max(1, batch_size // shard_count)
+        return self.replace(chord(
+            group(extract_company_details_shard.s(shard_size, i, shard_count) for i in range(shard_count)),
+            aggregate_extract_counts.s()
+        ))
+    
     try:
-        config = CrawlerConfig()
-        details_extractor = CompanyDetailsExtractor(config)
+        config = get_crawler_config()  # Use cached config
+        details_extractor = CompanyDetailsExtractor(config, parser=get_html_parser(), db_manager=get_db_manager())
         
         # Extract company details from database
         results = details_extractor.extract_from_db_batch(batch_size)
@@ -593,12 +726,21 @@ def extract_emails_from_contact(self, batch_size: int = 50):
     """
     Email Extractor: Load contact_html_storage (chỉ website/facebook) → crawl4ai extract emails → lưu vào email_extraction
     """
+    # Fan out thành chord khi extract_shards > 1 (caller vẫn .get() được kết quả đã gộp)
+    shard_count = _extract_shard_count()
+    if shard_count > 1:
+        shard_size = max(1, batch_size // shard_count)
+        return self.replace(chord(
+            group(extract_emails_from_contact_shard.s(shard_size, i, shard_count) for i in range(shard_count)),
+            aggregate_extract_counts.s()
+        ))
+    
     try:
-        config = CrawlerConfig()
-        email_extractor = EmailExtractor(config)
+        config = get_crawler_config()  # Use cached config
+        email_extractor = EmailExtractor(config, db_manager=get_db_manager())
         
         # Extract emails from database
-        results = email_extractor.extract_from_db_batch(batch_size)
+        results = run_async(email_extractor.extract_from_db_batch_async(batch_size))  # Worker loop, not a new loop per record
         
         # Update progress
         self.update_state(
@@ -629,7 +771,7 @@ def create_final_results():
     Tạo bảng final_results: combine company_details + email_extraction → duplicate rows (max 5 emails)
     """
     try:
-        db_manager = DatabaseManager()
+        db_manager = get_db_manager()
         count = db_manager.create_final_results_with_duplication()
         
         return {
@@ -651,11 +793,10 @@ def get_database_stats():
     Get database statistics
     """
     try:
-        db_manager = DatabaseManager()
+        db_manager = get_db_manager()
         stats = db_manager.get_stats()
         
-        email_extractor = EmailExtractor()
-        summary = email_extractor.get_extraction_summary()
+        summary = EmailExtractor.get_extraction_summary(db_manager=db_manager)
     
         return {
             'status': 'completed',
@@ -669,6 +810,36 @@ def get_database_stats():
             'message': str(e)
         }
 
+# Final CSV columns (order matters)
+EXPORT_COLUMNS = [
+    'industry','company_name','company_url','address','phone','website','facebook',
+    'linkedin','tiktok','youtube','instagram','created_year','revenue','scale',
+    'extracted_email','email_source','confidence_score'
+]
+
+def _export_emails(val) -> list:
+    """extracted_email (JSON array / single email / list) -> tối đa 5 emails, ['N/A'] nếu không có"""
+    try:
+        if isinstance(val, str):
+            if val.startswith('[') and val.endswith(']'):
+                # JSON array format (orjson khi có)
+                emails = json_loads(val)
+            elif val and val != 'N/A':
+                # Single email string
+                emails = [val]
+            else:
+                # Empty or invalid
+                emails = []
+        elif isinstance(val, list):
+            # Already a list
+            emails = val
+        else:
+            # Other types
+            emails = []
+    except Exception:
+        emails = []
+    return emails[:5] if emails else ['N/A']
+
 @celery_app.task(name="final.export", bind=True)
 def export_final_csv(self):
     """
@@ -678,9 +849,9 @@ def export_final_csv(self):
              extracted_email, email_source, confidence_score
     """
     try:
-        config = CrawlerConfig()
+        config = get_crawler_config()  # Use cached config
         output_path = config.output_config.get("final_output", "data/final.csv")
-        db = DatabaseManager()
+        db = get_db_manager()
         
         with db.get_connection() as conn:
             # Debug: Check table counts first
@@ -732,62 +903,38 @@ def export_final_csv(self):
             """
             
             logger.info(f"Executing export query...")
-            df = pd.read_sql_query(query, conn)
-            logger.info(f"Query returned {len(df)} rows")
-            # explode emails if JSON array to one row per email
-            def split_emails(val):
-                try:
-                    if isinstance(val, str):
-                        if val.startswith('[') and val.endswith(']'):
-                            # JSON array format
-                            lst = pd.json.loads(val)
-                        elif val and val != '[]' and val != 'N/A':
-                            # Single email string
-                            lst = [val]
-                        else:
-                            # Empty or invalid
-                            lst = []
-                    elif isinstance(val, list):
-                        # Already a list
-                        lst = val
-                    else:
-                        # Other types
-                        lst = []
-                except Exception:
-                    lst = []
-                return lst
-            # Prepare rows - Split emails and duplicate rows (max 5 emails per company)
-            rows = []
-            for _, r in df.iterrows():
-                emails = split_emails(r['extracted_email'])
-                if not emails:
-                    # No emails found - create single row with N/A
-                    rows.append({**r.to_dict(), 'extracted_email': 'N/A'})
-                else:
-                    # Multiple emails found - create separate row for each email (max 5)
-                    for em in emails[:5]:  # Limit to maximum 5 emails per company
-                        rows.append({**r.to_dict(), 'extracted_email': em})
-            out_df = pd.DataFrame(rows)
-            logger.info(f"After email processing: {len(out_df)} rows")
-            
-            # Ensure columns order
-            cols = [
-                'industry','company_name','company_url','address','phone','website','facebook',
-                'linkedin','tiktok','youtube','instagram','created_year','revenue','scale',
-                'extracted_email','email_source','confidence_score'
-            ]
-            out_df = out_df.reindex(columns=cols)
-            
             # Create output directory if not exists
-            import os
             os.makedirs(os.path.dirname(output_path), exist_ok=True)
             
-            out_df.to_csv(output_path, index=False)
-            logger.info(f"CSV exported to: {output_path} with {len(out_df)} rows")
+            # Stream the join in chunks: only one chunk of df/out_df is alive at a time,
+            # each chunk is appended with to_csv (same quoting/number format as a single to_csv)
+            chunk_size = config.processing_config.get("export_chunk_size", 10000)
+            total_query_rows = 0
+            total_rows = 0
+            with open(output_path, 'w', newline='', encoding='utf-8') as f:
+                # Header luôn được ghi (kể cả khi query không trả về row nào)
+                pd.DataFrame(columns=EXPORT_COLUMNS).to_csv(f, index=False)
+                # Arrow-backed columns: strings stay in Arrow buffers instead of one PyObject per cell
+                for df in pd.read_sql_query(query, conn, dtype_backend='pyarrow', chunksize=chunk_size):
+                    total_query_rows += len(df)
+                    # Split emails and duplicate rows (max 5 emails per company, N/A when none):
+                    # one list per row, then a single vectorized explode - no per-row tuple building
+                    emails = df['extracted_email'].map(_export_emails)
+                    # Ensure columns order
+                    out_df = (
+                        df.assign(extracted_email=emails)
+                        .explode('extracted_email', ignore_index=True)
+                        .reindex(columns=EXPORT_COLUMNS)
+                    )
+                    out_df.to_csv(f, index=False, header=False)
+                    total_rows += len(out_df)
+            
+            logger.info(f"Query returned {total_query_rows} rows")
+            logger.info(f"CSV exported to: {output_path} with {total_rows} rows")
             
         return {
             'status': 'completed',
-            'rows': len(out_df),
+            'rows': total_rows,
             'output': output_path,
             'debug_info': {
                 'company_details_count': company_count,
@@ -1,18 +1,72 @@
 import asyncio
+import os
 import re
+import numpy as np
 import pandas as pd
 import argparse
 import logging
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from typing import List, Optional, Dict
 import phonenumbers
 from phonenumbers import NumberParseException
 
-from app.crawler.async_context_manager import get_context_manager
 from config import CrawlerConfig
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+# Sheet từ PARALLEL_MIN_ROWS dòng trở lên: tách/chuẩn hóa số trên nhiều process
+PARALLEL_MIN_ROWS = 100_000
+PARALLEL_CHUNK_SIZE = 1024
+
+# Cột số điện thoại dùng Arrow string (buffer liền, không phải 1 PyObject mỗi ô; .str.* chạy trong Arrow)
+PHONE_DTYPE = 'string[pyarrow]'
+
+# Regex biên dịch sẵn (dùng lại cho mọi dòng)
+_CLEAN_RE = re.compile(r'[^\d+]')  # Giữ lại chữ số và dấu +
+_WHITESPACE_RE = re.compile(r'\s+')
+_SPLIT_RE = re.compile(r'[;/,\n|\t\-. ]+')  # Ký tự phân tách giữa các số điện thoại
+# Pattern cho pandas .str.* (để dạng string: Arrow kernels không nhận re.Pattern đã compile)
+_FLOAT_SUFFIX_PATTERN = r'\.0$'  # Đuôi ".0" của số Excel lưu dạng float
+_PHONE_COLUMN_PATTERN = r'\d{9,}'  # Cột có chứa số điện thoại (≥ 9 chữ số liền nhau)
+# Số VN hợp lệ sau +84: mã vùng 02 (9 ký tự, bắt đầu bằng 2) hoặc 10 ký tự
+_VN_VALID_PATTERN = r'^\+84(?:2.{8}|.{10})$'
+# Danh sách mã vùng Việt Nam (frozenset: lookup O(1), build một lần)
+_VN_AREA_CODES = frozenset({
+    "032", "033", "034", "035", "036", "037", "038", "039",  # Mobile
+    "052", "055", "056", "058", "059",  # Central
+    "070", "076", "077", "078", "079",  # Mobile
+    "081", "082", "083", "084", "085", "086", "087", "088", "089",  # Mobile
+    "090", "091", "092", "093", "094", "096", "097", "098", "099",  # Mobile
+    "02",  # Hà Nội
+})
+_VN_AREA_CODES_NO_ZERO = frozenset(code[1:] for code in _VN_AREA_CODES)  # Bỏ số 0 đầu
+# Số điện thoại trong text tự do: VN (0 / 84 / +84, mã vùng 02 + 9 số, các mã khác + 8 số)
+# hoặc số quốc tế bắt đầu bằng +; cho phép tối đa 2 ký tự phân tách (space . - ( )) giữa các chữ số
+_PHONE_SEP = r'[\s.\-()]{0,2}'
+_PHONE_RE = re.compile(
+    rf'(?<![\d+])(?:\(?\+?84\)?{_PHONE_SEP}|\(?0)(?:2(?:{_PHONE_SEP}\d){{9}}|[3-9](?:{_PHONE_SEP}\d){{8}})(?!\d)'
+    rf'|(?<![\d+])\+(?!84)\d(?:{_PHONE_SEP}\d){{6,13}}'
+)
+
+
+@lru_cache(maxsize=131072)
+def _parse_format(number: str, region: Optional[str]) -> Optional[str]:
+    """
+    parse + is_valid_number + format_number (cache theo số đã làm sạch, dữ liệu lặp nhiều):
+    - Số E164 nếu hợp lệ
+    - "" nếu parse được nhưng không hợp lệ
+    - None nếu phonenumbers không parse được
+    """
+    try:
+        parsed = phonenumbers.parse(number, region)
+    except NumberParseException:
+        return None
+    if phonenumbers.is_valid_number(parsed):
+        return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
+    return ""
+
 
 def normalize_to_e164(phone_text: str, default_country: str = "VN") -> Optional[str]:
     """Chuẩn hóa số điện thoại theo định dạng E164"""
@@ -24,7 +78,7 @@ def normalize_to_e164(phone_text: str, default_country: str = "VN") -> Optional[
         phone_text = str(int(phone_text))  # Convert to string, remove decimal if any
     
     # Loại bỏ khoảng trắng và ký tự đặc biệt
-    cleaned = re.sub(r'[^\d+]', '', str(phone_text).strip())
+    cleaned = _CLEAN_RE.sub('', str(phone_text).strip())
     
     if not cleaned:
         return None
@@ -38,39 +92,25 @@ def normalize_to_e164(phone_text: str, default_country: str = "VN") -> Optional[
     if len(cleaned) > 10:
         # Nếu không có +, thử thêm + và parse
         if not cleaned.startswith('+'):
-            try:
-                parsed = phonenumbers.parse('+' + cleaned, default_country)
-                if phonenumbers.is_valid_number(parsed):
-                    return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
-            except NumberParseException:
-                pass
+            e164 = _parse_format('+' + cleaned, default_country)
+            if e164:
+                return e164
             # Nếu không parse được, thêm + và giữ nguyên
             return '+' + cleaned
         # Nếu đã có +, parse trực tiếp
         else:
-            try:
-                parsed = phonenumbers.parse(cleaned, default_country)
-                if phonenumbers.is_valid_number(parsed):
-                    return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
-            except NumberParseException:
-                pass
+            e164 = _parse_format(cleaned, default_country)
+            if e164:
+                return e164
             # Nếu không parse được, giữ nguyên
             return cleaned
     
-    try:
-        # Parse số điện thoại
-        parsed = phonenumbers.parse(cleaned, default_country)
-        
-        # Kiểm tra tính hợp lệ
-        if phonenumbers.is_valid_number(parsed):
-            # Trả về định dạng E164
-            return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
-        else:
-            return None
-            
-    except NumberParseException:
+    # Parse số điện thoại: E164 nếu hợp lệ, "" nếu parse được nhưng không hợp lệ
+    e164 = _parse_format(cleaned, default_country)
+    if e164 is None:
         # Nếu không parse được, thử các cách khác
         return fallback_normalize(cleaned, default_country)
+    return e164 or None
 
 
 def fallback_normalize(phone_text: str, default_country: str = "VN") -> Optional[str]:
@@ -79,137 +119,80 @@ def fallback_normalize(phone_text: str, default_country: str = "VN") -> Optional
         return None
     
     # Loại bỏ tất cả ký tự không phải số và dấu +
-    cleaned = re.sub(r'[^\d+]', '', phone_text)
+    cleaned = _CLEAN_RE.sub('', phone_text)
     
     if not cleaned:
         return None
     
     # Xử lý các trường hợp đặc biệt cho số Việt Nam
     if default_country == "VN":
-        # Danh sách mã vùng Việt Nam
-        vn_area_codes = [
-            "032", "033", "034", "035", "036", "037", "038", "039",  # Mobile
-            "052", "055", "056", "058", "059",  # Central
-            "070", "076", "077", "078", "079",  # Mobile
-            "081", "082", "083", "084", "085", "086", "087", "088", "089",  # Mobile
-            "090", "091", "092", "093", "094", "096", "097", "098", "099",  # Mobile
-            "02"  # Hà Nội
-        ]
+        # Chuẩn hóa số điện thoại Việt Nam
+        # Nếu đã có +84, giữ nguyên
+        if cleaned.startswith('+84'):
+            e164 = _parse_format(cleaned, "VN")
+            if e164:
+                return e164
         
-        vn_area_codes_no_zero = [code[1:] for code in vn_area_codes]  # Bỏ số 0 đầu
+        # Nếu bắt đầu bằng 84 (không có +)
+        elif cleaned.startswith('84'):
+            # Kiểm tra mã vùng
+            if len(cleaned) >= 10:
+                area_code = cleaned[2:5]  # Lấy 3 số sau 84
+                if area_code in _VN_AREA_CODES_NO_ZERO:
+                    e164 = _parse_format('+' + cleaned, "VN")
+                    if e164:
+                        return e164
         
-        def normalize_phone_number(phone: str) -> Optional[str]:
-            """Chuẩn hóa số điện thoại Việt Nam"""
-            if not phone:
-                return None
-            
-            # Loại bỏ tất cả ký tự không phải số và dấu +
-            cleaned = re.sub(r'[^\d+]', '', phone)
-            
-            if not cleaned:
-                return None
-            
-            # Nếu đã có +84, giữ nguyên
-            if cleaned.startswith('+84'):
-                try:
-                    parsed = phonenumbers.parse(cleaned, "VN")
-                    if phonenumbers.is_valid_number(parsed):
-                        return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
-                except NumberParseException:
-                    pass
-            
-            # Nếu bắt đầu bằng 84 (không có +)
-            elif cleaned.startswith('84'):
-                # Kiểm tra mã vùng
-                if len(cleaned) >= 10:
-                    area_code = cleaned[2:5]  # Lấy 3 số sau 84
-                    if area_code in vn_area_codes_no_zero:
-                        try:
-                            parsed = phonenumbers.parse('+' + cleaned, "VN")
-                            if phonenumbers.is_valid_number(parsed):
-                                return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
-                        except NumberParseException:
-                            pass
-            
-            # Nếu bắt đầu bằng 0
-            elif cleaned.startswith('0'):
-                if len(cleaned) >= 10:
-                    # Kiểm tra mã vùng 02 (Hà Nội) - cần 8 số sau 02
-                    if cleaned.startswith('02') and len(cleaned) == 11:
-                        try:
-                            parsed = phonenumbers.parse('+84' + cleaned[1:], "VN")
-                            if phonenumbers.is_valid_number(parsed):
-                                return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
-                        except NumberParseException:
-                            pass
-                    # Các mã vùng khác - cần 7 số sau mã vùng
-                    elif len(cleaned) == 10:
-                        area_code = cleaned[:3]
-                        if area_code in vn_area_codes:
-                            try:
-                                parsed = phonenumbers.parse('+84' + cleaned[1:], "VN")
-                                if phonenumbers.is_valid_number(parsed):
-                                    return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
-                            except NumberParseException:
-                                pass
-            
-            return None
+        # Nếu bắt đầu bằng 0
+        elif cleaned.startswith('0'):
+            if len(cleaned) >= 10:
+                # Kiểm tra mã vùng 02 (Hà Nội) - cần 8 số sau 02
+                if cleaned.startswith('02') and len(cleaned) == 11:
+                    e164 = _parse_format('+84' + cleaned[1:], "VN")
+                    if e164:
+                        return e164
+                # Các mã vùng khác - cần 7 số sau mã vùng
+                elif len(cleaned) == 10:
+                    area_code = cleaned[:3]
+                    if area_code in _VN_AREA_CODES:
+                        e164 = _parse_format('+84' + cleaned[1:], "VN")
+                        if e164:
+                            return e164
         
-        return normalize_phone_number(cleaned)
+        return None
     
-    try:
-        parsed = phonenumbers.parse(cleaned, default_country)
-        if phonenumbers.is_valid_number(parsed):
-            return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
-    except NumberParseException:
-        pass
+    e164 = _parse_format(cleaned, default_country)
+    if e164:
+        return e164
     
     return None
 
 
+def _to_text_series(s: pd.Series) -> pd.Series:
+    """
+    Convert cả cột Excel sang text một lần (thay vì isinstance + str(int(...)) từng giá trị):
+    - Cột number: bỏ phần thập phân (Excel thường lưu số điện thoại dạng float)
+    - Cột text/mixed: giữ nguyên text, bỏ đuôi ".0" của các số float
+    - NaN -> ""
+    """
+    if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+        return np.trunc(s.astype('float64')).astype('Int64').astype(PHONE_DTYPE).fillna('')
+    return s.astype(PHONE_DTYPE).fillna('').str.replace(_FLOAT_SUFFIX_PATTERN, '', regex=True)
+
+
 def split_phone_numbers(phone_text: str) -> List[str]:
     """Tách các số điện thoại từ text, trả về danh sách các số đã chuẩn hóa"""
     if not phone_text:
         return []
     
-    # Convert number to text if needed (Excel often stores numbers as number type)
-    if isinstance(phone_text, (int, float)):
-        phone_text = str(int(phone_text))  # Convert to string, remove decimal if any
+    # Bước 1: Tách theo mọi ký tự phân tách (; / , \n | \t - . space) bằng một regex
+    # Bước 2: Remove whitespace còn sót trong từng số, bỏ token rỗng
+    cleaned_phones = [
+        cleaned for cleaned in (_WHITESPACE_RE.sub('', token) for token in _SPLIT_RE.split(phone_text))
+        if cleaned
+    ]
     
-    # Bước 1: Tách theo ký tự phân tách chính (ưu tiên ;, /)
-    primary_separators = [';', '/', ',', '\n', '|']
-    phones = [phone_text]
-    for sep in primary_separators:
-        new_phones = []
-        for phone in phones:
-            new_phones.extend([p.strip() for p in phone.split(sep) if p.strip()])
-        phones = new_phones
-    
-    # Bước 2: Tách theo ký tự phân tách phụ (ưu tiên cao)
-    secondary_separators = ['\t', '-', '.']
-    for sep in secondary_separators:
-        new_phones = []
-        for phone in phones:
-            new_phones.extend([p.strip() for p in phone.split(sep) if p.strip()])
-        phones = new_phones
-    
-    # Bước 3: Tách theo space và \n (ưu tiên thấp nhất)
-    final_separators = [' ']
-    for sep in final_separators:
-        new_phones = []
-        for phone in phones:
-            new_phones.extend([p.strip() for p in phone.split(sep) if p.strip()])
-        phones = new_phones
-    
-    # Bước 4: Remove space trong từng số điện thoại
-    cleaned_phones = []
-    for phone in phones:
-        # Remove space trong số điện thoại
-        cleaned_phone = re.sub(r'\s+', '', phone)
-        if cleaned_phone:
-            cleaned_phones.append(cleaned_phone)
-    
-    # Bước 5: Chuẩn hóa từng số
+    # Bước 3: Chuẩn hóa từng số
     normalized_phones = []
     for phone in cleaned_phones:
         normalized = normalize_phone_with_validation(phone)
@@ -219,6 +202,7 @@ def split_phone_numbers(phone_text: str) -> List[str]:
     return normalized_phones
 
 
+@lru_cache(maxsize=131072)
 def normalize_phone_with_validation(phone: str) -> Optional[str]:
     """
     Chuẩn hóa số điện thoại với validation cải tiến:
@@ -230,12 +214,8 @@ def normalize_phone_with_validation(phone: str) -> Optional[str]:
     if not phone:
         return None
     
-    # Convert number to text if needed (Excel often stores numbers as number type)
-    if isinstance(phone, (int, float)):
-        phone = str(int(phone))  # Convert to string, remove decimal if any
-    
-    # Loại bỏ khoảng trắng và ký tự đặc biệt
-    cleaned = re.sub(r'[^\d+]', '', str(phone).strip())
+    # Loại bỏ khoảng trắng và ký tự đặc biệt (input là text: cột số đã được _to_text_series convert)
+    cleaned = _CLEAN_RE.sub('', phone.strip())
     
     if not cleaned:
         return None
@@ -249,261 +229,140 @@ def normalize_phone_with_validation(phone: str) -> Optional[str]:
     if len(cleaned) > 10:
         # Nếu không có +, thử thêm + và parse
         if not cleaned.startswith('+'):
-            try:
-                parsed = phonenumbers.parse('+' + cleaned, None)
-                if phonenumbers.is_valid_number(parsed):
-                    return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
-            except NumberParseException:
-                pass
+            e164 = _parse_format('+' + cleaned, None)
+            if e164:
+                return e164
             # Nếu không parse được, thêm + và giữ nguyên
             return '+' + cleaned
         # Nếu đã có +, parse trực tiếp
         else:
-            try:
-                parsed = phonenumbers.parse(cleaned, None)
-                if phonenumbers.is_valid_number(parsed):
-                    return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
-            except NumberParseException:
-                pass
+            e164 = _parse_format(cleaned, None)
+            if e164:
+                return e164
             # Nếu không parse được, giữ nguyên
             return cleaned
     
     # Nếu đã có +84 (số Việt Nam)
     if cleaned.startswith('+84'):
-        try:
-            parsed = phonenumbers.parse(cleaned, "VN")
-            if phonenumbers.is_valid_number(parsed):
-                return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
-        except NumberParseException:
-            pass
+        e164 = _parse_format(cleaned, "VN")
+        if e164:
+            return e164
     
     # Nếu bắt đầu bằng 84 (không có +)
     elif cleaned.startswith('84'):
         if len(cleaned) >= 10:
-            try:
-                parsed = phonenumbers.parse('+' + cleaned, "VN")
-                if phonenumbers.is_valid_number(parsed):
-                    return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
-            except NumberParseException:
-                pass
+            e164 = _parse_format('+' + cleaned, "VN")
+            if e164:
+                return e164
     
     # Nếu bắt đầu bằng 0 (số Việt Nam)
     elif cleaned.startswith('0'):
         if len(cleaned) >= 10:
-            try:
-                parsed = phonenumbers.parse('+84' + cleaned[1:], "VN")
-                if phonenumbers.is_valid_number(parsed):
-                    return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
-            except NumberParseException:
-                pass
+            e164 = _parse_format('+84' + cleaned[1:], "VN")
+            if e164:
+                return e164
     
     # Số quốc tế khác (giữ nguyên nếu hợp lệ)
     elif cleaned.startswith('+'):
-        try:
-            # Thử parse với country code mặc định
-            parsed = phonenumbers.parse(cleaned, None)
-            if phonenumbers.is_valid_number(parsed):
-                return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
-        except NumberParseException:
-            pass
+        # Thử parse với country code mặc định
+        e164 = _parse_format(cleaned, None)
+        if e164:
+            return e164
     
-    # Fallback: thử normalize với logic cũ
-    return fallback_normalize(cleaned, "VN")
+    # Không gọi fallback_normalize: với số ≤ 10 ký tự, mọi nhánh parse của nó (+84 / 84 / 0)
+    # trùng với các lần parse ở trên (cùng input, cùng region) nên kết quả luôn là None
+    return None
 
 
-def split_multiple_phones_to_rows(df: pd.DataFrame, phone_column: str) -> pd.DataFrame:
+def is_valid_international_phone(phone: str) -> bool:
+    """Số quốc tế (không phải +84): hợp lệ nếu phonenumbers parse được và đúng format E164"""
+    return bool(_parse_format(phone, None))
+
+
+def split_phone_column(texts: List[str]) -> List[List[str]]:
     """
-    Tách các dòng có nhiều số điện thoại thành nhiều dòng riêng biệt
-    Mỗi dòng chỉ chứa 1 số điện thoại
+    split_phone_numbers cho cả cột; sheet lớn (≥ PARALLEL_MIN_ROWS dòng) chạy trên process pool
+    (libphonenumber là CPU-bound Python, mỗi worker có lru_cache riêng)
     """
-    logger.info(f"=== TÁCH CÁC DÒNG CÓ NHIỀU SỐ ĐIỆN THOẠI ===")
-    
-    new_rows = []
-    split_count = 0
-    
-    for idx, row in df.iterrows():
-        phone_text = str(row[phone_column]) if pd.notna(row[phone_column]) else ""
-        
-        if phone_text and phone_text.strip():
-            # Tách các số điện thoại
-            phones = split_phone_numbers(phone_text)
-            
-            if len(phones) > 1:
-                # Nếu có nhiều số, tạo nhiều dòng
-                split_count += len(phones) - 1
-                for phone in phones:
-                    new_row = row.copy()
-                    new_row[phone_column] = phone
-                    new_rows.append(new_row)
-            elif len(phones) == 1:
-                # Nếu chỉ có 1 số, giữ nguyên
-                new_row = row.copy()
-                new_row[phone_column] = phones[0]
-                new_rows.append(new_row)
-            else:
-                # Nếu không có số hợp lệ, giữ nguyên dòng với giá trị rỗng
-                new_row = row.copy()
-                new_row[phone_column] = ""
-                new_rows.append(new_row)
-        else:
-            # Nếu không có text, giữ nguyên dòng
-            new_row = row.copy()
-            new_row[phone_column] = ""
-            new_rows.append(new_row)
-    
-    result_df = pd.DataFrame(new_rows)
-    logger.info(f"Đã tách {split_count} dòng thành {len(result_df)} dòng")
-    
-    return result_df
+    if len(texts) < PARALLEL_MIN_ROWS or (os.cpu_count() or 1) < 2:
+        return [split_phone_numbers(text) for text in texts]
+    with ProcessPoolExecutor() as pool:
+        return list(pool.map(split_phone_numbers, texts, chunksize=PARALLEL_CHUNK_SIZE))
 
 
 def preprocess_excel_data(df: pd.DataFrame, phone_column: str = None) -> pd.DataFrame:
     """
-    Bước 1: Preprocess - tách số điện thoại và tạo cột phone
-    Mỗi dòng chỉ chứa 1 số điện thoại đã chuẩn hóa
+    Bước 1: Preprocess - tách số điện thoại và tạo cột phone_list
+    Mỗi dòng giữ nguyên, phone_list chứa danh sách số đã chuẩn hóa (explode ở bước 3)
     """
     logger.info("=== BƯỚC 1: PREPROCESS - TÁCH SỐ ĐIỆN THOẠI ===")
     
     # Tìm cột chứa số điện thoại
     if phone_column is None:
-        # Tìm cột đầu tiên có chứa số điện thoại
-        for col in df.columns:
-            sample_values = df[col].dropna().head(10)
-            # Kiểm tra cả string và number
-            if any(re.search(r'\d{9,}', str(val)) for val in sample_values):
-                phone_column = col
-                break
+        # Tìm cột đầu tiên có chứa số điện thoại (10 giá trị non-null đầu tiên, cả string và number)
+        has_phone = df.apply(
+            lambda col: col.dropna().head(10).astype(str).str.contains(_PHONE_COLUMN_PATTERN, regex=True).any()
+        ).astype(bool)
+        if has_phone.any():
+            phone_column = has_phone.idxmax()
     
     if phone_column is None:
         raise ValueError("Không tìm thấy cột chứa số điện thoại")
     
     logger.info(f"Sử dụng cột: {phone_column}")
     
-    # Tạo cột phone từ cột gốc - xử lý cả number và text
-    def convert_to_text(value):
-        if pd.isna(value):
-            return ""
-        # Convert number to text if needed
-        if isinstance(value, (int, float)):
-            return str(int(value))  # Remove decimal if any
-        return str(value)
-    
-    df['phone'] = df[phone_column].apply(convert_to_text)
+    # Text số điện thoại từ cột gốc - xử lý cả number và text (convert cả cột một lần)
+    phone_text = _to_text_series(df[phone_column])
     
-    # Tách các dòng có nhiều số điện thoại thành nhiều dòng
-    result_df = split_multiple_phones_to_rows(df, 'phone')
+    # Tách số nhưng chưa explode: bước extract chạy trên frame gọn (1 dòng gốc = 1 lần extract)
+    df['phone_list'] = split_phone_column(phone_text.tolist())
     
-    logger.info(f"Đã tách thành {len(result_df)} dòng (từ {len(df)} dòng gốc)")
+    total_phones = sum(len(phones) for phones in df['phone_list'])
+    logger.info(f"Đã tách {total_phones} số điện thoại từ {len(df)} dòng gốc")
     
-    return result_df
+    return df
+
+
+def extract_phones_from_text(text: str) -> str:
+    """Tìm số điện thoại trong text tự do, trả về các số E164 nối bằng "; " """
+    phones = []
+    for match in _PHONE_RE.findall(text):
+        cleaned = _CLEAN_RE.sub('', match)
+        # Số VN (0xx / 84xx) -> +84 trước khi chuẩn hóa
+        if cleaned.startswith('0'):
+            cleaned = '+84' + cleaned[1:]
+        elif cleaned.startswith('84'):
+            cleaned = '+' + cleaned
+        normalized = normalize_phone_with_validation(cleaned)
+        if normalized:
+            phones.append(normalized)
+    return "; ".join(phones)
 
 
 async def extract_phones_with_crawl4ai(df: pd.DataFrame, batch_size: int = 50) -> pd.DataFrame:
     """
-    Bước 2: Crawl4AI Extract - extract thêm số điện thoại từ text gốc
+    Bước 2: Extract thêm số điện thoại từ text gốc bằng regex (_PHONE_RE)
+    Giữ tên/signature async cũ để tương thích; batch_size không còn dùng
     """
-    logger.info("=== BƯỚC 2: CRAWL4AI EXTRACT ===")
+    logger.info("=== BƯỚC 2: REGEX EXTRACT ===")
     
     # Tìm cột gốc chứa text
     original_column = None
     for col in df.columns:
-        if col != 'phone' and df[col].dtype == 'object':
+        if col not in ('phone', 'phone_list') and pd.api.types.is_string_dtype(df[col].dtype):
             original_column = col
             break
     
     if original_column is None:
         logger.warning("Không tìm thấy cột gốc để extract")
+        df['extracted_phone'] = pd.Series("", index=df.index, dtype=PHONE_DTYPE)
         return df
     
-    # Query để extract số điện thoại
-    phone_query = """
-    Extract ALL phone numbers from the text. 
-    For Vietnamese numbers:
-    - Starting with 0, 84, or +84: convert to +84 E164 format
-    - Valid area codes: 032, 033, 034, 035, 036, 037, 038, 039, 052, 055, 056, 058, 059, 070, 076, 077, 078, 079, 081, 082, 083, 084, 085, 086, 087, 088, 089, 090, 091, 092, 093, 094, 096, 097, 098, 099, 02
-    - 02 area code needs 8 digits after it, others need 7 digits
-    For international numbers:
-    - Starting with +: keep as is if valid E164 format
-    - Longer than 10 digits (not starting with 01): try to format as E164 with common country codes (82, 86, 1, 44, 33, 49, 81, 65, 60, 66)
-    - Do not convert international numbers to Vietnamese format
-    Remove spaces, dashes, parentheses.
-    Separate multiple numbers with semicolon (;).
-    """
-    
-    context_manager = get_context_manager()
-    crawler_id = f"phone_extractor_{asyncio.current_task().get_name()}"
-    user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-    viewport = {"width": 1920, "height": 1080}
-    
-    async def process_single_row(row_data):
-        idx, row = row_data
-        phone_text = str(row[original_column]) if pd.notna(row[original_column]) else ""
-        
-        if not phone_text or phone_text.strip() == "":
-            return idx, ""
-        
-        try:
-            # Dùng Crawl4AI để extract
-            async with context_manager.get_crawl4ai_crawler(crawler_id, user_agent, viewport) as crawler:
-                result = await crawler.arun(
-                    url="raw:" + phone_text,
-                    word_count_threshold=1,
-                    extraction_strategy=phone_query,
-                    bypass_cache=False,
-                    wait_for="domcontentloaded",
-                    delay_before_return_html=0.1
-                )
-                
-                if result and result.extracted_content:
-                    # Extract và normalize phones theo E164
-                    extracted_phones = []
-                    for line in result.extracted_content.split('\n'):
-                        line = line.strip()
-                        if line:
-                            normalized = normalize_phone_with_validation(line)
-                            if normalized:
-                                extracted_phones.append(normalized)
-                    
-                    return idx, "; ".join(extracted_phones)
-                else:
-                    return idx, ""
-                    
-        except Exception as e:
-            logger.warning(f"Failed to process row {idx}: {e}")
-            return idx, ""
-    
-    # Xử lý theo batch
-    semaphore = asyncio.Semaphore(10)  # Concurrent processing
-    
-    async def process_with_semaphore(row_data):
-        async with semaphore:
-            return await process_single_row(row_data)
-    
-    # Tạo cột extracted_phone
-    df['extracted_phone'] = ""
-    
-    for i in range(0, len(df), batch_size):
-        batch_end = min(i + batch_size, len(df))
-        batch_df = df.iloc[i:batch_end]
-        
-        # Tạo tasks cho batch hiện tại
-        tasks = [process_with_semaphore((idx, row)) for idx, row in batch_df.iterrows()]
-        
-        # Chạy song song tất cả tasks trong batch
-        batch_results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # Cập nhật cột extracted_phone
-        for result in batch_results:
-            if isinstance(result, Exception):
-                logger.warning(f"Batch processing error: {result}")
-                continue
-            
-            idx, extracted_phones = result
-            df.at[idx, 'extracted_phone'] = extracted_phones
-        
-        logger.info(f"Processed batch {i//batch_size + 1}/{(len(df)-1)//batch_size + 1}")
+    # Regex pass trên text gốc (không cần browser): mỗi match được chuẩn hóa E164
+    texts = df[original_column].astype(PHONE_DTYPE).fillna('')
+    df['extracted_phone'] = pd.array([extract_phones_from_text(text) for text in texts], dtype=PHONE_DTYPE)
     
-    logger.info("Hoàn thành Crawl4AI extraction")
+    logger.info("Hoàn thành regex extraction")
     return df
 
 
@@ -513,63 +372,38 @@ def create_final_phone_column(df: pd.DataFrame) -> pd.DataFrame:
     """
     logger.info("=== BƯỚC 3: TẠO FINAL_PHONE VÀ SPLIT ===")
     
-    def is_valid_phone(phone: str) -> bool:
-        """
-        Kiểm tra tính hợp lệ của số điện thoại:
-        - Số Việt Nam: validate độ dài theo quy tắc VN
-        - Số quốc tế: giữ nguyên nếu có format E164 hợp lệ
-        """
-        if not phone:
-            return False
-        
-        # Số Việt Nam (+84)
-        if phone.startswith('+84'):
-            # Bỏ +84, lấy phần còn lại
-            number_part = phone[3:]
-            
-            # Kiểm tra độ dài cho số VN
-            if len(number_part) == 9:  # 02 area code (8 digits + 1)
-                return number_part.startswith('2')
-            elif len(number_part) == 10:  # Other area codes (7 digits + 3)
-                return True
-            
-            return False
-        
-        # Số quốc tế khác - giữ nguyên nếu có format E164 hợp lệ
-        else:
-            try:
-                parsed = phonenumbers.parse(phone, None)
-                return phonenumbers.is_valid_number(parsed)
-            except NumberParseException:
-                return False
-        
-        return False
-    
-    # Tạo cột final_phone_source để chứa nguồn số điện thoại
-    df['final_phone_source'] = ""
-    
-    for idx, row in df.iterrows():
-        # Ưu tiên cột phone nếu có, nếu không thì dùng extracted_phone
-        primary_phone = row['phone'] if pd.notna(row['phone']) and str(row['phone']).strip() else ""
-        extracted_phone = row['extracted_phone'] if pd.notna(row['extracted_phone']) and str(row['extracted_phone']).strip() else ""
-        
-        # Chọn nguồn số điện thoại chính
-        if primary_phone:
-            phone_source = primary_phone
-        elif extracted_phone:
-            phone_source = extracted_phone
+    # Chọn nguồn số điện thoại: ưu tiên phone_list nếu có, nếu không thì tách extracted_phone
+    # (phone_list đã được tách ở bước 1; extracted_phone là các số E164 nối bằng "; " ở bước 2
+    #  -> chỉ cần split theo ";", không tokenize/chuẩn hóa lại)
+    extracted_phone = df['extracted_phone'].astype(PHONE_DTYPE).fillna('')
+    phone_rows = []
+    source_rows = []
+    for phones, extracted in zip(df['phone_list'], extracted_phone):
+        if phones:
+            phone_rows.append(phones)
+            source_rows.append(phones)
         else:
-            phone_source = ""
-        
-        df.at[idx, 'final_phone_source'] = phone_source
-    
-    # Tách các dòng có nhiều số điện thoại trong final_phone_source
-    result_df = split_multiple_phones_to_rows(df, 'final_phone_source')
+            # Giữ dòng kể cả khi không có số hợp lệ (giá trị rỗng)
+            sources = [p for p in (part.strip() for part in extracted.split(';')) if p] or [""]
+            phone_rows.append([""] * len(sources))
+            source_rows.append(sources)
+    
+    # Explode một lần duy nhất: mỗi dòng chỉ chứa 1 số điện thoại
+    df['phone_list'] = phone_rows
+    df['final_phone_source'] = source_rows
+    result_df = df.rename(columns={'phone_list': 'phone'}).explode(['phone', 'final_phone_source'], ignore_index=True)
+    logger.info(f"Đã tách thành {len(result_df)} dòng (từ {len(df)} dòng gốc)")
     
-    # Tạo cột final_phone từ final_phone_source đã được split
-    result_df['final_phone'] = result_df['final_phone_source'].apply(
-        lambda x: x if is_valid_phone(x) else ""
-    )
+    # Tạo cột final_phone từ final_phone_source đã được explode:
+    # - Số Việt Nam (+84): validate độ dài bằng regex (vectorized)
+    # - Số quốc tế khác: chỉ parse bằng phonenumbers cho các số bắt đầu bằng +
+    result_df['phone'] = result_df['phone'].astype(PHONE_DTYPE)
+    source = result_df['final_phone_source'].astype(PHONE_DTYPE).fillna('')
+    fast = source.str.match(_VN_VALID_PATTERN, na=False)
+    slow = ~source.str.startswith('+84') & source.str.startswith('+')
+    result_df['final_phone'] = source.where(fast, '')
+    if slow.any():
+        result_df.loc[slow, 'final_phone'] = source[slow].map(lambda x: x if is_valid_international_phone(x) else '')
     
     # Xóa cột tạm
     result_df = result_df.drop('final_phone_source', axis=1)
@@ -582,9 +416,9 @@ def create_final_phone_column(df: pd.DataFrame) -> pd.DataFrame:
 async def process_excel_e164(input_file: str, output_file: str = None, phone_column: str = None):
     """
     Xử lý file Excel theo 3 bước:
-    1. Preprocess: tách số điện thoại và tạo cột phone (split các dòng có nhiều số)
-    2. Crawl4AI Extract: extract thêm số từ text gốc
-    3. Create Final Phone: tạo cột final_phone và split lại thành nhiều dòng
+    1. Preprocess: tách số điện thoại thành cột phone_list (chưa split dòng)
+    2. Extract: extract thêm số từ text gốc bằng regex (mỗi dòng gốc 1 lần)
+    3. Create Final Phone: tạo cột final_phone và split thành nhiều dòng (explode 1 lần)
     """
     logger.info(f"Bắt đầu xử lý file: {input_file}")
     
@@ -599,7 +433,7 @@ async def process_excel_e164(input_file: str, output_file: str = None, phone_col
     # Bước 1: Preprocess
     df = preprocess_excel_data(df, phone_column)
     
-    # Bước 2: Crawl4AI Extract
+    # Bước 2: Extract
     df = await extract_phones_with_crawl4ai(df)
     
     # Bước 3: Create Final Phone
@@ -627,7 +461,7 @@ async def main():
     parser.add_argument("input_file", help="Đường dẫn file Excel đầu vào")
     parser.add_argument("-o", "--output", help="Đường dẫn file Excel đầu ra")
     parser.add_argument("-c", "--column", help="Tên cột chứa số điện thoại")
-    parser.add_argument("-b", "--batch-size", type=int, default=50, help="Kích thước batch cho Crawl4AI")
+    parser.add_argument("-b", "--batch-size", type=int, default=50, help="(không còn dùng, giữ để tương thích)")
     
     args = parser.parse_args()
     
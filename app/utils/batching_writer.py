@@ -1,36 +1,28 @@
 import os, csv
 from typing import List, Dict, Any
 
+# fdatasync: chỉ flush data (bỏ metadata); macOS không có -> fsync
+_fdatasync = getattr(os, "fdatasync", os.fsync)
 
-def safe_append_rows_csv(path: str, rows: List[Dict[str, Any]], fieldnames: List[str]):
+# Write buffer cho CSV append (1 MiB): rows được gom lại và ghi bằng ít syscall
+CSV_APPEND_BUFFER_SIZE = 1 << 20
+
+
+def safe_append_rows_csv(path: str, rows: List[Dict[str, Any]], fieldnames: List[str], durable: bool = False):
+    """Append rows vào CSV; durable=True -> fdatasync trước khi return (mặc định để OS flush)"""
     os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
-    file_exists = os.path.exists(path)
-    tmp_path = path + ".tmp"
+    # Header chỉ ghi khi file mới (hoặc rỗng)
+    write_header = not os.path.exists(path) or os.path.getsize(path) == 0
 
-    with open(tmp_path, "w", newline="", encoding="utf-8-sig") as ftmp:
-        writer = csv.DictWriter(ftmp, fieldnames=fieldnames, extrasaction="ignore")
-        if not file_exists:
+    # Append trực tiếp (O_APPEND) thay vì ghi file .tmp rồi copy lại
+    with open(path, "a", newline="", encoding="utf-8-sig", buffering=CSV_APPEND_BUFFER_SIZE) as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
+        if write_header:
             writer.writeheader()
-        for r in rows:
-            writer.writerow(
-                {k: ("" if r.get(k) is None else r.get(k)) for k in fieldnames}
-            )
-        ftmp.flush()
-        os.fsync(ftmp.fileno())
-
-    mode = "a" if file_exists else "w"
+        writer.writerows(
+            {k: ("" if r.get(k) is None else r.get(k)) for k in fieldnames} for r in rows
+        )
+        if durable:
+            f.flush()
+            _fdatasync(f.fileno())
 
-    with (
-        open(path, mode, newline="", encoding="utf-8-sig") as fout,
-        open(tmp_path, "r", encoding="utf-8-sig") as fin,
-    ):
-        if file_exists:
-            fin.readline()
-        for line in fin:
-            fout.write(line)
-        fout.flush()
-        os.fsync(fout.fileno())
-    try:
-        os.remove(tmp_path)
-    except Exception:
-        pass
@@ -2,9 +2,9 @@ import asyncio
 import time
 import logging
 from enum import IntEnum
-from typing import Callable, Any, Optional
+from types import MappingProxyType
+from typing import Callable, Any, Mapping
 from threading import Lock
-import weakref
 
 logger = logging.getLogger(__name__)
 
@@ -13,11 +13,29 @@ class CircuitState(IntEnum):
     OPEN = 1        # Circuit is open, failing fast
     HALF_OPEN = 2   # Testing if service is back
 
+# CircuitState value -> name (tuple index instead of enum attribute lookup)
+_STATE_NAMES = tuple(state.name for state in CircuitState)
+_STATES = tuple(CircuitState)
+
+# CircuitBreaker._flags layout: bits 0-1 = CircuitState, bit 2 = failures recorded since last success.
+# _flags == 0 <=> CLOSED with nothing to reset (single compare on the hot path)
+_STATE_MASK = 0b11
+_FAILED_BIT = 1 << 2
+
+class CircuitBreakerOpenError(Exception):
+    """Raised when a call is rejected because the breaker is OPEN"""
+
 class CircuitBreaker:
     """
     Optimized circuit breaker pattern implementation for preventing cascading failures
     """
     
+    # No per-instance __dict__: smaller long-lived breakers, faster hot attribute loads
+    __slots__ = (
+        "failure_threshold", "recovery_timeout", "_recovery_timeout_ns", "expected_exception",
+        "name", "failure_count", "last_failure_time", "_open_until_ns", "_flags", "_lock", "_open_msg",
+    )
+    
     def __init__(
         self, 
         failure_threshold: int = 5,
@@ -27,102 +45,130 @@ class CircuitBreaker:
     ):
         self.failure_threshold = failure_threshold
         self.recovery_timeout = recovery_timeout
+        self._recovery_timeout_ns = int(recovery_timeout * 1_000_000_000)
         self.expected_exception = expected_exception
         self.name = name
         
         self.failure_count = 0
-        self.last_failure_time = 0.0  # Use float for faster comparison
-        self.state = CircuitState.CLOSED
+        self.last_failure_time = 0.0  # Wall clock, only for get_state() reporting
+        self._open_until_ns = 0  # Monotonic ns deadline of the OPEN window (immune to NTP/clock steps)
+        self._flags = CircuitState.CLOSED  # State + _FAILED_BIT, packed in one int
+        # Message formatted once; each fast-fail raises a fresh exception (a shared instance
+        # raised from several threads/coroutines would race on __traceback__/__context__)
+        self._open_msg = f"CircuitBreaker '{name}' is OPEN - failing fast"
         self._lock = Lock()  # Use threading.Lock for better performance
         
-        # Cache for faster state checks
-        self._state_cache = {
-            "name": name,
-            "state": "CLOSED",
-            "failure_count": 0,
-            "failure_threshold": failure_threshold,
-            "last_failure_time": None,
-            "recovery_timeout": recovery_timeout
-        }
-        
         # Only log in debug mode to reduce overhead
         if logger.isEnabledFor(logging.DEBUG):
-            logger.debug(f"CircuitBreaker '{name}' initialized: threshold={failure_threshold}, timeout={recovery_timeout}s")
+            logger.debug("CircuitBreaker '%s' initialized: threshold=%s, timeout=%ss", name, failure_threshold, recovery_timeout)
+    
+    def call_sync(self, func: Callable, *args, **kwargs) -> Any:
+        """Execute a regular (non-coroutine) function with circuit breaker protection"""
+        # Fast path: CLOSED needs no lock (attribute reads are atomic); OPEN fails fast
+        if self._flags & _STATE_MASK:
+            self._admit()
+        
+        try:
+            result = func(*args, **kwargs)
+        except self.expected_exception:
+            with self._lock:
+                self._record_failure()
+            raise
+        
+        # Steady state (CLOSED, no failures): nothing to reset -> no lock, no writes
+        if self._flags:
+            self._record_success()
+        return result
+    
+    async def call_async(self, func: Callable, *args, **kwargs) -> Any:
+        """Await a coroutine function with circuit breaker protection"""
+        if self._flags & _STATE_MASK:
+            self._admit()
+        
+        try:
+            result = await func(*args, **kwargs)
+        except self.expected_exception:
+            with self._lock:
+                self._record_failure()
+            raise
+        
+        if self._flags:
+            self._record_success()
+        return result
     
     async def call(self, func: Callable, *args, **kwargs) -> Any:
         """
-        Optimized execute function with circuit breaker protection
+        Deprecated: dispatches on the function type per call - use call_sync()/call_async()
         """
-        # Fast path: check state without lock first
-        if self.state == CircuitState.OPEN:
-            if not self._should_attempt_reset():
-                raise Exception(f"CircuitBreaker '{self.name}' is OPEN - failing fast")
+        if asyncio.iscoroutinefunction(func):
+            return await self.call_async(func, *args, **kwargs)
+        return self.call_sync(func, *args, **kwargs)
+    
+    def _admit(self):
+        """Slow path (not CLOSED): fail fast while OPEN, or move OPEN -> HALF_OPEN once the timeout passed"""
+        if self._flags & _STATE_MASK == CircuitState.OPEN and time.monotonic_ns() < self._open_until_ns:
+            raise CircuitBreakerOpenError(self._open_msg)
         
-        # Use threading lock for better performance
+        # Lock only guards state transitions, never held across the await
+        # (coroutines sharing this breaker on one loop thread would deadlock)
         with self._lock:
-            if self.state == CircuitState.OPEN:
+            if self._flags & _STATE_MASK == CircuitState.OPEN:
                 if self._should_attempt_reset():
-                    self.state = CircuitState.HALF_OPEN
-                    self._update_cache()
+                    self._flags = (self._flags & ~_STATE_MASK) | CircuitState.HALF_OPEN
                     if logger.isEnabledFor(logging.DEBUG):
-                        logger.debug(f"CircuitBreaker '{self.name}' transitioning to HALF_OPEN")
+                        logger.debug("CircuitBreaker '%s' transitioning to HALF_OPEN", self.name)
                 else:
-                    raise Exception(f"CircuitBreaker '{self.name}' is OPEN - failing fast")
+                    raise CircuitBreakerOpenError(self._open_msg)
+    
+    def _record_success(self):
+        """Success after failures / in HALF_OPEN - reset failure count"""
+        with self._lock:
+            if self._flags & _STATE_MASK == CircuitState.HALF_OPEN:
+                self._flags = CircuitState.CLOSED
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("CircuitBreaker '%s' transitioning to CLOSED", self.name)
             
-            try:
-                # Execute the function
-                if asyncio.iscoroutinefunction(func):
-                    result = await func(*args, **kwargs)
-                else:
-                    result = func(*args, **kwargs)
-                
-                # Success - reset failure count
-                if self.state == CircuitState.HALF_OPEN:
-                    self.state = CircuitState.CLOSED
-                    self._update_cache()
-                    if logger.isEnabledFor(logging.DEBUG):
-                        logger.debug(f"CircuitBreaker '{self.name}' transitioning to CLOSED")
-                
-                self.failure_count = 0
-                self._update_cache()
-                return result
-                
-            except self.expected_exception as e:
-                self._record_failure()
-                raise e
+            self._flags &= ~_FAILED_BIT
+            self.failure_count = 0
     
     def _record_failure(self):
         """Optimized record a failure and update circuit state"""
         self.failure_count += 1
         self.last_failure_time = time.time()
+        self._flags |= _FAILED_BIT
         
         # Only log warnings/errors, not every failure
         if self.failure_count == self.failure_threshold:
-            logger.warning(f"CircuitBreaker '{self.name}' failure count: {self.failure_count}/{self.failure_threshold}")
+            logger.warning("CircuitBreaker '%s' failure count: %s/%s", self.name, self.failure_count, self.failure_threshold)
         
         if self.failure_count >= self.failure_threshold:
-            self.state = CircuitState.OPEN
-            self._update_cache()
-            logger.error(f"CircuitBreaker '{self.name}' is now OPEN - failing fast for {self.recovery_timeout}s")
+            self._open_until_ns = time.monotonic_ns() + self._recovery_timeout_ns
+            self._flags = (self._flags & ~_STATE_MASK) | CircuitState.OPEN
+            logger.error("CircuitBreaker '%s' is now OPEN - failing fast for %ss", self.name, self.recovery_timeout)
     
     def _should_attempt_reset(self) -> bool:
         """Optimized check if enough time has passed to attempt reset"""
-        if self.last_failure_time == 0.0:
-            return True
-        
-        return time.time() - self.last_failure_time >= self.recovery_timeout
+        return time.monotonic_ns() >= self._open_until_ns
     
-    def _update_cache(self):
-        """Update state cache for faster access"""
-        self._state_cache.update({
-            "state": self.state.name,
-            "failure_count": self.failure_count,
-            "last_failure_time": self.last_failure_time if self.last_failure_time > 0 else None
-        })
+    @property
+    def state(self) -> CircuitState:
+        """Current CircuitState (decoded from _flags)"""
+        return _STATES[self._flags & _STATE_MASK]
+    
+    @state.setter
+    def state(self, value: CircuitState):
+        self._flags = (self._flags & ~_STATE_MASK) | value
     
     def get_state(self) -> dict:
-        """Get current circuit breaker state (cached for performance)"""
-        return self._state_cache.copy()
+        """Get current circuit breaker state (built on demand, nothing maintained per call)"""
+        return {
+            "name": self.name,
+            "state": _STATE_NAMES[self._flags & _STATE_MASK],
+            "failure_count": self.failure_count,
+            "failure_threshold": self.failure_threshold,
+            "last_failure_time": self.last_failure_time if self.last_failure_time > 0 else None,
+            "recovery_timeout": self.recovery_timeout
+        }
 
 class CircuitBreakerManager:
     """
@@ -138,42 +184,43 @@ class CircuitBreakerManager:
     
     def get_breaker(self, name: str, **kwargs) -> CircuitBreaker:
         """Get or create a circuit breaker (optimized)"""
-        if name not in self._breakers:
-            with self._lock:
-                # Double-check pattern
-                if name not in self._breakers:
-                    self._breakers[name] = CircuitBreaker(name=name, **kwargs)
-        return self._breakers[name]
+        breaker = self._breakers.get(name)
+        if breaker is not None:
+            return breaker
+        # setdefault is atomic: concurrent creators agree on one instance (a loser is just discarded)
+        return self._breakers.setdefault(name, CircuitBreaker(name=name, **kwargs))
     
-    async def get_all_states(self) -> dict:
-        """Get states of all circuit breakers (cached)"""
+    def get_all_states(self) -> Mapping[str, dict]:
+        """
+        Get states of all circuit breakers (cached, read-only view - copy with dict() if mutation is needed)
+        """
         current_time = time.time()
         
         # Use cache if still valid
         if current_time - self._last_cache_update < self._cache_ttl and self._states_cache:
-            return self._states_cache.copy()
+            return MappingProxyType(self._states_cache)
         
-        # Update cache
+        # Update cache (new dict each refresh: views handed out earlier stay a consistent snapshot)
         with self._lock:
             self._states_cache = {name: breaker.get_state() for name, breaker in self._breakers.items()}
             self._last_cache_update = current_time
         
-        return self._states_cache.copy()
+        return MappingProxyType(self._states_cache)
     
     def reset_breaker(self, name: str):
         """Reset a specific circuit breaker (optimized)"""
         if name in self._breakers:
             breaker = self._breakers[name]
-            breaker.state = CircuitState.CLOSED
+            breaker._flags = CircuitState.CLOSED
             breaker.failure_count = 0
             breaker.last_failure_time = 0.0
-            breaker._update_cache()
+            breaker._open_until_ns = 0
             
             # Invalidate cache
             self._last_cache_update = 0.0
             
             if logger.isEnabledFor(logging.DEBUG):
-                logger.debug(f"CircuitBreaker '{name}' manually reset")
+                logger.debug("CircuitBreaker '%s' manually reset", name)
 
 # Global circuit breaker manager
 circuit_manager = CircuitBreakerManager()
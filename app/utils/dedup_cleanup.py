@@ -6,12 +6,14 @@ Script để deduplicate records trong detail_html_storage và cleanup contact_h
 import sys
 import os
 import logging
-from typing import List, Dict, Any
+import sqlite3
+from typing import List, Dict, Any, Optional
 
 # Add project root to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from app.database.db_manager import DatabaseManager
+from app.database.dedup import delete_duplicates
 
 # Setup logging
 logging.basicConfig(
@@ -20,186 +22,190 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Dedup xóa nhiều hơn ngưỡng này thì VACUUM để thu hồi dung lượng file
+VACUUM_MIN_DELETED = 1000
+
+# Covering index tạm cho GROUP BY / PARTITION BY company_url ORDER BY created_at (id là rowid);
+# chỉ sống trong lúc dedup: company_url đã UNIQUE, giữ lại = thêm 1 B-tree phải ghi mỗi insert
+DEDUP_INDEX_NAME = "idx_detail_html_url_created"
+
 class DatabaseCleanup:
-    def __init__(self):
+    def __init__(self, delete_chunk_size: int = 0):
         self.db_manager = DatabaseManager()
+        # > 0: xóa bảng theo batch N rows, commit mỗi batch (WAL nhỏ, không giữ write lock lâu)
+        self.delete_chunk_size = delete_chunk_size
+        # get_connection đã bật WAL/synchronous=NORMAL/temp_store=MEMORY/mmap; script maintenance
+        # cần thêm cache lớn cho GROUP BY/DELETE hàng loạt
+        # 1 connection cho mọi bước (page cache giữ ấm giữa stats trước/sau và các lần xóa)
+        self._conn = self.db_manager.get_connection()
+        self._conn.execute("PRAGMA cache_size=-200000;")     # 200 MiB
+    
+    def close(self):
+        """Trả connection thread-local về PRAGMA mặc định của DatabaseManager"""
+        self._conn.execute("PRAGMA cache_size=10000;")
     
-    def deduplicate_detail_html_storage(self) -> Dict[str, int]:
+    def deduplicate_detail_html_storage(self, conn: Optional[sqlite3.Connection] = None) -> Dict[str, int]:
         """
         Deduplicate records trong detail_html_storage theo company_url
         Giữ lại record đầu tiên, xóa các record trùng lặp
+        conn != None: chạy trong transaction của caller (không commit, không VACUUM/ANALYZE)
         """
         logger.info("Starting deduplication of detail_html_storage...")
         
+        owns_tx = conn is None
+        if owns_tx:
+            conn = self._conn
+            # Index + đếm + DELETE trong 1 transaction, giữ write lock từ đầu (số liệu khớp với phần bị xóa)
+            conn.execute("BEGIN IMMEDIATE")
+        
         try:
-            with self.db_manager.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                # Tìm các record trùng lặp
+            cursor = conn.cursor()
+            
+            # Window function đọc theo thứ tự index, không cần sort
+            created_index = self._create_dedup_index(cursor)
+            try:
+                # Thống kê các URL trùng lặp (1 lần GROUP BY)
                 cursor.execute("""
-                    SELECT company_url, COUNT(*) as count
-                    FROM detail_html_storage
-                    WHERE company_url IS NOT NULL AND company_url != ''
-                    GROUP BY company_url
-                    HAVING COUNT(*) > 1
-                    ORDER BY count DESC
-                """)
-                
-                duplicate_urls = cursor.fetchall()
-                logger.info(f"Found {len(duplicate_urls)} URLs with duplicates")
-                
-                total_duplicates = 0
-                total_kept = 0
-                total_deleted = 0
-                
-                for url, count in duplicate_urls:
-                    logger.info(f"Processing URL: {url} ({count} duplicates)")
-                    
-                    # Lấy tất cả records cho URL này
-                    cursor.execute("""
-                        SELECT id, created_at
+                    SELECT COUNT(*), COALESCE(SUM(count), 0)
+                    FROM (
+                        SELECT COUNT(*) as count
                         FROM detail_html_storage
-                        WHERE company_url = ?
-                        ORDER BY created_at ASC
-                    """, (url,))
-                    
-                    records = cursor.fetchall()
-                    
-                    # Giữ lại record đầu tiên (oldest)
-                    keep_record = records[0]
-                    delete_records = records[1:]
-                    
-                    logger.info(f"  Keeping record ID: {keep_record[0]} (created: {keep_record[1]})")
-                    logger.info(f"  Deleting {len(delete_records)} duplicate records")
-                    
-                    # Xóa các record trùng lặp
-                    for record_id, _ in delete_records:
-                        cursor.execute("DELETE FROM detail_html_storage WHERE id = ?", (record_id,))
-                        total_deleted += 1
-                    
-                    total_kept += 1
-                    total_duplicates += count
-                
+                        WHERE company_url IS NOT NULL AND company_url != ''
+                        GROUP BY company_url
+                        HAVING COUNT(*) > 1
+                    )
+                """)
+                duplicate_url_count, total_duplicates = cursor.fetchone()
+                logger.info("Found %s URLs with duplicates", duplicate_url_count)
+                
+                # Xóa tất cả record trùng lặp, giữ lại record đầu tiên (oldest) mỗi URL
+                total_deleted = delete_duplicates(cursor, "detail_html_storage", "company_url")
+                total_kept = duplicate_url_count
+            finally:
+                if created_index:
+                    cursor.execute(f"DROP INDEX IF EXISTS {DEDUP_INDEX_NAME}")
+            
+            if owns_tx:
                 conn.commit()
-                
-                result = {
-                    'duplicate_urls': len(duplicate_urls),
-                    'total_duplicates': total_duplicates,
-                    'total_kept': total_kept,
-                    'total_deleted': total_deleted
-                }
-                
-                logger.info(f"Deduplication completed: {result}")
-                return result
-                
+                self._compact_after_dedup(total_deleted)
+            
+            result = {
+                'duplicate_urls': duplicate_url_count,
+                'total_duplicates': total_duplicates,
+                'total_kept': total_kept,
+                'total_deleted': total_deleted
+            }
+            
+            logger.info("Deduplication completed: %s", result)
+            return result
+            
         except Exception as e:
-            logger.error(f"Error during deduplication: {e}")
+            if owns_tx:
+                conn.rollback()
+            logger.error("Error during deduplication: %s", e)
             raise
     
-    def cleanup_contact_html_storage(self) -> Dict[str, int]:
+    def _create_dedup_index(self, cursor: sqlite3.Cursor) -> bool:
+        """Tạo covering index tạm cho dedup; trả True nếu index do mình tạo (caller drop sau dedup)"""
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (DEDUP_INDEX_NAME,))
+        if cursor.fetchone():
+            return False
+        cursor.execute(f"CREATE INDEX {DEDUP_INDEX_NAME} ON detail_html_storage(company_url, created_at)")
+        return True
+    
+    def _compact_after_dedup(self, total_deleted: int):
+        """VACUUM/ANALYZE sau dedup - phải chạy ngoài transaction (sau commit)"""
+        cursor = self._conn.cursor()
+        
+        # Trả các page đã free về OS
+        if total_deleted > VACUUM_MIN_DELETED:
+            logger.info("Running VACUUM after deleting %d rows...", total_deleted)
+            cursor.execute("VACUUM")
+        
+        # Cập nhật thống kê cho query planner sau khi xóa nhiều rows
+        if total_deleted:
+            cursor.execute("ANALYZE detail_html_storage")
+    
+    def _cleanup_table(self, table: str, conn: Optional[sqlite3.Connection] = None) -> Dict[str, int]:
         """
-        Xóa tất cả records trong contact_html_storage
+        Xóa tất cả records trong `table` (conn != None: trong transaction của caller, không commit)
         """
-        logger.info("Starting cleanup of contact_html_storage...")
+        logger.info("Starting cleanup of %s...", table)
+        
+        owns_tx = conn is None
+        if owns_tx:
+            conn = self._conn
         
         try:
-            with self.db_manager.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                # Đếm số records trước khi xóa
-                cursor.execute("SELECT COUNT(*) FROM contact_html_storage")
-                total_records = cursor.fetchone()[0]
-                
-                logger.info(f"Found {total_records} records in contact_html_storage")
-                
-                if total_records > 0:
-                    # Xóa tất cả records
-                    cursor.execute("DELETE FROM contact_html_storage")
+            cursor = conn.cursor()
+            
+            if owns_tx and self.delete_chunk_size > 0:
+                total_records = self._delete_in_chunks(cursor, table)
+            else:
+                total_records = self._delete_all(cursor, table)
+                if owns_tx:
                     conn.commit()
-                    
-                    logger.info(f"Deleted {total_records} records from contact_html_storage")
-                else:
-                    logger.info("No records to delete in contact_html_storage")
-                
-                result = {
-                    'total_deleted': total_records
-                }
-                
-                return result
-                
+            
+            if total_records > 0:
+                logger.info("Deleted %s records from %s", total_records, table)
+            else:
+                logger.info("No records to delete in %s", table)
+            
+            result = {
+                'total_deleted': total_records
+            }
+            
+            return result
+            
         except Exception as e:
-            logger.error(f"Error during contact_html_storage cleanup: {e}")
+            if owns_tx:
+                conn.rollback()
+            logger.error("Error during %s cleanup: %s", table, e)
             raise
     
-    def cleanup_email_extraction(self) -> Dict[str, int]:
+    def _delete_all(self, cursor: sqlite3.Cursor, table: str) -> int:
+        """Xóa toàn bộ `table` bằng 1 câu DELETE, trả về số rows đã xóa"""
+        # DELETE không WHERE = truncate optimization của SQLite (free cả page, không xóa từng row,
+        # như TRUNCATE TABLE) - chỉ khi bảng không có trigger (schema hiện tại không có; foreign_keys OFF)
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ? LIMIT 1", (table,))
+        if cursor.fetchone():
+            logger.warning("%s has triggers - DELETE falls back to per-row deletion", table)
+        
+        # Xóa tất cả records; rowcount thay cho SELECT COUNT(*) (tránh scan thêm 1 lần)
+        cursor.execute(f"DELETE FROM {table}")
+        return cursor.rowcount
+    
+    def _delete_in_chunks(self, cursor: sqlite3.Cursor, table: str) -> int:
+        """Xóa toàn bộ `table` theo batch delete_chunk_size rows, commit sau mỗi batch"""
+        total_deleted = 0
+        while True:
+            cursor.execute(
+                f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} LIMIT ?)",
+                (self.delete_chunk_size,)
+            )
+            deleted = cursor.rowcount
+            cursor.connection.commit()
+            total_deleted += deleted
+            if deleted < self.delete_chunk_size:
+                return total_deleted
+    
+    def cleanup_contact_html_storage(self, conn: Optional[sqlite3.Connection] = None) -> Dict[str, int]:
+        """
+        Xóa tất cả records trong contact_html_storage
+        """
+        return self._cleanup_table("contact_html_storage", conn)
+    
+    def cleanup_email_extraction(self, conn: Optional[sqlite3.Connection] = None) -> Dict[str, int]:
         """
         Xóa tất cả records trong email_extraction
         """
-        logger.info("Starting cleanup of email_extraction...")
-        
-        try:
-            with self.db_manager.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                # Đếm số records trước khi xóa
-                cursor.execute("SELECT COUNT(*) FROM email_extraction")
-                total_records = cursor.fetchone()[0]
-                
-                logger.info(f"Found {total_records} records in email_extraction")
-                
-                if total_records > 0:
-                    # Xóa tất cả records
-                    cursor.execute("DELETE FROM email_extraction")
-                    conn.commit()
-                    
-                    logger.info(f"Deleted {total_records} records from email_extraction")
-                else:
-                    logger.info("No records to delete in email_extraction")
-                
-                result = {
-                    'total_deleted': total_records
-                }
-                
-                return result
-                
-        except Exception as e:
-            logger.error(f"Error during email_extraction cleanup: {e}")
-            raise
+        return self._cleanup_table("email_extraction", conn)
     
-    def cleanup_company_details(self) -> Dict[str, int]:
+    def cleanup_company_details(self, conn: Optional[sqlite3.Connection] = None) -> Dict[str, int]:
         """
         Xóa tất cả records trong company_details
         """
-        logger.info("Starting cleanup of company_details...")
-        
-        try:
-            with self.db_manager.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                # Đếm số records trước khi xóa
-                cursor.execute("SELECT COUNT(*) FROM company_details")
-                total_records = cursor.fetchone()[0]
-                
-                logger.info(f"Found {total_records} records in company_details")
-                
-                if total_records > 0:
-                    # Xóa tất cả records
-                    cursor.execute("DELETE FROM company_details")
-                    conn.commit()
-                    
-                    logger.info(f"Deleted {total_records} records from company_details")
-                else:
-                    logger.info("No records to delete in company_details")
-                
-                result = {
-                    'total_deleted': total_records
-                }
-                
-                return result
-                
-        except Exception as e:
-            logger.error(f"Error during company_details cleanup: {e}")
-            raise
+        return self._cleanup_table("company_details", conn)
     
     def cleanup_all_tables(self) -> Dict[str, int]:
         """Delete all records from all three tables and return counts"""
@@ -212,7 +218,7 @@ class DatabaseCleanup:
         results['email_extraction'] = self.cleanup_email_extraction()['total_deleted']
         results['company_details'] = self.cleanup_company_details()['total_deleted']
         
-        logger.info(f"Cleaned up all tables: {results}")
+        logger.info("Cleaned up all tables: %s", results)
         return results
     
     def get_database_stats(self) -> Dict[str, int]:
@@ -220,33 +226,21 @@ class DatabaseCleanup:
         Lấy thống kê database
         """
         try:
-            with self.db_manager.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                # Đếm records trong các bảng
-                cursor.execute("SELECT COUNT(*) FROM detail_html_storage")
-                detail_count = cursor.fetchone()[0]
-                
-                cursor.execute("SELECT COUNT(*) FROM contact_html_storage")
-                contact_count = cursor.fetchone()[0]
-                
-                cursor.execute("SELECT COUNT(*) FROM company_details")
-                company_details_count = cursor.fetchone()[0]
-                
-                cursor.execute("SELECT COUNT(*) FROM email_extraction")
-                email_count = cursor.fetchone()[0]
-                
-                stats = {
-                    'detail_html_storage': detail_count,
-                    'contact_html_storage': contact_count,
-                    'company_details': company_details_count,
-                    'email_extraction': email_count
-                }
-                
-                return stats
-                
+            cursor = self._conn.cursor()
+            
+            # Đếm records trong các bảng (1 round-trip)
+            cursor.execute("""
+                SELECT 'detail_html_storage', COUNT(*) FROM detail_html_storage UNION ALL
+                SELECT 'contact_html_storage', COUNT(*) FROM contact_html_storage UNION ALL
+                SELECT 'company_details', COUNT(*) FROM company_details UNION ALL
+                SELECT 'email_extraction', COUNT(*) FROM email_extraction
+            """)
+            stats = dict(cursor.fetchall())
+            
+            return stats
+            
         except Exception as e:
-            logger.error(f"Error getting database stats: {e}")
+            logger.error("Error getting database stats: %s", e)
             raise
     
     def run_cleanup(self, dedup_detail: bool = True, cleanup_contact: bool = True, 
@@ -262,44 +256,61 @@ class DatabaseCleanup:
         logger.info("Database stats BEFORE cleanup:")
         stats_before = self.get_database_stats()
         for table, count in stats_before.items():
-            logger.info(f"  {table}: {count} records")
+            logger.info("  %s: %s records", table, count)
         
         results = {}
         
-        # Deduplicate detail_html_storage
-        if dedup_detail:
-            logger.info("\n" + "=" * 50)
-            logger.info("DEDUPLICATING DETAIL_HTML_STORAGE")
-            logger.info("=" * 50)
-            results['deduplication'] = self.deduplicate_detail_html_storage()
-        
-        # Cleanup contact_html_storage
-        if cleanup_contact:
-            logger.info("\n" + "=" * 50)
-            logger.info("CLEANING UP CONTACT_HTML_STORAGE")
-            logger.info("=" * 50)
-            results['contact_cleanup'] = self.cleanup_contact_html_storage()
-        
-        # Cleanup email_extraction
-        if cleanup_emails:
-            logger.info("\n" + "=" * 50)
-            logger.info("CLEANING UP EMAIL_EXTRACTION")
-            logger.info("=" * 50)
-            results['email_cleanup'] = self.cleanup_email_extraction()
+        # Toàn bộ các bước trong 1 transaction: 1 lần commit (1 fsync) thay vì mỗi bước 1 lần.
+        # delete_chunk_size > 0: mỗi bước tự commit (theo batch) -> không gom transaction
+        single_tx = self.delete_chunk_size <= 0
+        conn = self._conn if single_tx else None
+        if single_tx:
+            conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Deduplicate detail_html_storage
+            if dedup_detail:
+                logger.info("\n" + "=" * 50)
+                logger.info("DEDUPLICATING DETAIL_HTML_STORAGE")
+                logger.info("=" * 50)
+                results['deduplication'] = self.deduplicate_detail_html_storage(conn)
+            
+            # Cleanup contact_html_storage
+            if cleanup_contact:
+                logger.info("\n" + "=" * 50)
+                logger.info("CLEANING UP CONTACT_HTML_STORAGE")
+                logger.info("=" * 50)
+                results['contact_cleanup'] = self.cleanup_contact_html_storage(conn)
+            
+            # Cleanup email_extraction
+            if cleanup_emails:
+                logger.info("\n" + "=" * 50)
+                logger.info("CLEANING UP EMAIL_EXTRACTION")
+                logger.info("=" * 50)
+                results['email_cleanup'] = self.cleanup_email_extraction(conn)
+            
+            # Cleanup company_details
+            if cleanup_companies:
+                logger.info("\n" + "=" * 50)
+                logger.info("CLEANING UP COMPANY_DETAILS")
+                logger.info("=" * 50)
+                results['company_cleanup'] = self.cleanup_company_details(conn)
+            
+            if single_tx:
+                conn.commit()
+        except Exception:
+            if single_tx:
+                conn.rollback()
+            raise
         
-        # Cleanup company_details
-        if cleanup_companies:
-            logger.info("\n" + "=" * 50)
-            logger.info("CLEANING UP COMPANY_DETAILS")
-            logger.info("=" * 50)
-            results['company_cleanup'] = self.cleanup_company_details()
+        if single_tx and dedup_detail:
+            self._compact_after_dedup(results['deduplication']['total_deleted'])
         
         # Lấy stats sau khi cleanup
         logger.info("\n" + "=" * 50)
         logger.info("Database stats AFTER cleanup:")
         stats_after = self.get_database_stats()
         for table, count in stats_after.items():
-            logger.info(f"  {table}: {count} records")
+            logger.info("  %s: %s records", table, count)
         
         # Tính toán thay đổi
         logger.info("\n" + "=" * 50)
@@ -309,7 +320,7 @@ class DatabaseCleanup:
             before = stats_before[table]
             after = stats_after[table]
             change = after - before
-            logger.info(f"  {table}: {before} → {after} ({change:+d})")
+            logger.info("  %s: %s → %s (%+d)", table, before, after, change)
         
         results['stats_before'] = stats_before
         results['stats_after'] = stats_after
@@ -345,6 +356,8 @@ def main():
                        help='Cleanup all tables (contact, emails, companies)')
     parser.add_argument('--stats-only', action='store_true',
                        help='Show database stats only, no cleanup')
+    parser.add_argument('--delete-chunk-size', type=int, default=0,
+                       help='Wipe tables in batches of N rows, committing each batch (default: 0 = single DELETE)')
     
     args = parser.parse_args()
     
@@ -360,21 +373,22 @@ def main():
         cleanup_emails = False
         cleanup_companies = False
     
+    cleanup = None
     try:
-        cleanup = DatabaseCleanup()
+        cleanup = DatabaseCleanup(delete_chunk_size=args.delete_chunk_size)
         
         if args.stats_only:
             logger.info("Showing database stats only...")
             stats = cleanup.get_database_stats()
             logger.info("Current database stats:")
             for table, count in stats.items():
-                logger.info(f"  {table}: {count} records")
+                logger.info("  %s: %d records", table, count)
         
         elif args.cleanup_all_tables:
             # Cleanup all tables
             logger.info("Cleaning up all tables...")
             results = cleanup.cleanup_all_tables()
-            logger.info(f"✅ Cleaned up all tables: {results}")
+            logger.info("✅ Cleaned up all tables: %s", results)
         
         else:
             # Original cleanup operations - cleanup-all now includes all tables
@@ -386,11 +400,14 @@ def main():
             )
             
             logger.info("Cleanup completed successfully!")
-            logger.info(f"Results: {results}")
+            logger.info("Results: %s", results)
     
     except Exception as e:
-        logger.error(f"Cleanup failed: {e}")
+        logger.error("Cleanup failed: %s", e)
         sys.exit(1)
+    finally:
+        if cleanup is not None:
+            cleanup.close()
 
 if __name__ == "__main__":
     main()
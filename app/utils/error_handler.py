@@ -3,6 +3,7 @@ Optimized error handling utilities for better performance
 """
 
 import logging
+import re
 import time
 from typing import Dict, Any, Optional, Callable
 from functools import wraps
@@ -10,79 +11,54 @@ import asyncio
 
 logger = logging.getLogger(__name__)
 
+# Substrings that mark an error as critical (browser/context must be restarted)
+CRITICAL_KEYWORDS = (
+    "Target page, context or browser has been closed",
+    "TargetClosedError",
+    "Browser.new_context",
+    "BrowserType.launch",
+    "Protocol error",
+    "Connection lost",
+    "Navigation timeout",
+    "TimeoutError",
+)
+
+# Single alternation regex: one linear scan instead of one substring search per keyword
+_CRITICAL_RE = re.compile("|".join(map(re.escape, CRITICAL_KEYWORDS)))
+
+# get_error_category: case-insensitive search thay vì error_msg.lower() (không tạo bản copy message)
+_TIMEOUT_MSG_RE = re.compile("timeout", re.IGNORECASE)
+_NETWORK_MSG_RE = re.compile("Connection|(?i:network)")
+
+def _is_critical_message(error_msg: str) -> bool:
+    """Critical check on an already-stringified error message"""
+    return _CRITICAL_RE.search(error_msg) is not None
+
+def _error_category(error_type: str, error_msg: str) -> str:
+    """Error category from already-computed type name / message"""
+    if "TargetClosedError" in error_type or "Target page" in error_msg:
+        return "browser_closed"
+    elif "TimeoutError" in error_type or _TIMEOUT_MSG_RE.search(error_msg):
+        return "timeout"
+    elif _NETWORK_MSG_RE.search(error_msg):
+        return "network"
+    elif "Protocol error" in error_msg:
+        return "protocol"
+    else:
+        return "unknown"
+
 class OptimizedErrorHandler:
     """
-    Optimized error handler with caching and performance improvements
+    Optimized error handler: critical/category checks run straight on precompiled regexes (no cache)
     """
     
-    def __init__(self):
-        self._error_cache: Dict[str, Dict[str, Any]] = {}
-        self._cache_ttl = 60.0  # Cache errors for 60 seconds
-        self._max_cache_size = 1000
-        
     def is_critical_error(self, error: Exception) -> bool:
-        """Fast check if error is critical (cached)"""
-        error_type = type(error).__name__
-        error_msg = str(error)
-        cache_key = f"{error_type}:{hash(error_msg) % 1000}"  # Hash for performance
-        
-        # Check cache first
-        if cache_key in self._error_cache:
-            cached = self._error_cache[cache_key]
-            if time.time() - cached['timestamp'] < self._cache_ttl:
-                return cached['is_critical']
-        
-        # Determine if critical
-        critical_keywords = [
-            "Target page, context or browser has been closed",
-            "TargetClosedError", 
-            "Browser.new_context",
-            "BrowserType.launch",
-            "Protocol error",
-            "Connection lost",
-            "Navigation timeout",
-            "TimeoutError"
-        ]
-        
-        is_critical = any(keyword in error_msg for keyword in critical_keywords)
-        
-        # Cache result
-        self._error_cache[cache_key] = {
-            'is_critical': is_critical,
-            'timestamp': time.time()
-        }
-        
-        # Cleanup cache if too large
-        if len(self._error_cache) > self._max_cache_size:
-            self._cleanup_cache()
-        
-        return is_critical
-    
-    def _cleanup_cache(self):
-        """Cleanup old cache entries"""
-        current_time = time.time()
-        expired_keys = [
-            key for key, value in self._error_cache.items()
-            if current_time - value['timestamp'] > self._cache_ttl
-        ]
-        for key in expired_keys:
-            del self._error_cache[key]
+        """Fast check if error is critical"""
+        return _is_critical_message(str(error))
     
     def get_error_category(self, error: Exception) -> str:
         """Get error category for better handling"""
-        error_type = type(error).__name__
-        error_msg = str(error)
-        
-        if "TargetClosedError" in error_type or "Target page" in error_msg:
-            return "browser_closed"
-        elif "TimeoutError" in error_type or "timeout" in error_msg.lower():
-            return "timeout"
-        elif "Connection" in error_msg or "network" in error_msg.lower():
-            return "network"
-        elif "Protocol error" in error_msg:
-            return "protocol"
-        else:
-            return "unknown"
+        return _error_category(type(error).__name__, str(error))
 
 # Global error handler instance
 error_handler = OptimizedErrorHandler()
@@ -92,37 +68,42 @@ def optimized_retry(max_retries: int = 3, delay: float = 1.0, backoff: float = 2
     Optimized retry decorator with exponential backoff
     """
     def decorator(func: Callable):
-        @wraps(func)
-        async def async_wrapper(*args, **kwargs):
-            last_exception = None
-            
-            for attempt in range(max_retries + 1):
-                try:
-                    if asyncio.iscoroutinefunction(func):
+        # Backoff tính sẵn 1 lần lúc decorate: mỗi lần retry chỉ là tra tuple
+        delays = tuple(delay * (backoff ** attempt) for attempt in range(max_retries))
+        critical_delays = tuple(d * 2 for d in delays)
+        
+        # Chọn wrapper 1 lần lúc decorate (không kiểm tra iscoroutinefunction mỗi lần gọi)
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                last_exception = None
+                
+                for attempt in range(max_retries + 1):
+                    try:
                         return await func(*args, **kwargs)
-                    else:
-                        return func(*args, **kwargs)
-                except Exception as e:
-                    last_exception = e
-                    
-                    if attempt == max_retries:
-                        break
-                    
-                    # Check if error is critical
-                    if error_handler.is_critical_error(e):
-                        # For critical errors, wait longer
-                        wait_time = delay * (backoff ** attempt) * 2
-                    else:
-                        # For non-critical errors, shorter wait
-                        wait_time = delay * (backoff ** attempt)
-                    
-                    if logger.isEnabledFor(logging.DEBUG):
-                        logger.debug(f"Retry {attempt + 1}/{max_retries} after {wait_time:.1f}s: {e}")
-                    
-                    await asyncio.sleep(wait_time)
+                    except Exception as e:
+                        last_exception = e
+                        
+                        if attempt == max_retries:
+                            break
+                        
+                        # Check if error is critical
+                        if error_handler.is_critical_error(e):
+                            # For critical errors, wait longer
+                            wait_time = critical_delays[attempt]
+                        else:
+                            # For non-critical errors, shorter wait
+                            wait_time = delays[attempt]
+                        
+                        if logger.isEnabledFor(logging.DEBUG):
+                            logger.debug(f"Retry {attempt + 1}/{max_retries} after {wait_time:.1f}s: {e}")
+                        
+                        await asyncio.sleep(wait_time)
+                
+                # All retries failed
+                raise last_exception
             
-            # All retries failed
-            raise last_exception
+            return async_wrapper
         
         @wraps(func)
         def sync_wrapper(*args, **kwargs):
@@ -139,9 +120,9 @@ def optimized_retry(max_retries: int = 3, delay: float = 1.0, backoff: float = 2
                     
                     # Check if error is critical
                     if error_handler.is_critical_error(e):
-                        wait_time = delay * (backoff ** attempt) * 2
+                        wait_time = critical_delays[attempt]
                     else:
-                        wait_time = delay * (backoff ** attempt)
+                        wait_time = delays[attempt]
                     
                     if logger.isEnabledFor(logging.DEBUG):
                         logger.debug(f"Retry {attempt + 1}/{max_retries} after {wait_time:.1f}s: {e}")
@@ -150,11 +131,7 @@ def optimized_retry(max_retries: int = 3, delay: float = 1.0, backoff: float = 2
             
             raise last_exception
         
-        # Return appropriate wrapper
-        if asyncio.iscoroutinefunction(func):
-            return async_wrapper
-        else:
-            return sync_wrapper
+        return sync_wrapper
     
     return decorator
 
@@ -168,7 +145,8 @@ def fast_error_check(error: Exception) -> Dict[str, Any]:
     return {
         'type': error_type,
         'message': error_msg,
-        'is_critical': error_handler.is_critical_error(error),
-        'category': error_handler.get_error_category(error),
+        # Dùng lại type/message đã tính (str(error) chỉ 1 lần thay vì 3)
+        'is_critical': _is_critical_message(error_msg),
+        'category': _error_category(error_type, error_msg),
         'timestamp': time.time()
     }
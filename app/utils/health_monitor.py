@@ -2,16 +2,16 @@ import asyncio
 import psutil
 import time
 import logging
-from typing import Dict, Any, Optional
+from collections import deque
+from typing import Dict, Any, Callable, Optional
 from dataclasses import dataclass, field
 from app.utils.circuit_breaker import circuit_manager
-from threading import Lock
 
 logger = logging.getLogger(__name__)
 
-@dataclass
+@dataclass(slots=True)
 class HealthStatus:
-    """Optimized health status data structure"""
+    """Optimized health status data structure (slotted: ~50 bản giữ trong history)"""
     timestamp: float
     worker_id: str
     memory_usage_mb: float
@@ -21,7 +21,32 @@ class HealthStatus:
     context_count: int
     circuit_breakers: Dict[str, Any] = field(default_factory=dict)
     is_healthy: bool = True
-    issues: list = field(default_factory=list)
+    issues: tuple = ()  # Tuple rỗng dùng chung cho đường healthy, không cấp phát list mới
+
+class ActiveTaskCounter:
+    """
+    Loop task factory that counts not-yet-done tasks, so health checks read an int
+    instead of walking asyncio.all_tasks(); wraps `inner` (e.g. eager_task_factory) if given
+    """
+    __slots__ = ("_inner", "active")
+    
+    def __init__(self, inner: Optional[Callable] = None):
+        self._inner = inner
+        self.active = 0
+    
+    def __call__(self, loop, coro, **kwargs):
+        if self._inner is not None:
+            task = self._inner(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+        # Eager tasks có thể đã xong ngay khi tạo -> không đếm
+        if not task.done():
+            self.active += 1
+            task.add_done_callback(self._on_done)
+        return task
+    
+    def _on_done(self, task):
+        self.active -= 1
 
 class HealthMonitor:
     """
@@ -30,10 +55,15 @@ class HealthMonitor:
     
     def __init__(self, worker_id: str = None):
         self.worker_id = worker_id or f"worker_{psutil.Process().pid}"
-        self._health_history = []
         self._max_history = 50  # Reduced from 100
+        self._health_history = deque(maxlen=self._max_history)  # Ring buffer: bản cũ nhất tự bị đẩy ra, O(1)
         self._last_cleanup = time.time()
-        self._lock = Lock()
+        
+        # Running sums trên cửa sổ _summary_window checks gần nhất -> summary O(1)
+        self._summary_window = 10
+        self._mem_sum = 0.0
+        self._cpu_sum = 0.0
+        self._unhealthy_sum = 0
         
         # Health thresholds (optimized)
         self.memory_threshold_mb = 1500  # 1.5GB
@@ -46,27 +76,38 @@ class HealthMonitor:
         self._last_health_check = 0.0
         self._health_cache_ttl = 5.0  # Cache for 5 seconds
         self._cached_health = None
+        self._health_inflight = None  # asyncio.Future of the sample currently being taken
         
         # Process cache
         self._process = psutil.Process()
+        self._process.cpu_percent(interval=None)  # Prime: lần gọi đầu của psutil luôn trả 0.0
         
         if logger.isEnabledFor(logging.DEBUG):
             logger.debug(f"HealthMonitor initialized for {self.worker_id}")
     
-    async def check_health(self, context_manager=None) -> HealthStatus:
-        """Optimized comprehensive health check with caching"""
-        current_time = time.time()
-        
-        # Use cache if still valid
-        if (current_time - self._last_health_check < self._health_cache_ttl and 
+    async def check_health(self, context_manager=None, force: bool = False) -> HealthStatus:
+        """Optimized comprehensive health check with caching (force=True bỏ qua cache)"""
+        # Use cache if still valid (monotonic: immune to wall-clock jumps)
+        if (not force and
+            time.monotonic() - self._last_health_check < self._health_cache_ttl and 
             self._cached_health is not None):
             return self._cached_health
         
+        # Tasks sharing the worker loop that miss the cache together await one sample
+        if self._health_inflight is None or self._health_inflight.done():
+            self._health_inflight = asyncio.ensure_future(self._collect_health(context_manager))
+        return await asyncio.shield(self._health_inflight)
+    
+    async def _collect_health(self, context_manager=None) -> HealthStatus:
+        """Sample process/browser/circuit metrics and cache the result"""
+        current_time = time.time()
+        
         try:
             # Get system metrics (optimized)
-            memory_info = self._process.memory_info()
-            memory_usage_mb = memory_info.rss / 1048576  # Faster than /1024/1024
-            cpu_percent = self._process.cpu_percent()
+            # as_dict dùng oneshot(): memory + cpu từ 1 lượt đọc /proc thay vì 2
+            proc_info = self._process.as_dict(attrs=['memory_info', 'cpu_percent'])
+            memory_usage_mb = proc_info['memory_info'].rss >> 20  # int MB đủ cho so ngưỡng
+            cpu_percent = proc_info['cpu_percent']
             
             # Get browser/context metrics if context manager available (optimized)
             browser_count = 0
@@ -79,41 +120,34 @@ class HealthMonitor:
                     pass
             
             # Get circuit breaker states (cached)
-            circuit_breakers = await circuit_manager.get_all_states()
+            circuit_breakers = circuit_manager.get_all_states()
             
-            # Count active tasks (optimized)
-            active_tasks = len([task for task in asyncio.all_tasks() if not task.done()])
+            # Count active tasks: O(1) khi loop dùng ActiveTaskCounter, fallback đếm (không tạo list)
+            task_factory = asyncio.get_running_loop().get_task_factory()
+            if isinstance(task_factory, ActiveTaskCounter):
+                active_tasks = task_factory.active
+            else:
+                active_tasks = sum(1 for task in asyncio.all_tasks() if not task.done())
             
-            # Determine health status (optimized)
-            issues = []
+            # Determine health status: 1 biểu thức short-circuit cho đường healthy,
+            # chỉ format issue strings khi có ngưỡng bị vượt
+            issues = ()
             is_healthy = True
-            
-            # Use early returns for better performance
-            if memory_usage_mb > self.memory_threshold_mb:
-                issues.append(f"High memory usage: {memory_usage_mb:.1f}MB > {self.memory_threshold_mb}MB")
-                is_healthy = False
-            
-            if cpu_percent > self.cpu_threshold_percent:
-                issues.append(f"High CPU usage: {cpu_percent:.1f}% > {self.cpu_threshold_percent}%")
-                is_healthy = False
-            
-            if active_tasks > self.max_active_tasks:
-                issues.append(f"Too many active tasks: {active_tasks} > {self.max_active_tasks}")
-                is_healthy = False
-            
-            if browser_count > self.max_browser_count:
-                issues.append(f"Too many browsers: {browser_count} > {self.max_browser_count}")
-                is_healthy = False
-            
-            if context_count > self.max_context_count:
-                issues.append(f"Too many contexts: {context_count} > {self.max_context_count}")
+            if (memory_usage_mb > self.memory_threshold_mb or
+                cpu_percent > self.cpu_threshold_percent or
+                active_tasks > self.max_active_tasks or
+                browser_count > self.max_browser_count or
+                context_count > self.max_context_count):
+                issues = tuple(self._threshold_issues(
+                    memory_usage_mb, cpu_percent, active_tasks, browser_count, context_count
+                ))
                 is_healthy = False
             
             # Check circuit breakers (optimized)
             open_breakers = [name for name, state in circuit_breakers.items() 
                            if state.get('state') == 'OPEN']
             if open_breakers:
-                issues.append(f"Open circuit breakers: {open_breakers}")
+                issues += (f"Open circuit breakers: {open_breakers}",)
                 is_healthy = False
             
             # Create health status
@@ -132,13 +166,10 @@ class HealthMonitor:
             
             # Cache the result
             self._cached_health = health_status
-            self._last_health_check = current_time
+            self._last_health_check = time.monotonic()
             
-            # Store in history (optimized)
-            with self._lock:
-                self._health_history.append(health_status)
-                if len(self._health_history) > self._max_history:
-                    self._health_history.pop(0)
+            # Store in history: không cần lock, _collect_health chỉ chạy trên event loop của worker
+            self._record_history(health_status)
             
             # Log health status (only when unhealthy or debug mode)
             if not is_healthy:
@@ -160,9 +191,39 @@ class HealthMonitor:
                 context_count=0,
                 circuit_breakers={},
                 is_healthy=False,
-                issues=[f"Health check error: {e}"]
+                issues=(f"Health check error: {e}",)
             )
     
+    def _record_history(self, health_status: HealthStatus):
+        """Append to history and slide the running sums of the summary window"""
+        history = self._health_history
+        if len(history) >= self._summary_window:
+            # Bản ghi rời khỏi cửa sổ (deque maxlen tự evict phần cũ hơn, nằm ngoài cửa sổ)
+            leaving = history[-self._summary_window]
+            self._mem_sum -= leaving.memory_usage_mb
+            self._cpu_sum -= leaving.cpu_percent
+            self._unhealthy_sum -= not leaving.is_healthy
+        history.append(health_status)
+        self._mem_sum += health_status.memory_usage_mb
+        self._cpu_sum += health_status.cpu_percent
+        self._unhealthy_sum += not health_status.is_healthy
+    
+    def _threshold_issues(self, memory_usage_mb, cpu_percent, active_tasks,
+                          browser_count, context_count) -> list:
+        """Format issues for every exceeded threshold (slow path only)"""
+        issues = []
+        if memory_usage_mb > self.memory_threshold_mb:
+            issues.append(f"High memory usage: {memory_usage_mb:.1f}MB > {self.memory_threshold_mb}MB")
+        if cpu_percent > self.cpu_threshold_percent:
+            issues.append(f"High CPU usage: {cpu_percent:.1f}% > {self.cpu_threshold_percent}%")
+        if active_tasks > self.max_active_tasks:
+            issues.append(f"Too many active tasks: {active_tasks} > {self.max_active_tasks}")
+        if browser_count > self.max_browser_count:
+            issues.append(f"Too many browsers: {browser_count} > {self.max_browser_count}")
+        if context_count > self.max_context_count:
+            issues.append(f"Too many contexts: {context_count} > {self.max_context_count}")
+        return issues
+    
     async def cleanup_if_needed(self, context_manager=None):
         """Perform cleanup if health is poor"""
         health = await self.check_health(context_manager)
@@ -186,6 +247,14 @@ class HealthMonitor:
                 logger.info(f"Resetting circuit breakers: {open_breakers}")
                 for breaker_name in open_breakers:
                     circuit_manager.reset_breaker(breaker_name)
+            
+            # Cleanup đã thay đổi trạng thái -> bỏ cache để lần check sau lấy mẫu mới
+            self.invalidate_cache()
+    
+    def invalidate_cache(self):
+        """Drop the cached health sample so the next check_health re-samples"""
+        self._cached_health = None
+        self._last_health_check = 0.0
     
     def get_health_summary(self) -> Dict[str, Any]:
         """Get health summary for monitoring"""
@@ -193,7 +262,7 @@ class HealthMonitor:
             return {"status": "no_data"}
         
         latest = self._health_history[-1]
-        recent = self._health_history[-10:] if len(self._health_history) >= 10 else self._health_history
+        window = min(len(self._health_history), self._summary_window)
         
         return {
             "worker_id": self.worker_id,
@@ -204,9 +273,9 @@ class HealthMonitor:
             "active_tasks": latest.active_tasks,
             "browser_count": latest.browser_count,
             "context_count": latest.context_count,
-            "avg_memory_10_checks": sum(h.memory_usage_mb for h in recent) / len(recent),
-            "avg_cpu_10_checks": sum(h.cpu_percent for h in recent) / len(recent),
-            "unhealthy_checks": sum(1 for h in recent if not h.is_healthy),
+            "avg_memory_10_checks": self._mem_sum / window,
+            "avg_cpu_10_checks": self._cpu_sum / window,
+            "unhealthy_checks": self._unhealthy_sum,
             "total_checks": len(self._health_history)
         }
 
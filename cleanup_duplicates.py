@@ -13,6 +13,7 @@ from typing import Dict, Any
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from app.database.db_manager import DatabaseManager
+from app.database.dedup import delete_duplicates
 
 # Setup logging
 logging.basicConfig(
@@ -21,10 +22,15 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Partial covering index cho GROUP BY url / PARTITION BY url ORDER BY created_at (id là rowid)
+DEDUP_INDEX_NAME = "idx_chs_url_created"
+
 class DuplicateCleanup:
-    def __init__(self, db_path: str = "data/crawler.db"):
+    def __init__(self, db_path: str = "data/crawler.db", delete_chunk_size: int = 0):
         self.db_path = db_path
         self.db_manager = DatabaseManager(db_path)
+        # > 0: xóa duplicates theo chunk, commit mỗi ~N rows (WAL nhỏ, không giữ write lock lâu)
+        self.delete_chunk_size = delete_chunk_size
     
     def get_duplicate_stats(self) -> Dict[str, Any]:
         """Lấy thống kê về duplicates"""
@@ -34,37 +40,21 @@ class DuplicateCleanup:
             with self.db_manager.get_connection() as conn:
                 cursor = conn.cursor()
                 
-                # Tổng số records
-                cursor.execute("SELECT COUNT(*) FROM contact_html_storage")
-                total_records = cursor.fetchone()[0]
-                
-                # Số URL duy nhất
-                cursor.execute("SELECT COUNT(DISTINCT url) FROM contact_html_storage WHERE url IS NOT NULL AND url != ''")
-                unique_urls = cursor.fetchone()[0]
-                
-                # Số URL trùng lặp
+                # 1 query (1 lần GROUP BY url) cho cả 4 số liệu thay vì 4 lần scan riêng
                 cursor.execute("""
-                    SELECT COUNT(*) FROM (
-                        SELECT url, COUNT(*) as count
+                    SELECT
+                        (SELECT COUNT(*) FROM contact_html_storage),  -- Tổng số records
+                        COUNT(*),                                      -- Số URL duy nhất
+                        COALESCE(SUM(count > 1), 0),                   -- Số URL trùng lặp
+                        COALESCE(SUM(count - 1), 0)                    -- Tổng số records trùng lặp
+                    FROM (
+                        SELECT COUNT(*) as count
                         FROM contact_html_storage
                         WHERE url IS NOT NULL AND url != ''
                         GROUP BY url
-                        HAVING COUNT(*) > 1
                     )
                 """)
-                duplicate_url_count = cursor.fetchone()[0]
-                
-                # Tổng số records trùng lặp
-                cursor.execute("""
-                    SELECT SUM(count - 1) FROM (
-                        SELECT url, COUNT(*) as count
-                        FROM contact_html_storage
-                        WHERE url IS NOT NULL AND url != ''
-                        GROUP BY url
-                        HAVING COUNT(*) > 1
-                    )
-                """)
-                total_duplicate_records = cursor.fetchone()[0] or 0
+                total_records, unique_urls, duplicate_url_count, total_duplicate_records = cursor.fetchone()
                 
                 stats = {
                     'total_records': total_records,
@@ -81,6 +71,19 @@ class DuplicateCleanup:
             logger.error(f"Error getting duplicate stats: {e}")
             raise
     
+    def has_duplicates(self) -> bool:
+        """Probe rẻ: dừng ở URL trùng lặp đầu tiên thay vì tính đủ stats"""
+        with self.db_manager.get_connection() as conn:
+            cursor = conn.execute("""
+                SELECT 1
+                FROM contact_html_storage
+                WHERE url IS NOT NULL AND url != ''
+                GROUP BY url
+                HAVING COUNT(*) > 1
+                LIMIT 1
+            """)
+            return cursor.fetchone() is not None
+    
     def cleanup_duplicates(self, keep_oldest: bool = True) -> Dict[str, int]:
         """Xóa các records trùng lặp, giữ lại record cũ nhất hoặc mới nhất"""
         logger.info(f"Starting duplicate cleanup (keep_oldest={keep_oldest})...")
@@ -89,54 +92,31 @@ class DuplicateCleanup:
             with self.db_manager.get_connection() as conn:
                 cursor = conn.cursor()
                 
-                # Tìm các URL trùng lặp
+                # Mặc định toàn bộ dedup trong 1 transaction (đếm + DELETE), giữ write lock từ đầu;
+                # lỗi giữa chừng -> rollback. delete_chunk_size > 0: commit theo chunk (opt-in)
+                cursor.execute("BEGIN IMMEDIATE")
+                
                 cursor.execute("""
-                    SELECT url, COUNT(*) as count
-                    FROM contact_html_storage
-                    WHERE url IS NOT NULL AND url != ''
-                    GROUP BY url
-                    HAVING COUNT(*) > 1
-                    ORDER BY count DESC
+                    SELECT COUNT(*)
+                    FROM (
+                        SELECT 1
+                        FROM contact_html_storage
+                        WHERE url IS NOT NULL AND url != ''
+                        GROUP BY url
+                        HAVING COUNT(*) > 1
+                    )
                 """)
+                total_kept = cursor.fetchone()[0]
+                logger.info("Found %d URLs with duplicates", total_kept)
                 
-                duplicate_urls = cursor.fetchall()
-                logger.info(f"Found {len(duplicate_urls)} URLs with duplicates")
-                
-                total_kept = 0
-                total_deleted = 0
-                
-                for url, count in duplicate_urls:
-                    logger.info(f"Processing URL: {url} ({count} duplicates)")
-                    
-                    # Lấy tất cả records cho URL này
-                    order_clause = "ORDER BY created_at ASC" if keep_oldest else "ORDER BY created_at DESC"
-                    cursor.execute(f"""
-                        SELECT id, created_at
-                        FROM contact_html_storage
-                        WHERE url = ?
-                        {order_clause}
-                    """, (url,))
-                    
-                    records = cursor.fetchall()
-                    
-                    # Giữ lại record đầu tiên
-                    keep_record = records[0]
-                    delete_records = records[1:]
-                    
-                    logger.info(f"  Keeping record ID: {keep_record[0]} (created: {keep_record[1]})")
-                    logger.info(f"  Deleting {len(delete_records)} duplicate records")
-                    
-                    # Xóa các record trùng lặp
-                    for record_id, _ in delete_records:
-                        cursor.execute("DELETE FROM contact_html_storage WHERE id = ?", (record_id,))
-                        total_deleted += 1
-                    
-                    total_kept += 1
+                total_deleted = delete_duplicates(
+                    cursor, "contact_html_storage", "url", keep_oldest, commit_every=self.delete_chunk_size
+                )
                 
                 conn.commit()
                 
                 result = {
-                    'duplicate_urls_processed': len(duplicate_urls),
+                    'duplicate_urls_processed': total_kept,
                     'records_kept': total_kept,
                     'records_deleted': total_deleted
                 }
@@ -148,12 +128,74 @@ class DuplicateCleanup:
             logger.error(f"Error during cleanup: {e}")
             raise
     
-    def run_cleanup(self, keep_oldest: bool = True, dry_run: bool = False) -> Dict[str, Any]:
+    def _create_dedup_index(self) -> bool:
+        """Tạo partial covering index cho stats/cleanup; trả True nếu index do mình tạo"""
+        with self.db_manager.get_connection() as conn:
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (DEDUP_INDEX_NAME,)
+            ).fetchone()
+            if exists:
+                return False
+            conn.execute(f"""
+                CREATE INDEX {DEDUP_INDEX_NAME}
+                ON contact_html_storage(url, created_at)
+                WHERE url IS NOT NULL AND url != ''
+            """)
+            return True
+    
+    def _drop_dedup_index(self):
+        """Bỏ index tạm sau khi cleanup (tránh chi phí ghi lâu dài cho insert)"""
+        with self.db_manager.get_connection() as conn:
+            conn.execute(f"DROP INDEX IF EXISTS {DEDUP_INDEX_NAME}")
+    
+    def _db_size_bytes(self, conn: sqlite3.Connection) -> int:
+        """Kích thước logic của DB (page_count * page_size, không phụ thuộc WAL checkpoint)"""
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        return page_count * page_size
+    
+    def _compact(self, vacuum: bool = True) -> Dict[str, int]:
+        """ANALYZE (+ VACUUM) sau khi xóa hàng loạt: refresh stats cho planner, thu hồi pages trống"""
+        conn = self.db_manager.get_connection()
+        size_before = self._db_size_bytes(conn)
+        
+        conn.execute("ANALYZE contact_html_storage")
+        if vacuum:
+            # VACUUM cần exclusive lock và ghi lại toàn bộ file DB; chạy ngoài transaction
+            logger.info("Running VACUUM...")
+            conn.execute("VACUUM")
+        
+        size_after = self._db_size_bytes(conn)
+        logger.info("Database size: %.1fMB → %.1fMB", size_before / 2**20, size_after / 2**20)
+        return {'size_before_bytes': size_before, 'size_after_bytes': size_after}
+    
+    def run_cleanup(self, keep_oldest: bool = True, dry_run: bool = False, vacuum: bool = True) -> Dict[str, Any]:
         """Chạy cleanup process"""
         logger.info("=" * 80)
         logger.info("DUPLICATE CLEANUP STARTED")
         logger.info("=" * 80)
         
+        # Dry run chỉ cần biết có việc hay không: probe trước, không ghi gì vào DB (kể cả index)
+        if dry_run:
+            if not self.has_duplicates():
+                logger.info("No duplicates found! Nothing to clean up.")
+                return {'status': 'no_duplicates'}
+            return self._run_cleanup(keep_oldest, dry_run)
+        
+        # Cleanup là tác vụ 1 lần: index chỉ sống trong lúc chạy
+        created_index = self._create_dedup_index()
+        try:
+            result = self._run_cleanup(keep_oldest, dry_run)
+        finally:
+            if created_index:
+                self._drop_dedup_index()
+        
+        # Compact sau khi đã drop index tạm (VACUUM không phải rebuild index đó)
+        if result['status'] == 'completed' and result['cleanup_result']['records_deleted'] > 0:
+            result['db_size'] = self._compact(vacuum)
+        return result
+    
+    def _run_cleanup(self, keep_oldest: bool, dry_run: bool) -> Dict[str, Any]:
         # Lấy stats trước khi cleanup
         logger.info("\n" + "=" * 50)
         logger.info("STATISTICS BEFORE CLEANUP")
@@ -211,13 +253,17 @@ def main():
     parser.add_argument('--keep-newest', action='store_true', help='Keep newest records instead of oldest (default: keep oldest)')
     parser.add_argument('--dry-run', action='store_true', help='Show what would be done without making changes')
     parser.add_argument('--db-path', type=str, default='data/crawler.db', help='Database path')
+    parser.add_argument('--vacuum', action=argparse.BooleanOptionalAction, default=True,
+                        help='VACUUM the database after cleanup (default: on; needs an exclusive lock)')
+    parser.add_argument('--delete-chunk-size', type=int, default=0,
+                        help='Delete duplicates in chunks, committing every N rows (default: 0 = one transaction)')
     
     args = parser.parse_args()
     
     try:
-        cleanup = DuplicateCleanup(args.db_path)
+        cleanup = DuplicateCleanup(args.db_path, delete_chunk_size=args.delete_chunk_size)
         keep_oldest = not args.keep_newest
-        result = cleanup.run_cleanup(keep_oldest=keep_oldest, dry_run=args.dry_run)
+        result = cleanup.run_cleanup(keep_oldest=keep_oldest, dry_run=args.dry_run, vacuum=args.vacuum)
         
         if result['status'] == 'completed':
             logger.info("✅ Cleanup completed successfully!")
@@ -3,10 +3,18 @@ YAML Configuration Loader for Crawler
 """
 
 import os
+import copy
 import yaml
-from typing import Dict, Any, List, Tuple
+from types import MappingProxyType
+from typing import Dict, Any, List, Mapping, Tuple
 from pathlib import Path
 
+# libyaml C loader khi có (nhanh hơn nhiều lần), fallback pure-Python SafeLoader
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# path -> (mtime_ns, parsed config): mỗi file chỉ parse lại khi bị sửa
+_CONFIG_CACHE: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+
 
 class CrawlerConfig:
     """Load and manage YAML configuration files"""
@@ -14,6 +22,10 @@ class CrawlerConfig:
     def __init__(self, config_name: str = "default"):
         self.config_name = config_name
         self.config_data = self._load_yaml_config(config_name)
+        # View read-only dựng 1 lần: getter trả O(1), không copy mỗi lần gọi
+        self._processing_ro = MappingProxyType(self.processing_config)
+        self._output_ro = MappingProxyType(self.output_config)
+        self._fieldnames_ro = tuple(self.fieldnames)
     
     def _load_yaml_config(self, config_name: str) -> Dict[str, Any]:
         """Load YAML configuration file"""
@@ -26,8 +38,16 @@ class CrawlerConfig:
             if not config_file.exists():
                 raise FileNotFoundError(f"Config file not found: {config_name}.yml or default.yml")
         
-        with open(config_file, 'r', encoding='utf-8') as f:
-            return yaml.safe_load(f)
+        cache_key = str(config_file)
+        mtime_ns = config_file.stat().st_mtime_ns
+        cached = _CONFIG_CACHE.get(cache_key)
+        if cached is None or cached[0] != mtime_ns:
+            with open(config_file, 'r', encoding='utf-8') as f:
+                cached = (mtime_ns, yaml.load(f, Loader=_YAML_LOADER))
+            _CONFIG_CACHE[cache_key] = cached
+        
+        # Mỗi instance nhận bản copy riêng: config_data có thể bị sửa (vd. trong tests)
+        return copy.deepcopy(cached[1])
     
     @property
     def website_config(self) -> Dict[str, str]:
@@ -64,7 +84,8 @@ class CrawlerConfig:
         """Get xpath with optional formatting"""
         xpath = self.xpath_config.get(key, "")
         if kwargs:
-            xpath = xpath.format(**kwargs)
+            # format_map dùng thẳng dict kwargs, không unpack/repack như format(**kwargs)
+            xpath = xpath.format_map(kwargs)
         return xpath
     
     def get_crawl4ai_query(self, source: str) -> str:
@@ -75,17 +96,17 @@ class CrawlerConfig:
             return self.crawl4ai_config.get("facebook_query", "")
         return ""
     
-    def get_processing_config(self) -> Dict[str, Any]:
-        """Get processing configuration"""
-        return self.processing_config.copy()
+    def get_processing_config(self) -> Mapping[str, Any]:
+        """Get processing configuration (read-only view)"""
+        return self._processing_ro
     
-    def get_output_config(self) -> Dict[str, Any]:
-        """Get output configuration"""
-        return self.output_config.copy()
+    def get_output_config(self) -> Mapping[str, Any]:
+        """Get output configuration (read-only view)"""
+        return self._output_ro
     
-    def get_fieldnames(self) -> List[str]:
-        """Get CSV fieldnames"""
-        return self.fieldnames.copy()
+    def get_fieldnames(self) -> Tuple[str, ...]:
+        """Get CSV fieldnames (tuple, read-only)"""
+        return self._fieldnames_ro
     
     
     def list_available_configs(self) -> List[str]:
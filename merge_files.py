@@ -6,12 +6,21 @@ Sử dụng khi cần gộp lại file sau khi quá trình crawl bị gián đo
 
 import os
 import sys
-import glob
 import csv
 import argparse
-import re
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from operator import itemgetter
 from config import CrawlerConfig
 
+# Số rows mỗi chunk đọc từ task file: lọc/expand/ghi theo chunk, RAM giới hạn theo chunk
+MERGE_CHUNK_SIZE = 10_000
+
+# Các byte ASCII không phải số, xóa bằng bytes.translate (C thuần, không qua regex engine)
+_ASCII_NON_DIGITS = bytes(c for c in range(128) if not chr(c).isdigit())
+
 
 def clean_phone_number(phone: str) -> str:
     """Clean and format phone number to start with +, giữ format text"""
@@ -19,7 +28,11 @@ def clean_phone_number(phone: str) -> str:
         return "N/A"
     
     # Remove all non-digits
-    digits_only = re.sub(r'[^\d]', '', phone)
+    if phone.isascii():
+        digits_only = phone.encode('ascii').translate(None, _ASCII_NON_DIGITS).decode('ascii')
+    else:
+        # str.isdecimal khớp đúng tập chữ số Unicode mà \d của re khớp
+        digits_only = ''.join(filter(str.isdecimal, phone))
     
     # If no digits
     if not digits_only:
@@ -47,41 +60,44 @@ def clean_phone_number(phone: str) -> str:
     return formatted_phone
 
 
-def filter_na_rows(rows, max_na_percentage: float = 0.7):
+def filter_na_rows(rows, total_fields: int, max_na_percentage: float = 0.7):
     """
     Filter out rows with too many N/A values
     
     Args:
-        rows: List of rows data
+        rows: List of csv rows (list giá trị theo thứ tự header)
+        total_fields: Number of fields per row (theo header)
         max_na_percentage: Maximum allowed N/A percentage (0.0 - 1.0). Default 70%
     
     Returns:
         List of filtered rows
     """
-    if not rows:
+    if total_fields <= 0:
         return rows
     
     filtered_rows = []
-    total_fields = len(rows[0]) if rows else 0
-    
     for row in rows:
-        # Count number of fields with N/A value
-        na_count = sum(1 for value in row.values() if value == "N/A" or value is None)
-        na_percentage = na_count / total_fields if total_fields > 0 else 0
+        # list.count chạy trong C; field thiếu ở row bị cắt ngắn tính là N/A (None)
+        missing = total_fields - len(row)
+        if missing >= 0:
+            na_count = row.count("N/A") + missing
+        else:
+            na_count = row[:total_fields].count("N/A")
         
         # Keep only rows with N/A percentage below threshold
-        if na_percentage <= max_na_percentage:
+        if na_count / total_fields <= max_na_percentage:
             filtered_rows.append(row)
     
     return filtered_rows
 
 
-def expand_emails(rows, max_emails: int = 3):
+def expand_emails(rows, email_index: int, max_emails: int = 3):
     """
     Duplicate rows for multiple emails
     
     Args:
-        rows: List of rows data
+        rows: List of csv rows
+        email_index: Vị trí cột extracted_emails trong row
         max_emails: Maximum number of emails per row (default 3)
     
     Returns:
@@ -90,11 +106,17 @@ def expand_emails(rows, max_emails: int = 3):
     expanded_rows = []
     
     for row in rows:
-        emails_str = row.get("extracted_emails", "N/A")
+        emails_str = row[email_index] if email_index < len(row) else None
         
         if emails_str == "N/A" or not emails_str:
             # No email, keep row
             expanded_rows.append(row)
+        elif ";" not in emails_str:
+            # 1 email (trường hợp phổ biến): strip thẳng, không tạo list
+            email = emails_str.strip()
+            if email:
+                row[email_index] = email
+                expanded_rows.append(row)
         else:
             # Split emails
             emails = [email.strip() for email in emails_str.split(";") if email.strip()]
@@ -104,33 +126,142 @@ def expand_emails(rows, max_emails: int = 3):
             
             if len(emails) == 1:
                 # Only one email, keep row
-                row["extracted_emails"] = emails[0]
+                row[email_index] = emails[0]
                 expanded_rows.append(row)
             else:
                 # Multiple emails, create multiple rows
                 for email in emails:
                     new_row = row.copy()
-                    new_row["extracted_emails"] = email
+                    new_row[email_index] = email
                     expanded_rows.append(new_row)
     
     return expanded_rows
 
 
-def manual_merge(output_dir: str, final_output_path: str, config_name: str = "default", max_na_percentage: float = 0.7, max_emails: int = 3):
+def _merge_task_file(task_file: str, writer, fieldnames, max_na_percentage: float, max_emails: int):
+    """Filter/expand 1 task file theo chunk và ghi vào writer; trả (original, filtered, expanded)"""
+    original_count = 0
+    filtered_count = 0
+    expanded_count = 0
+    
+    with open(task_file, 'r', newline='', encoding='utf-8-sig') as infile:
+        # csv.reader trả list thay vì dict mỗi row như DictReader; bỏ dòng trống như DictReader
+        rows = filter(None, csv.reader(infile))
+        header = next(rows, None)
+        if header is None:
+            return original_count, filtered_count, expanded_count
+        
+        total_fields = len(header)
+        columns = {name: i for i, name in enumerate(header)}
+        email_index = columns.get("extracted_emails")
+        unknown = [name for name in columns if name not in fieldnames]
+        # Row được pad '' tới total_fields + 1 -> fieldname không có trong file lấy ô '' cuối
+        pad = [''] * (total_fields + 1)
+        to_output = itemgetter(*(columns.get(name, total_fields) for name in fieldnames))
+        if len(fieldnames) == 1:
+            getter = to_output
+            to_output = lambda row: (getter(row),)
+        
+        while True:
+            chunk = list(islice(rows, MERGE_CHUNK_SIZE))
+            if not chunk:
+                break
+            original_count += len(chunk)
+            
+            # Filter out rows with N/A
+            chunk = filter_na_rows(chunk, total_fields, max_na_percentage)
+            filtered_count += len(chunk)
+            
+            # Expand emails
+            if email_index is not None:
+                chunk = expand_emails(chunk, email_index, max_emails)
+            if not chunk:
+                continue
+            expanded_count += len(chunk)
+            
+            # Cùng điều kiện lỗi với csv.DictWriter(extrasaction='raise')
+            if unknown:
+                raise ValueError(f"dict contains fields not in fieldnames: {', '.join(map(repr, unknown))}")
+            if max(map(len, chunk)) > total_fields:
+                raise ValueError("dict contains fields not in fieldnames: None")
+            
+            # Write filtered and expanded rows: reorder theo fieldnames bằng itemgetter, 1 lần writerows
+            writer.writerows(map(to_output, (row + pad[len(row):] for row in chunk)))
+    
+    return original_count, filtered_count, expanded_count
+
+
+def _merge_task_file_to_part(task_file: str, part_path: str, fieldnames, max_na_percentage: float, max_emails: int):
+    """Chạy trong worker process: ghi rows đã xử lý của 1 task file ra part file (không header)"""
+    with open(part_path, 'w', newline='', encoding='utf-8') as part:
+        return _merge_task_file(task_file, csv.writer(part), fieldnames, max_na_percentage, max_emails)
+
+
+def _merge_task_files(task_files, outfile, fieldnames, max_na_percentage: float, max_emails: int, max_workers: int):
+    """Yield (task_file, counts | Exception) theo thứ tự file, rows đã được ghi vào outfile"""
+    if max_workers <= 1:
+        writer = csv.writer(outfile)
+        for task_file in task_files:
+            try:
+                yield task_file, _merge_task_file(task_file, writer, fieldnames, max_na_percentage, max_emails)
+            except Exception as e:
+                yield task_file, e
+        return
+    
+    # Các task file được xử lý song song trên nhiều process (mỗi file ra 1 part file tạm),
+    # process chính chỉ nối các part theo thứ tự file
+    parts_dir = tempfile.mkdtemp(prefix=".merge_parts_", dir=os.path.dirname(outfile.name) or ".")
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            part_paths = [os.path.join(parts_dir, f"{i}.csv") for i in range(len(task_files))]
+            futures = [
+                executor.submit(_merge_task_file_to_part, task_file, part_path, fieldnames, max_na_percentage, max_emails)
+                for task_file, part_path in zip(task_files, part_paths)
+            ]
+            for task_file, part_path, future in zip(task_files, part_paths, futures):
+                try:
+                    counts = future.result()
+                    # Nối part file (bytes) vào output
+                    outfile.flush()
+                    with open(part_path, 'rb') as part:
+                        shutil.copyfileobj(part, outfile.buffer)
+                except Exception as e:
+                    yield task_file, e
+                    continue
+                yield task_file, counts
+    finally:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+
+
+def _find_task_files(output_dir: str):
+    """Sorted paths of task_*.csv files in output_dir (empty list if the dir is missing)"""
+    try:
+        with os.scandir(output_dir) as it:
+            task_files = [
+                entry.path for entry in it
+                if entry.name.startswith("task_") and entry.name.endswith(".csv") and entry.is_file()
+            ]
+    except FileNotFoundError:
+        return []
+    task_files.sort()
+    return task_files
+
+
+def manual_merge(output_dir: str, final_output_path: str, config_name: str = "default", max_na_percentage: float = 0.7, max_emails: int = 3, workers: int = None):
     """Manual merge CSV files without Celery and filter out N/A rows."""
     
     # Load config
     config = CrawlerConfig(config_name)
     
-    # Find all task_*.csv files
-    task_files = glob.glob(os.path.join(output_dir, "task_*.csv"))
+    # Find all task_*.csv files: 1 lượt scandir, lọc theo tên (không qua fnmatch như glob)
+    task_files = _find_task_files(output_dir)
     
     if not task_files:
         print(f"No task file found in directory: {output_dir}")
         return
     
     print(f"Found {len(task_files)} task files:")
-    for f in sorted(task_files):
+    for f in task_files:
         print(f"  - {f}")
     
     total_rows = 0
@@ -141,32 +272,21 @@ def manual_merge(output_dir: str, final_output_path: str, config_name: str = "de
     os.makedirs(os.path.dirname(final_output_path) or ".", exist_ok=True)
     
     with open(final_output_path, 'w', newline='', encoding='utf-8-sig') as outfile:
-        writer = csv.DictWriter(outfile, fieldnames=config.get_fieldnames())
-        writer.writeheader()
+        fieldnames = config.get_fieldnames()
+        # Ghi list đã sắp theo fieldnames (cùng dialect với csv.DictWriter, không tạo dict mỗi row)
+        csv.writer(outfile).writerow(fieldnames)
         
-        for task_file in sorted(task_files):
+        max_workers = min(workers or os.cpu_count() or 1, len(task_files))
+        for task_file, result in _merge_task_files(task_files, outfile, fieldnames, max_na_percentage, max_emails, max_workers):
             try:
-                with open(task_file, 'r', newline='', encoding='utf-8-sig') as infile:
-                    reader = csv.DictReader(infile)
-                    file_rows = list(reader)
-                    
-                    # Filter out rows with N/A
-                    original_count = len(file_rows)
-                    filtered_file_rows = filter_na_rows(file_rows, max_na_percentage)
-                    filtered_count = len(filtered_file_rows)
-                    
-                    # Expand emails
-                    expanded_file_rows = expand_emails(filtered_file_rows, max_emails)
-                    expanded_count = len(expanded_file_rows)
-                    
-                    # Write filtered and expanded rows
-                    for row in expanded_file_rows:
-                        writer.writerow(row)
-                        total_rows += 1
-                    
-                    filtered_rows += (original_count - filtered_count)
-                    expanded_rows += (expanded_count - filtered_count)
-                    print(f"Merged file {task_file}: {filtered_count}/{original_count} rows kept (filtered {original_count - filtered_count} NA rows, expanded {expanded_count - filtered_count} email rows)")
+                if isinstance(result, Exception):
+                    raise result
+                original_count, filtered_count, expanded_count = result
+                
+                total_rows += expanded_count
+                filtered_rows += (original_count - filtered_count)
+                expanded_rows += (expanded_count - filtered_count)
+                print(f"Merged file {task_file}: {filtered_count}/{original_count} rows kept (filtered {original_count - filtered_count} NA rows, expanded {expanded_count - filtered_count} email rows)")
                         
                 # Ask if want to delete task file
                 if input(f"Delete file {task_file}? (y/N): ").lower() == 'y':
@@ -194,6 +314,7 @@ def main():
     parser.add_argument("--auto-delete", action="store_true", help="Automatically delete task file after merge")
     parser.add_argument("--max-na-percentage", type=float, default=0.7, help="Rate of N/A allowed (0.0-1.0, default 0.7)")
     parser.add_argument("--max-emails", type=int, default=3, help="Max emails per row (default 3)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of processes for task files (default: CPU count)")
     
     args = parser.parse_args()
     
@@ -201,7 +322,7 @@ def main():
         print(f"Directory does not exist: {args.output_dir}")
         return
     
-    manual_merge(args.output_dir, args.final_output, args.config, args.max_na_percentage, args.max_emails)
+    manual_merge(args.output_dir, args.final_output, args.config, args.max_na_percentage, args.max_emails, args.workers)
 
 if __name__ == "__main__":
     main()
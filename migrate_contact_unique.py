@@ -13,6 +13,7 @@ from typing import Dict, Any
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from app.database.db_manager import DatabaseManager
+from app.database.dedup import delete_duplicates
 
 # Setup logging
 logging.basicConfig(
@@ -21,51 +22,69 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Partial covering index tạm cho PARTITION BY url ORDER BY created_at (id là rowid)
+DEDUP_INDEX_NAME = "idx_chs_url_created"
+
 class ContactMigration:
     def __init__(self, db_path: str = "data/crawler.db"):
         self.db_path = db_path
         self.db_manager = DatabaseManager(db_path)
+        # get_connection đã bật WAL/synchronous=NORMAL/temp_store=MEMORY/mmap và là thread-local:
+        # mọi bước migration dùng chung 1 connection; thêm cache lớn cho GROUP BY/DELETE/index build
+        self._conn = self.db_manager.get_connection()
+        self._conn.execute("PRAGMA cache_size=-200000;")     # 200 MiB
+    
+    def close(self):
+        """Trả connection thread-local về PRAGMA mặc định của DatabaseManager"""
+        self._conn.execute("PRAGMA cache_size=10000;")
     
-    def analyze_duplicates(self) -> Dict[str, Any]:
-        """Phân tích các URL trùng lặp trong contact_html_storage"""
+    def analyze_duplicates(self, verbose: bool = False) -> Dict[str, Any]:
+        """Phân tích các URL trùng lặp trong contact_html_storage (verbose: kèm top 10 URL trùng lặp)"""
         logger.info("Analyzing duplicates in contact_html_storage...")
         
         try:
             with self.db_manager.get_connection() as conn:
                 cursor = conn.cursor()
                 
-                # Tìm các URL trùng lặp
+                # Số liệu tổng hợp trong 1 lần GROUP BY url (không kéo toàn bộ danh sách URL trùng lặp về Python)
                 cursor.execute("""
-                    SELECT url, COUNT(*) as count
-                    FROM contact_html_storage
-                    WHERE url IS NOT NULL AND url != ''
-                    GROUP BY url
-                    HAVING COUNT(*) > 1
-                    ORDER BY count DESC
+                    SELECT
+                        (SELECT COUNT(*) FROM contact_html_storage),        -- Tổng số records
+                        COUNT(*),                                            -- Số URL duy nhất
+                        COALESCE(SUM(count > 1), 0),                         -- Số URL trùng lặp
+                        COALESCE(SUM(CASE WHEN count > 1 THEN count END), 0) -- Tổng records của các URL trùng lặp
+                    FROM (
+                        SELECT COUNT(*) as count
+                        FROM contact_html_storage
+                        WHERE url IS NOT NULL AND url != ''
+                        GROUP BY url
+                    )
                 """)
+                total_records, unique_urls, duplicate_urls_count, total_duplicates = cursor.fetchone()
+                logger.info(f"Found {duplicate_urls_count} URLs with duplicates")
                 
-                duplicate_urls = cursor.fetchall()
-                logger.info(f"Found {len(duplicate_urls)} URLs with duplicates")
-                
-                total_duplicates = 0
-                for url, count in duplicate_urls:
-                    total_duplicates += count
-                    logger.info(f"  {url}: {count} duplicates")
-                
-                # Tổng số records
-                cursor.execute("SELECT COUNT(*) FROM contact_html_storage")
-                total_records = cursor.fetchone()[0]
-                
-                # Số URL duy nhất
-                cursor.execute("SELECT COUNT(DISTINCT url) FROM contact_html_storage WHERE url IS NOT NULL AND url != ''")
-                unique_urls = cursor.fetchone()[0]
+                # Top 10 chỉ để hiển thị: tốn thêm 1 lượt GROUP BY -> chỉ chạy khi verbose/DEBUG
+                top_duplicate_urls = []
+                if duplicate_urls_count and (verbose or logger.isEnabledFor(logging.DEBUG)):
+                    cursor.execute("""
+                        SELECT url, COUNT(*) as count
+                        FROM contact_html_storage
+                        WHERE url IS NOT NULL AND url != ''
+                        GROUP BY url
+                        HAVING COUNT(*) > 1
+                        ORDER BY count DESC
+                        LIMIT 10
+                    """)
+                    top_duplicate_urls = cursor.fetchall()
+                    for url, count in top_duplicate_urls:
+                        logger.info(f"  {url}: {count} duplicates")
                 
                 result = {
                     'total_records': total_records,
                     'unique_urls': unique_urls,
-                    'duplicate_urls_count': len(duplicate_urls),
+                    'duplicate_urls_count': duplicate_urls_count,
                     'total_duplicates': total_duplicates,
-                    'duplicate_urls': duplicate_urls[:10]  # Top 10
+                    'duplicate_urls': top_duplicate_urls  # Top 10
                 }
                 
                 logger.info(f"Analysis completed: {result}")
@@ -83,55 +102,28 @@ class ContactMigration:
             with self.db_manager.get_connection() as conn:
                 cursor = conn.cursor()
                 
-                # Tìm các record trùng lặp
+                # Đếm + DELETE trong 1 transaction, giữ write lock từ đầu (số liệu khớp với phần bị xóa)
+                cursor.execute("BEGIN IMMEDIATE")
+                
                 cursor.execute("""
-                    SELECT url, COUNT(*) as count
-                    FROM contact_html_storage
-                    WHERE url IS NOT NULL AND url != ''
-                    GROUP BY url
-                    HAVING COUNT(*) > 1
-                    ORDER BY count DESC
+                    SELECT COUNT(*), COALESCE(SUM(count), 0)
+                    FROM (
+                        SELECT COUNT(*) as count
+                        FROM contact_html_storage
+                        WHERE url IS NOT NULL AND url != ''
+                        GROUP BY url
+                        HAVING COUNT(*) > 1
+                    )
                 """)
+                total_kept, total_duplicates = cursor.fetchone()
+                logger.info("Found %d URLs with duplicates", total_kept)
                 
-                duplicate_urls = cursor.fetchall()
-                logger.info(f"Found {len(duplicate_urls)} URLs with duplicates")
-                
-                total_duplicates = 0
-                total_kept = 0
-                total_deleted = 0
-                
-                for url, count in duplicate_urls:
-                    logger.info(f"Processing URL: {url} ({count} duplicates)")
-                    
-                    # Lấy tất cả records cho URL này
-                    cursor.execute("""
-                        SELECT id, created_at
-                        FROM contact_html_storage
-                        WHERE url = ?
-                        ORDER BY created_at ASC
-                    """, (url,))
-                    
-                    records = cursor.fetchall()
-                    
-                    # Giữ lại record đầu tiên (oldest)
-                    keep_record = records[0]
-                    delete_records = records[1:]
-                    
-                    logger.info(f"  Keeping record ID: {keep_record[0]} (created: {keep_record[1]})")
-                    logger.info(f"  Deleting {len(delete_records)} duplicate records")
-                    
-                    # Xóa các record trùng lặp
-                    for record_id, _ in delete_records:
-                        cursor.execute("DELETE FROM contact_html_storage WHERE id = ?", (record_id,))
-                        total_deleted += 1
-                    
-                    total_kept += 1
-                    total_duplicates += count
+                total_deleted = delete_duplicates(cursor, "contact_html_storage", "url")
                 
                 conn.commit()
                 
                 result = {
-                    'duplicate_urls': len(duplicate_urls),
+                    'duplicate_urls': total_kept,
                     'total_duplicates': total_duplicates,
                     'total_kept': total_kept,
                     'total_deleted': total_deleted
@@ -144,46 +136,42 @@ class ContactMigration:
             logger.error(f"Error during deduplication: {e}")
             raise
     
+    def _create_dedup_index(self) -> bool:
+        """Tạo partial covering index cho bước dedup; trả True nếu index do mình tạo"""
+        with self.db_manager.get_connection() as conn:
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (DEDUP_INDEX_NAME,)
+            ).fetchone()
+            if exists:
+                return False
+            conn.execute(f"""
+                CREATE INDEX {DEDUP_INDEX_NAME}
+                ON contact_html_storage(url, created_at)
+                WHERE url IS NOT NULL AND url != ''
+            """)
+            return True
+    
+    def _drop_dedup_index(self):
+        """Bỏ index tạm sau dedup (uq_chs_url/idx_contact_html_url phục vụ lookup về sau)"""
+        with self.db_manager.get_connection() as conn:
+            conn.execute(f"DROP INDEX IF EXISTS {DEDUP_INDEX_NAME}")
+    
     def add_unique_constraint(self) -> bool:
         """Thêm unique constraint cho cột url trong contact_html_storage"""
         logger.info("Adding unique constraint to contact_html_storage.url...")
         
         try:
             with self.db_manager.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                # Tạo bảng mới với unique constraint
-                cursor.execute("""
-                    CREATE TABLE contact_html_storage_new (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        company_name TEXT NOT NULL,
-                        url TEXT NOT NULL UNIQUE,
-                        url_type TEXT NOT NULL,
-                        html_content TEXT NOT NULL,
-                        crawled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        status TEXT DEFAULT 'pending',
-                        retry_count INTEGER DEFAULT 0,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                # Copy data từ bảng cũ
-                cursor.execute("""
-                    INSERT INTO contact_html_storage_new 
-                    SELECT * FROM contact_html_storage
+                # Unique partial index thay vì rebuild bảng (không copy toàn bộ html_content);
+                # bỏ qua url rỗng như bước dedup. Writers dùng ON CONFLICT DO NOTHING trên index này
+                conn.execute("""
+                    CREATE UNIQUE INDEX IF NOT EXISTS uq_chs_url
+                    ON contact_html_storage(url)
+                    WHERE url IS NOT NULL AND url != ''
                 """)
-                
-                # Drop bảng cũ và rename bảng mới
-                cursor.execute("DROP TABLE contact_html_storage")
-                cursor.execute("ALTER TABLE contact_html_storage_new RENAME TO contact_html_storage")
-                
-                # Tạo lại indexes
-                cursor.execute("CREATE INDEX IF NOT EXISTS idx_contact_html_status ON contact_html_storage(status)")
-                cursor.execute("CREATE INDEX IF NOT EXISTS idx_contact_html_company ON contact_html_storage(company_name)")
-                cursor.execute("CREATE INDEX IF NOT EXISTS idx_contact_html_type ON contact_html_storage(url_type)")
-                cursor.execute("CREATE INDEX IF NOT EXISTS idx_contact_html_url ON contact_html_storage(url)")
-                
                 conn.commit()
+                # Migration ghi hàng loạt: checkpoint và cắt WAL về 0 để thu hồi dung lượng
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
                 
                 logger.info("Unique constraint added successfully!")
                 return True
@@ -192,7 +180,7 @@ class ContactMigration:
             logger.error(f"Error adding unique constraint: {e}")
             raise
     
-    def run_migration(self, dry_run: bool = False) -> Dict[str, Any]:
+    def run_migration(self, dry_run: bool = False, verbose: bool = False) -> Dict[str, Any]:
         """Chạy migration process"""
         logger.info("=" * 80)
         logger.info("CONTACT STORAGE MIGRATION STARTED")
@@ -202,7 +190,7 @@ class ContactMigration:
         logger.info("\n" + "=" * 50)
         logger.info("ANALYZING DUPLICATES")
         logger.info("=" * 50)
-        analysis = self.analyze_duplicates()
+        analysis = self.analyze_duplicates(verbose=verbose)
         
         if analysis['duplicate_urls_count'] == 0:
             logger.info("No duplicates found! Adding unique constraint directly...")
@@ -218,7 +206,13 @@ class ContactMigration:
         logger.info("\n" + "=" * 50)
         logger.info("DEDUPLICATING RECORDS")
         logger.info("=" * 50)
-        dedup_result = self.deduplicate_contact_storage()
+        # Index chỉ sống trong lúc dedup: ranking đọc từ index, không sort lại cả bảng
+        created_index = self._create_dedup_index()
+        try:
+            dedup_result = self.deduplicate_contact_storage()
+        finally:
+            if created_index:
+                self._drop_dedup_index()
         
         # Thêm unique constraint
         logger.info("\n" + "=" * 50)
@@ -230,7 +224,12 @@ class ContactMigration:
         logger.info("\n" + "=" * 50)
         logger.info("VERIFICATION")
         logger.info("=" * 50)
-        final_analysis = self.analyze_duplicates()
+        # uq_chs_url vừa build thành công đã là bằng chứng không còn URL trùng lặp:
+        # chỉ cần COUNT(*), không GROUP BY lại cả bảng
+        with self.db_manager.get_connection() as conn:
+            total_records = conn.execute("SELECT COUNT(*) FROM contact_html_storage").fetchone()[0]
+        final_analysis = {'total_records': total_records, 'verified': constraint_added}
+        logger.info(f"Records after migration: {total_records}")
         
         result = {
             'status': 'completed',
@@ -254,12 +253,14 @@ def main():
     parser = argparse.ArgumentParser(description='Migrate contact_html_storage to add unique constraint')
     parser.add_argument('--dry-run', action='store_true', help='Show what would be done without making changes')
     parser.add_argument('--db-path', type=str, default='data/crawler.db', help='Database path')
+    parser.add_argument('--verbose', action='store_true', help='Also list the top 10 duplicated URLs (extra GROUP BY scan)')
     
     args = parser.parse_args()
     
+    migration = None
     try:
         migration = ContactMigration(args.db_path)
-        result = migration.run_migration(dry_run=args.dry_run)
+        result = migration.run_migration(dry_run=args.dry_run, verbose=args.verbose)
         
         if result['status'] == 'completed':
             logger.info("✅ Migration completed successfully!")
@@ -271,6 +272,9 @@ def main():
     except Exception as e:
         logger.error(f"Migration failed: {e}")
         sys.exit(1)
+    finally:
+        if migration is not None:
+            migration.close()
 
 if __name__ == "__main__":
     main()
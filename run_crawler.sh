@@ -155,7 +155,7 @@ show_status() {
     
     # Check data directory
     if [ -d "data" ]; then
-        local checkpoint_count=$(find data -name "checkpoint_*.json" 2>/dev/null | wc -l)
+        local checkpoint_count=$(find data -name "checkpoint_*.json*" 2>/dev/null | wc -l)
         local csv_exists=""
         if [ -f "data/company_contacts.csv" ]; then
             csv_exists=" (CSV exists)"
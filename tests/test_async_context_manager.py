@@ -0,0 +1,187 @@
+import asyncio
+import time
+import pytest
+
+pytest.importorskip("playwright.async_api")
+pytest.importorskip("crawl4ai")
+
+from app.crawler import contact_crawler as contact_module
+from app.crawler import detail_crawler as detail_module
+from app.crawler.async_context_manager import AsyncBrowserContextManager
+from app.crawler.contact_crawler import ContactCrawler
+from app.crawler.detail_crawler import DetailCrawler
+from app.database.db_manager import DatabaseManager
+from config.crawler_config import CrawlerConfig
+
+FETCH_SECONDS = 0.2
+
+
+class FakeResult:
+    html = "<html>" + "x" * 200 + "</html>"
+
+
+class FakeCrawler:
+    """Crawl4AI stand-in: arun chờ FETCH_SECONDS, đếm số arun chạy cùng lúc"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.closed = False
+
+    async def arun(self, url, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(FETCH_SECONDS)
+            return FakeResult()
+        finally:
+            self.in_flight -= 1
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_crawler(monkeypatch):
+    crawler = FakeCrawler()
+
+    async def create(self, worker_key, user_agent, viewport=None):
+        return crawler
+
+    monkeypatch.setattr(AsyncBrowserContextManager, "_create_new_crawl4ai_crawler", create)
+    return crawler
+
+
+async def _fetch(manager, url):
+    async with manager.get_crawl4ai_crawler("c", "ua") as crawler:
+        return await crawler.arun(url=url)
+
+
+class TestCrawl4AIPool:
+    """get_crawl4ai_crawler: lock chỉ bao get/create, arun của các caller chạy chồng nhau"""
+
+    def test_fetches_overlap(self, fake_crawler):
+        async def main():
+            manager = AsyncBrowserContextManager()
+            start = time.perf_counter()
+            await asyncio.gather(*(_fetch(manager, f"https://x/{i}") for i in range(4)))
+            return manager, time.perf_counter() - start
+
+        manager, elapsed = asyncio.run(main())
+        assert fake_crawler.max_in_flight == 4
+        # Tuần tự sẽ mất 4 * FETCH_SECONDS
+        assert elapsed < 2 * FETCH_SECONDS
+        # Crawler dùng chung không bị close sau mỗi lần dùng, không còn user nào giữ
+        assert not fake_crawler.closed
+        assert not any(manager._crawler_users.values())
+
+    def test_detail_batch_fetches_overlap(self, fake_crawler, monkeypatch, tmp_path):
+        monkeypatch.setattr(detail_module.random, "uniform", lambda a, b: 0)
+        config = CrawlerConfig("default")
+        config.config_data.setdefault("processing", {})["detail_fetch_concurrency"] = 4
+        crawler = DetailCrawler(config, db_manager=DatabaseManager(str(tmp_path / "crawler.db")))
+        companies = [{"name": f"c{i}", "url": f"https://x/{i}"} for i in range(4)]
+
+        start = time.perf_counter()
+        result = asyncio.run(crawler.crawl_batch(companies))
+        elapsed = time.perf_counter() - start
+
+        assert result["successful"] == 4
+        assert fake_crawler.max_in_flight == 4
+        assert elapsed < 2 * FETCH_SECONDS
+
+    def test_contact_consumers_overlap(self, fake_crawler, monkeypatch, tmp_path):
+        monkeypatch.setattr(contact_module.random, "uniform", lambda a, b: 0)
+        config = CrawlerConfig("default")
+        config.config_data.setdefault("processing", {})["contact_fetch_concurrency"] = 4
+        crawler = ContactCrawler(config, db_manager=DatabaseManager(str(tmp_path / "crawler.db")))
+        companies = [{"company_name": f"c{i}", "website": f"https://x{i}.vn"} for i in range(4)]
+
+        start = time.perf_counter()
+        result = asyncio.run(crawler.crawl_batch_from_details(companies))
+        elapsed = time.perf_counter() - start
+
+        assert result["successful"] == 4
+        assert fake_crawler.max_in_flight == 4
+        assert elapsed < 2 * FETCH_SECONDS
+
+    def test_parallel_detail_batches_overlap(self, fake_crawler, monkeypatch, tmp_path):
+        """detail_parallel_batches: các crawl_batch chạy đồng thời trên cùng crawler cũng chồng nhau"""
+        monkeypatch.setattr(detail_module.random, "uniform", lambda a, b: 0)
+        config = CrawlerConfig("default")
+        config.config_data.setdefault("processing", {})["detail_fetch_concurrency"] = 1
+        crawler = DetailCrawler(config, db_manager=DatabaseManager(str(tmp_path / "crawler.db")))
+        batches = [[{"name": f"c{b}", "url": f"https://x/{b}"}] for b in range(3)]
+
+        async def main():
+            return await asyncio.gather(*(crawler.crawl_batch(batch) for batch in batches))
+
+        start = time.perf_counter()
+        results = asyncio.run(main())
+        elapsed = time.perf_counter() - start
+
+        assert [r["successful"] for r in results] == [1, 1, 1]
+        assert fake_crawler.max_in_flight == 3
+        assert elapsed < 2 * FETCH_SECONDS
+
+
+class FakeContext:
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeBrowserManager:
+    """crawl4ai BrowserManager stand-in: sessions + contexts cache theo config"""
+
+    def __init__(self):
+        self.sessions = {"s1": (FakeContext(), None, 0.0)}
+        self.contexts_by_config = {"cfg": FakeContext()}
+        self.killed = []
+
+    async def kill_session(self, session_id):
+        self.killed.append(session_id)
+        del self.sessions[session_id]
+
+
+class TestRecycleContexts:
+    """recycle_contexts: đóng sessions/contexts của crawler idle, giữ browser và request counts"""
+
+    @staticmethod
+    def _pooled(manager, crawler_id):
+        crawler = FakeCrawler()
+        crawler.crawler_strategy = type("Strategy", (), {})()
+        crawler.crawler_strategy.browser_manager = FakeBrowserManager()
+        key = f"{manager._worker_id}_{crawler_id}"
+        manager._worker_browser_pool[key] = crawler
+        return key, crawler
+
+    def test_releases_idle_crawler_pages(self):
+        manager = AsyncBrowserContextManager()
+        key, crawler = self._pooled(manager, "idle")
+        manager._request_counts[key] = 42
+        browser_manager = crawler.crawler_strategy.browser_manager
+        context = browser_manager.contexts_by_config["cfg"]
+
+        asyncio.run(manager.recycle_contexts())
+
+        assert browser_manager.killed == ["s1"]
+        assert context.closed
+        assert browser_manager.contexts_by_config == {}
+        # Browser giữ nguyên trong pool, bộ đếm restart không bị reset
+        assert manager._worker_browser_pool[key] is crawler
+        assert not crawler.closed
+        assert manager._request_counts[key] == 42
+
+    def test_skips_crawler_in_use(self):
+        manager = AsyncBrowserContextManager()
+        key, crawler = self._pooled(manager, "busy")
+        manager._crawler_users[key] = 1
+        browser_manager = crawler.crawler_strategy.browser_manager
+
+        asyncio.run(manager.recycle_contexts())
+
+        assert browser_manager.killed == []
+        assert not browser_manager.contexts_by_config["cfg"].closed
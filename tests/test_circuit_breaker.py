@@ -0,0 +1,110 @@
+import asyncio
+import pytest
+from app.utils.circuit_breaker import (
+    CircuitBreaker,
+    CircuitBreakerManager,
+    CircuitBreakerOpenError,
+    CircuitState,
+)
+
+
+def _fail():
+    raise ValueError("boom")
+
+
+def _trip(breaker: CircuitBreaker):
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(ValueError):
+            breaker.call_sync(_fail)
+
+
+class TestCircuitBreaker:
+    """Test cases for CircuitBreaker state transitions"""
+
+    def test_closed_passes_results_through(self):
+        breaker = CircuitBreaker(failure_threshold=2, name="t")
+        assert breaker.call_sync(lambda x: x + 1, 1) == 2
+        assert breaker.state == CircuitState.CLOSED
+
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=60, name="t")
+        _trip(breaker)
+        assert breaker.state == CircuitState.OPEN
+        assert breaker.get_state()["failure_count"] == 3
+        with pytest.raises(CircuitBreakerOpenError):
+            breaker.call_sync(lambda: "not called")
+
+    def test_open_error_is_fresh_per_call(self):
+        """Mỗi lần fail-fast raise 1 exception mới (không dùng chung traceback/context giữa callers)"""
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=60, name="t")
+        _trip(breaker)
+        errors = []
+        for _ in range(2):
+            try:
+                breaker.call_sync(lambda: None)
+            except CircuitBreakerOpenError as e:
+                errors.append(e)
+        assert len(errors) == 2
+        assert errors[0] is not errors[1]
+
+    def test_success_resets_failure_count(self):
+        breaker = CircuitBreaker(failure_threshold=3, name="t")
+        with pytest.raises(ValueError):
+            breaker.call_sync(_fail)
+        breaker.call_sync(lambda: None)
+        assert breaker.failure_count == 0
+        assert breaker.state == CircuitState.CLOSED
+
+    def test_half_open_closes_on_success(self):
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0, name="t")
+        _trip(breaker)
+        assert breaker.state == CircuitState.OPEN
+        # recovery_timeout=0: lần gọi kế tiếp đi qua HALF_OPEN, thành công -> CLOSED
+        assert breaker.call_sync(lambda: "ok") == "ok"
+        assert breaker.state == CircuitState.CLOSED
+
+    def test_unexpected_exception_not_counted(self):
+        breaker = CircuitBreaker(failure_threshold=1, expected_exception=KeyError, name="t")
+        with pytest.raises(ValueError):
+            breaker.call_sync(_fail)
+        assert breaker.state == CircuitState.CLOSED
+        assert breaker.failure_count == 0
+
+    def test_call_async(self):
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=60, name="t")
+
+        async def ok():
+            return 42
+
+        async def bad():
+            raise ValueError("boom")
+
+        assert asyncio.run(breaker.call_async(ok)) == 42
+        with pytest.raises(ValueError):
+            asyncio.run(breaker.call_async(bad))
+        with pytest.raises(CircuitBreakerOpenError):
+            asyncio.run(breaker.call_async(ok))
+
+
+class TestCircuitBreakerManager:
+    """Test cases for CircuitBreakerManager"""
+
+    def test_get_breaker_returns_same_instance(self):
+        manager = CircuitBreakerManager()
+        assert manager.get_breaker("a") is manager.get_breaker("a")
+
+    def test_get_all_states_is_sync_read_only_view(self):
+        manager = CircuitBreakerManager()
+        manager.get_breaker("a", failure_threshold=1)
+        states = manager.get_all_states()
+        assert states["a"]["state"] == "CLOSED"
+        with pytest.raises(TypeError):
+            states["b"] = {}
+
+    def test_reset_breaker(self):
+        manager = CircuitBreakerManager()
+        breaker = manager.get_breaker("a", failure_threshold=1, recovery_timeout=60)
+        _trip(breaker)
+        manager.reset_breaker("a")
+        assert breaker.state == CircuitState.CLOSED
+        assert manager.get_all_states()["a"]["failure_count"] == 0
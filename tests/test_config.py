@@ -3,22 +3,37 @@ from pathlib import Path
 from config.crawler_config import CrawlerConfig
 
 
+# Config chỉ đọc: dựng 1 lần cho cả module thay vì mỗi test
+@pytest.fixture(scope="module")
+def config_1900():
+    return CrawlerConfig("1900comvn")
+
+
+@pytest.fixture(scope="module")
+def config_default():
+    return CrawlerConfig("default")
+
+
+# Tests sửa config_data: instance riêng mỗi test (mỗi CrawlerConfig có bản copy config_data riêng)
+@pytest.fixture
+def mutable_default_config():
+    return CrawlerConfig("default")
+
+
 class TestCrawlerConfig:
     """Test cases for CrawlerConfig class"""
     
-    def test_load_default_config(self):
+    def test_load_default_config(self, config_default):
         """Test loading default configuration"""
-        config = CrawlerConfig("default")
-        assert config.config_name == "default"
-        assert "website" in config.config_data
-        assert "xpath" in config.config_data
+        assert config_default.config_name == "default"
+        assert "website" in config_default.config_data
+        assert "xpath" in config_default.config_data
     
-    def test_load_1900comvn_config(self):
+    def test_load_1900comvn_config(self, config_1900):
         """Test loading 1900comvn configuration"""
-        config = CrawlerConfig("1900comvn")
-        assert config.config_name == "1900comvn"
-        assert config.website_config["name"] == "1900.com.vn"
-        assert "1900.com.vn" in config.website_config["base_url"]
+        assert config_1900.config_name == "1900comvn"
+        assert config_1900.website_config["name"] == "1900.com.vn"
+        assert "1900.com.vn" in config_1900.website_config["base_url"]
     
     def test_fallback_to_default(self):
         """Test fallback to default when config doesn't exist"""
@@ -27,68 +42,59 @@ class TestCrawlerConfig:
         # Should fallback to default
         assert "website" in config.config_data
     
-    def test_website_config_property(self):
+    def test_website_config_property(self, config_1900):
         """Test website_config property"""
-        config = CrawlerConfig("1900comvn")
-        website_config = config.website_config
+        website_config = config_1900.website_config
         assert "name" in website_config
         assert "base_url" in website_config
     
-    def test_xpath_config_property(self):
+    def test_xpath_config_property(self, config_1900):
         """Test xpath_config property"""
-        config = CrawlerConfig("1900comvn")
-        xpath_config = config.xpath_config
+        xpath_config = config_1900.xpath_config
         assert "company_name" in xpath_config
         assert "company_address" in xpath_config
     
-    def test_crawl4ai_config_property(self):
+    def test_crawl4ai_config_property(self, config_1900):
         """Test crawl4ai_config property"""
-        config = CrawlerConfig("1900comvn")
-        crawl4ai_config = config.crawl4ai_config
+        crawl4ai_config = config_1900.crawl4ai_config
         assert "website_query" in crawl4ai_config
         assert "facebook_query" in crawl4ai_config
     
-    def test_processing_config_property(self):
+    def test_processing_config_property(self, config_1900):
         """Test processing_config property"""
-        config = CrawlerConfig("1900comvn")
-        processing_config = config.processing_config
+        processing_config = config_1900.processing_config
         assert "batch_size" in processing_config
         assert "max_concurrent_pages" in processing_config
     
-    def test_output_config_property(self):
+    def test_output_config_property(self, config_1900):
         """Test output_config property"""
-        config = CrawlerConfig("1900comvn")
-        output_config = config.output_config
+        output_config = config_1900.output_config
         assert "output_dir" in output_config
         assert "final_output" in output_config
     
-    def test_fieldnames_property(self):
+    def test_fieldnames_property(self, config_1900):
         """Test fieldnames property"""
-        config = CrawlerConfig("1900comvn")
-        fieldnames = config.fieldnames
+        fieldnames = config_1900.fieldnames
         assert isinstance(fieldnames, list)
         assert len(fieldnames) > 0
         assert "industry_name" in fieldnames
         assert "name" in fieldnames
     
-    def test_get_xpath(self):
+    def test_get_xpath(self, config_1900):
         """Test get_xpath method"""
-        config = CrawlerConfig("1900comvn")
-        xpath = config.get_xpath("company_name")
+        xpath = config_1900.get_xpath("company_name")
         assert isinstance(xpath, str)
         assert len(xpath) > 0
     
-    def test_get_xpath_with_formatting(self):
+    def test_get_xpath_with_formatting(self, config_1900):
         """Test get_xpath method with formatting"""
-        config = CrawlerConfig("1900comvn")
-        xpath = config.get_xpath("social_media_container", platform="facebook")
+        xpath = config_1900.get_xpath("social_media_container", platform="facebook")
         assert "facebook" in xpath
     
-    def test_get_crawl4ai_query(self):
+    def test_get_crawl4ai_query(self, config_1900):
         """Test get_crawl4ai_query method"""
-        config = CrawlerConfig("1900comvn")
-        website_query = config.get_crawl4ai_query("website")
-        facebook_query = config.get_crawl4ai_query("facebook")
+        website_query = config_1900.get_crawl4ai_query("website")
+        facebook_query = config_1900.get_crawl4ai_query("facebook")
         
         assert isinstance(website_query, str)
         assert isinstance(facebook_query, str)
@@ -103,17 +109,16 @@ class TestCrawlerConfig:
         assert "default" in configs
         assert "1900comvn" in configs
     
-    def test_validate_config_valid(self):
+    def test_validate_config_valid(self, config_1900):
         """Test validate_config with valid configuration"""
-        config = CrawlerConfig("1900comvn")
-        is_valid, errors = config.validate_config()
+        is_valid, errors = config_1900.validate_config()
         assert is_valid
         assert len(errors) == 0
     
-    def test_validate_config_invalid(self):
+    def test_validate_config_invalid(self, mutable_default_config):
         """Test validate_config with invalid configuration"""
         # Create a config with missing required fields
-        config = CrawlerConfig("default")
+        config = mutable_default_config
         # Temporarily remove required field to test validation
         original_fieldnames = config.config_data.get("fieldnames", [])
         config.config_data["fieldnames"] = []
@@ -129,9 +134,9 @@ class TestCrawlerConfig:
 class TestConfigValidation:
     """Test cases for configuration validation"""
     
-    def test_missing_required_sections(self):
+    def test_missing_required_sections(self, mutable_default_config):
         """Test validation with missing required sections"""
-        config = CrawlerConfig("default")
+        config = mutable_default_config
         # Remove a required section
         original_website = config.config_data.get("website", {})
         del config.config_data["website"]
@@ -143,9 +148,9 @@ class TestConfigValidation:
         # Restore
         config.config_data["website"] = original_website
     
-    def test_invalid_base_url(self):
+    def test_invalid_base_url(self, mutable_default_config):
         """Test validation with invalid base URL"""
-        config = CrawlerConfig("default")
+        config = mutable_default_config
         original_url = config.config_data["website"]["base_url"]
         config.config_data["website"]["base_url"] = "invalid-url"
         
@@ -156,9 +161,9 @@ class TestConfigValidation:
         # Restore
         config.config_data["website"]["base_url"] = original_url
     
-    def test_missing_required_xpaths(self):
+    def test_missing_required_xpaths(self, mutable_default_config):
         """Test validation with missing required xpaths"""
-        config = CrawlerConfig("default")
+        config = mutable_default_config
         original_xpath = config.config_data.get("xpath", {})
         if "company_name" in config.config_data["xpath"]:
             del config.config_data["xpath"]["company_name"]
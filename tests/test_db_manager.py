@@ -0,0 +1,54 @@
+import sqlite3
+import pytest
+from app.database.db_manager import DatabaseManager
+
+
+@pytest.fixture
+def db_manager(tmp_path):
+    return DatabaseManager(str(tmp_path / "crawler.db"))
+
+
+class TestInsertDedup:
+    """ON CONFLICT DO NOTHING: URL trùng trả về id của record đã có, không raise"""
+
+    def test_store_detail_html_duplicate_returns_existing_id(self, db_manager):
+        first = db_manager.store_detail_html("A", "https://x/a", "<html>1</html>", "IT")
+        second = db_manager.store_detail_html("A2", "https://x/a", "<html>2</html>", "IT")
+        assert first is not None
+        assert second == first
+        with db_manager.get_connection() as conn:
+            rows = conn.execute("SELECT company_name, html_content FROM detail_html_storage").fetchall()
+        assert rows == [("A", "<html>1</html>")]
+
+    def test_store_detail_html_distinct_urls(self, db_manager):
+        first = db_manager.store_detail_html("A", "https://x/a", "h")
+        second = db_manager.store_detail_html("B", "https://x/b", "h")
+        assert first != second
+
+    def test_store_contact_html_duplicate_returns_existing_id(self, db_manager):
+        first = db_manager.store_contact_html("A", "https://a.vn", "website", "<html>1</html>")
+        second = db_manager.store_contact_html("A", "https://a.vn", "website", "<html>2</html>")
+        assert second == first
+        with db_manager.get_connection() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM contact_html_storage").fetchone()[0] == 1
+
+    def test_duplicate_insert_leaves_no_open_transaction(self, db_manager):
+        db_manager.store_contact_html("A", "https://a.vn", "website", "h")
+        db_manager.store_contact_html("A", "https://a.vn", "website", "h")
+        assert not db_manager.get_connection().in_transaction
+
+
+class TestConnection:
+    """get_connection: 1 connection mỗi thread, row_factory đặt theo cursor"""
+
+    def test_connection_reused_per_thread(self, db_manager):
+        assert db_manager.get_connection() is db_manager.get_connection()
+
+    def test_row_factory_not_reset_on_connection(self, db_manager):
+        conn = db_manager.get_connection()
+        conn.row_factory = sqlite3.Row
+        db_manager.store_detail_html("A", "https://x/a", "h")
+        pending = db_manager.get_pending_detail_html()
+        assert pending[0]["company_url"] == "https://x/a"
+        # Caller's choice survives nested DatabaseManager calls
+        assert db_manager.get_connection().row_factory is sqlite3.Row
@@ -0,0 +1,173 @@
+import sqlite3
+import pytest
+import app.database.dedup as dedup
+from app.database.dedup import delete_duplicates
+from app.utils.dedup_cleanup import DatabaseCleanup
+from cleanup_duplicates import DuplicateCleanup
+
+
+ROWS = [
+    # (url, created_at)
+    ("u1", "2024-01-03"),
+    ("u1", "2024-01-01"),
+    ("u1", "2024-01-02"),
+    ("u2", "2024-01-01"),
+    ("u3", "2024-01-05"),
+    ("u3", "2024-01-05"),  # Cùng created_at: tie-break theo id
+    ("", "2024-01-01"),
+    ("", "2024-01-02"),
+    (None, "2024-01-01"),
+]
+
+
+@pytest.fixture(params=[True, False], ids=["window", "chunked"])
+def window_functions(request, monkeypatch):
+    """Chạy mỗi test trên cả ROW_NUMBER() và fallback theo chunk (chunk nhỏ để có nhiều lượt DELETE)"""
+    monkeypatch.setattr(dedup, "HAS_WINDOW_FUNCTIONS", request.param)
+    monkeypatch.setattr(dedup, "DELETE_IN_CHUNK_SIZE", 2)
+    return request.param
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT, created_at TEXT)")
+    conn.executemany("INSERT INTO t (url, created_at) VALUES (?, ?)", ROWS)
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+class TestDeleteDuplicates:
+    """delete_duplicates: giữ 1 record mỗi key, bỏ qua key NULL/rỗng, không commit"""
+
+    def test_keep_oldest(self, conn, window_functions):
+        deleted = delete_duplicates(conn.cursor(), "t", "url")
+        conn.commit()
+        assert deleted == 3
+        kept = conn.execute("SELECT id FROM t WHERE url != '' ORDER BY id").fetchall()
+        assert [r[0] for r in kept] == [2, 4, 5]
+
+    def test_keep_newest(self, conn, window_functions):
+        deleted = delete_duplicates(conn.cursor(), "t", "url", keep_oldest=False)
+        conn.commit()
+        assert deleted == 3
+        kept = conn.execute("SELECT id FROM t WHERE url != '' ORDER BY id").fetchall()
+        assert [r[0] for r in kept] == [1, 4, 6]
+
+    def test_empty_and_null_keys_untouched(self, conn, window_functions):
+        delete_duplicates(conn.cursor(), "t", "url")
+        conn.commit()
+        assert conn.execute("SELECT COUNT(*) FROM t WHERE url = ''").fetchone()[0] == 2
+        assert conn.execute("SELECT COUNT(*) FROM t WHERE url IS NULL").fetchone()[0] == 1
+
+    def test_runs_in_caller_transaction(self, conn, window_functions):
+        conn.execute("BEGIN IMMEDIATE")
+        delete_duplicates(conn.cursor(), "t", "url")
+        assert conn.in_transaction
+        conn.rollback()
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == len(ROWS)
+
+    def test_commit_every_commits_per_chunk(self, conn, window_functions):
+        """commit_every > 0: commit sau mỗi chunk, rollback sau đó không khôi phục rows đã xóa"""
+        statements = []
+        conn.set_trace_callback(statements.append)
+        conn.execute("BEGIN IMMEDIATE")
+        deleted = delete_duplicates(conn.cursor(), "t", "url", commit_every=1)
+        assert deleted == 3
+        # 3 ids, chunk 2 -> 2 DELETE, mỗi DELETE 1 commit
+        assert statements.count("COMMIT") == 2
+        assert not conn.in_transaction
+        conn.rollback()
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == len(ROWS) - 3
+
+
+class TestDuplicateCleanup:
+    """cleanup_duplicates.py end-to-end trên DB tạm (bảng không có UNIQUE như DB cũ trước migration)"""
+
+    @pytest.fixture
+    def cleanup(self, tmp_path):
+        cleanup = DuplicateCleanup(str(tmp_path / "crawler.db"))
+        with cleanup.db_manager.get_connection() as conn:
+            conn.execute("DROP TABLE contact_html_storage")
+            conn.execute("""
+                CREATE TABLE contact_html_storage (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, company_name TEXT, url TEXT,
+                    url_type TEXT, html_content TEXT, status TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            conn.executemany(
+                "INSERT INTO contact_html_storage (company_name, url, url_type, html_content, status, created_at)"
+                " VALUES ('c', ?, 'website', 'h', 'pending', ?)",
+                ROWS,
+            )
+        return cleanup
+
+    def test_run_cleanup(self, cleanup, window_functions):
+        result = cleanup.run_cleanup(vacuum=False)
+        assert result["status"] == "completed"
+        assert result["cleanup_result"]["records_deleted"] == 3
+        assert result["stats_after"]["duplicate_url_count"] == 0
+        assert not cleanup.has_duplicates()
+        conn = cleanup.db_manager.get_connection()
+        assert not conn.in_transaction
+        # Index tạm đã được drop
+        assert conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'idx_chs_url_created'").fetchone() is None
+
+    def test_run_cleanup_commit_per_chunk(self, cleanup, window_functions):
+        cleanup.delete_chunk_size = 1
+        result = cleanup.run_cleanup(vacuum=False)
+        assert result["cleanup_result"]["records_deleted"] == 3
+        assert not cleanup.has_duplicates()
+        assert not cleanup.db_manager.get_connection().in_transaction
+
+    def test_dry_run_changes_nothing(self, cleanup):
+        result = cleanup.run_cleanup(dry_run=True)
+        assert result["status"] == "dry_run"
+        with cleanup.db_manager.get_connection() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM contact_html_storage").fetchone()[0] == len(ROWS)
+
+
+class TestDetailDedup:
+    """dedup_cleanup.deduplicate_detail_html_storage: index tạm + 1 transaction"""
+
+    @pytest.fixture
+    def cleanup(self, tmp_path, monkeypatch):
+        # DatabaseCleanup dùng DB mặc định data/crawler.db (tương đối với cwd)
+        monkeypatch.chdir(tmp_path)
+        cleanup = DatabaseCleanup()
+        conn = cleanup._conn
+        conn.execute("DROP TABLE detail_html_storage")
+        conn.execute("""
+            CREATE TABLE detail_html_storage (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, company_name TEXT, company_url TEXT,
+                industry TEXT, html_content TEXT, status TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.executemany(
+            "INSERT INTO detail_html_storage (company_name, company_url, html_content, status, created_at)"
+            " VALUES ('c', ?, 'h', 'pending', ?)",
+            ROWS,
+        )
+        conn.commit()
+        yield cleanup
+        cleanup.close()
+
+    def test_dedup_drops_temporary_index(self, cleanup, window_functions):
+        result = cleanup.deduplicate_detail_html_storage()
+        assert result == {'duplicate_urls': 2, 'total_duplicates': 5, 'total_kept': 2, 'total_deleted': 3}
+        conn = cleanup._conn
+        assert not conn.in_transaction
+        assert conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'idx_detail_html_url_created'"
+        ).fetchone() is None
+        assert conn.execute("SELECT COUNT(*) FROM detail_html_storage").fetchone()[0] == len(ROWS) - 3
+
+    def test_existing_index_is_kept(self, cleanup):
+        cleanup._conn.execute("CREATE INDEX idx_detail_html_url_created ON detail_html_storage(company_url, created_at)")
+        cleanup.deduplicate_detail_html_storage()
+        assert cleanup._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'idx_detail_html_url_created'"
+        ).fetchone() is not None